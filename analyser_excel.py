@@ -8,152 +8,216 @@ Analyse toutes les feuilles, lignes et colonnes
 import pandas as pd
 import numpy as np
 from pathlib import Path
+import argparse
+import hashlib
 import json
 from datetime import datetime
 
-def analyser_fichier_excel(nom_fichier):
+# Cache des classeurs déjà analysés (empreinte SHA-256 -> rapports produits)
+FICHIER_CACHE = ".cache_analyse_excel.json"
+
+def empreinte_fichier(chemin):
+    """SHA-256 du contenu d'un classeur"""
+    h = hashlib.sha256()
+    with open(chemin, 'rb') as f:
+        for bloc in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloc)
+    return h.hexdigest()
+
+def valeur_json(valeur):
+    """Convertit une valeur pandas/NumPy en valeur JSON (NaN -> None)"""
+    if valeur is None or (isinstance(valeur, float) and np.isnan(valeur)):
+        return None
+    if isinstance(valeur, np.generic):
+        return valeur.item()
+    return valeur
+
+def profiler_feuille(df):
+    """
+    Profil de toutes les colonnes d'une feuille en un passage vectorisé :
+    types, nulls, valeurs uniques et statistiques numériques (df.describe)
+    """
+    non_nulles = df.notna().sum()
+    profil = pd.DataFrame({
+        'type': df.dtypes.astype(str),
+        'non_nulles': non_nulles,
+        'nulles': len(df) - non_nulles,
+        'uniques': df.nunique(dropna=True),
+    })
+
+    numeriques = df.select_dtypes(include='number')
+    if not numeriques.empty:
+        stats = numeriques.describe().T[['min', 'max', 'mean', '50%', 'std']]
+        stats.columns = ['min', 'max', 'moyenne', 'mediane', 'ecart_type']
+        profil = profil.join(stats)
+
+    return profil
+
+def exemples_uniques(serie, limite=10):
+    """Premières valeurs uniques non nulles d'une colonne"""
+    return [valeur_json(v) for v in serie.dropna().unique()[:limite]]
+
+def ligne_markdown(valeurs):
+    """Ligne de tableau Markdown"""
+    return "| " + " | ".join(str(v).replace("|", "\\|").replace("\n", " ") for v in valeurs) + " |\n"
+
+def analyser_fichier_excel(nom_fichier, dossier_sortie=None):
     """
-    Analyse complète d'un fichier Excel
-    
+    Analyse complète d'un fichier Excel ; le rapport est écrit au fil de l'analyse
+    (une ligne JSON et une section Markdown par feuille)
+
     Args:
         nom_fichier: Chemin vers le fichier Excel
+        dossier_sortie: Dossier des rapports (dossier courant par défaut)
     """
     print("=" * 80)
     print(f"ANALYSE DU FICHIER: {nom_fichier}")
     print("=" * 80)
     print(f"Date d'analyse: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-    
+
     # Ouvrir le fichier Excel
     try:
         xl_file = pd.ExcelFile(nom_fichier)
     except Exception as e:
         print(f"ERREUR: Impossible d'ouvrir le fichier: {e}")
         return None
-    
+
     # Informations générales
     print(f"Nombre de feuilles: {len(xl_file.sheet_names)}")
     print(f"Feuilles disponibles: {xl_file.sheet_names}\n")
-    
+
+    dossier_sortie = Path(dossier_sortie or '.')
+    dossier_sortie.mkdir(parents=True, exist_ok=True)
+    nom_jsonl = dossier_sortie / (Path(nom_fichier).stem + "_analyse.jsonl")
+    nom_markdown = dossier_sortie / (Path(nom_fichier).stem + "_analyse.md")
+
     resultats = {}
-    
-    # Analyser chaque feuille
-    for sheet_name in xl_file.sheet_names:
-        print("\n" + "=" * 80)
-        print(f"FEUILLE: {sheet_name}")
-        print("=" * 80)
-        
-        # Lire la feuille
-        df = pd.read_excel(xl_file, sheet_name=sheet_name)
-        
-        # Informations de base
-        nb_lignes, nb_colonnes = df.shape
-        print(f"\nDimensions: {nb_lignes} lignes × {nb_colonnes} colonnes")
-        print(f"Nombre total de cellules: {nb_lignes * nb_colonnes}")
-        
-        # Analyse des colonnes
-        print(f"\n--- ANALYSE DES COLONNES ---")
-        print(f"Nombre de colonnes: {nb_colonnes}")
-        print(f"\nNoms des colonnes:")
-        for i, col in enumerate(df.columns, 1):
-            print(f"  {i:3d}. {col}")
-        
-        # Analyse des lignes
-        print(f"\n--- ANALYSE DES LIGNES ---")
-        print(f"Nombre de lignes: {nb_lignes}")
-        
-        # Statistiques par colonne
-        print(f"\n--- STATISTIQUES PAR COLONNE ---")
-        for col in df.columns:
-            print(f"\nColonne: {col}")
-            print(f"  Type de données: {df[col].dtype}")
-            print(f"  Valeurs non nulles: {df[col].notna().sum()} / {nb_lignes}")
-            print(f"  Valeurs nulles: {df[col].isna().sum()} / {nb_lignes}")
-            
-            # Valeurs uniques (limitées pour éviter trop de sortie)
-            valeurs_uniques = df[col].dropna().unique()
-            nb_uniques = len(valeurs_uniques)
-            print(f"  Valeurs uniques: {nb_uniques}")
-            
-            if nb_uniques <= 10 and nb_uniques > 0:
-                print(f"  Liste des valeurs uniques: {list(valeurs_uniques)}")
-            elif nb_uniques > 10:
-                print(f"  Premières valeurs uniques: {list(valeurs_uniques[:10])}...")
-            
-            # Statistiques numériques si applicable
-            if pd.api.types.is_numeric_dtype(df[col]):
-                print(f"  Min: {df[col].min()}")
-                print(f"  Max: {df[col].max()}")
-                print(f"  Moyenne: {df[col].mean():.2f}")
-                print(f"  Médiane: {df[col].median():.2f}")
-                print(f"  Écart-type: {df[col].std():.2f}")
-        
-        # Analyse des valeurs nulles
-        print(f"\n--- ANALYSE DES VALEURS NULLES ---")
-        valeurs_nulles_par_col = df.isnull().sum()
-        print("Nombre de valeurs nulles par colonne:")
-        for col, count in valeurs_nulles_par_col.items():
-            if count > 0:
-                print(f"  {col}: {count} ({count/nb_lignes*100:.1f}%)")
-        
-        # Analyse des doublons
-        print(f"\n--- ANALYSE DES DOUBLONS ---")
-        lignes_dupliquees = df.duplicated().sum()
-        print(f"Lignes complètement dupliquées: {lignes_dupliquees}")
-        
-        # Afficher toutes les données
-        print(f"\n--- CONTENU COMPLET DE LA FEUILLE ---")
-        print(f"\nToutes les {nb_lignes} lignes:")
-        print(df.to_string())
-        
-        # Stocker les résultats
-        resultats[sheet_name] = {
-            'dimensions': {'lignes': nb_lignes, 'colonnes': nb_colonnes},
-            'colonnes': list(df.columns),
-            'types_donnees': {col: str(df[col].dtype) for col in df.columns},
-            'valeurs_nulles': valeurs_nulles_par_col.to_dict(),
-            'statistiques': {}
-        }
-        
-        # Statistiques numériques détaillées
-        for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                resultats[sheet_name]['statistiques'][col] = {
-                    'min': float(df[col].min()) if not pd.isna(df[col].min()) else None,
-                    'max': float(df[col].max()) if not pd.isna(df[col].max()) else None,
-                    'moyenne': float(df[col].mean()) if not pd.isna(df[col].mean()) else None,
-                    'mediane': float(df[col].median()) if not pd.isna(df[col].median()) else None,
-                    'ecart_type': float(df[col].std()) if not pd.isna(df[col].std()) else None
-                }
-    
-    # Résumé final
-    print("\n" + "=" * 80)
-    print("RÉSUMÉ FINAL")
-    print("=" * 80)
-    print(f"\nFichier analysé: {nom_fichier}")
-    print(f"Nombre total de feuilles: {len(xl_file.sheet_names)}")
-    for sheet_name, stats in resultats.items():
-        print(f"\nFeuille '{sheet_name}':")
-        print(f"  - {stats['dimensions']['lignes']} lignes × {stats['dimensions']['colonnes']} colonnes")
-        print(f"  - {len(stats['colonnes'])} colonnes")
-    
-    # Sauvegarder les résultats en JSON
-    nom_resultat = Path(nom_fichier).stem + "_analyse.json"
-    with open(nom_resultat, 'w', encoding='utf-8') as f:
-        json.dump(resultats, f, ensure_ascii=False, indent=2, default=str)
-    print(f"\nRésultats sauvegardés dans: {nom_resultat}")
-    
+
+    with xl_file, open(nom_jsonl, 'w', encoding='utf-8') as f_jsonl, \
+         open(nom_markdown, 'w', encoding='utf-8') as f_md:
+        f_md.write(f"# Analyse de {Path(nom_fichier).name}\n\n")
+        f_md.write(f"Date d'analyse : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+
+        # Analyser chaque feuille
+        for sheet_name in xl_file.sheet_names:
+            print(f"FEUILLE: {sheet_name}")
+
+            # Lire la feuille
+            df = pd.read_excel(xl_file, sheet_name=sheet_name)
+
+            # Informations de base
+            nb_lignes, nb_colonnes = df.shape
+            profil = profiler_feuille(df)
+            lignes_dupliquees = int(df.duplicated().sum())
+
+            print(f"  Dimensions: {nb_lignes} lignes × {nb_colonnes} colonnes, "
+                  f"{int(profil['nulles'].sum())} valeurs nulles, {lignes_dupliquees} ligne(s) dupliquée(s)")
+
+            colonnes = []
+            for col, stats in profil.iterrows():
+                colonne = {'colonne': str(col)}
+                colonne.update({cle: valeur_json(v) for cle, v in stats.items()})
+                colonne['exemples_uniques'] = exemples_uniques(df[col])
+                colonnes.append(colonne)
+
+            # Une ligne JSON par feuille, écrite immédiatement
+            enregistrement = {
+                'fichier': str(nom_fichier),
+                'feuille': sheet_name,
+                'dimensions': {'lignes': nb_lignes, 'colonnes': nb_colonnes},
+                'lignes_dupliquees': lignes_dupliquees,
+                'colonnes': colonnes,
+            }
+            f_jsonl.write(json.dumps(enregistrement, ensure_ascii=False, default=str) + "\n")
+            f_jsonl.flush()
+
+            # Section Markdown de la feuille
+            f_md.write(f"\n## {sheet_name}\n\n")
+            f_md.write(f"- Dimensions : {nb_lignes} lignes × {nb_colonnes} colonnes\n")
+            f_md.write(f"- Lignes complètement dupliquées : {lignes_dupliquees}\n\n")
+            f_md.write(ligne_markdown(['Colonne', 'Type', 'Non nulles', 'Nulles', 'Uniques',
+                                       'Min', 'Max', 'Moyenne', 'Médiane', 'Écart-type']))
+            f_md.write(ligne_markdown(['---'] * 10))
+            for colonne in colonnes:
+                f_md.write(ligne_markdown(
+                    [colonne['colonne'], colonne['type'], colonne['non_nulles'], colonne['nulles'], colonne['uniques']]
+                    + ['' if colonne.get(cle) is None else f"{colonne[cle]:.2f}"
+                       for cle in ('min', 'max', 'moyenne', 'mediane', 'ecart_type')]))
+            f_md.flush()
+
+            # Stocker les résultats
+            resultats[sheet_name] = {
+                'dimensions': {'lignes': nb_lignes, 'colonnes': nb_colonnes},
+                'colonnes': list(df.columns),
+                'types_donnees': profil['type'].to_dict(),
+                'valeurs_nulles': profil['nulles'].to_dict(),
+                'statistiques': {c['colonne']: {cle: c.get(cle) for cle in ('min', 'max', 'moyenne', 'mediane', 'ecart_type')}
+                                 for c in colonnes if c.get('moyenne') is not None}
+            }
+
+    print(f"\nRapports écrits: {nom_jsonl}, {nom_markdown}")
+
     return resultats
 
+def charger_cache(dossier_sortie):
+    """Charge le cache des analyses (empreinte -> rapports)"""
+    chemin = Path(dossier_sortie) / FICHIER_CACHE
+    if chemin.exists():
+        with open(chemin, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def sauver_cache(dossier_sortie, cache):
+    """Enregistre le cache des analyses"""
+    with open(Path(dossier_sortie) / FICHIER_CACHE, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+def analyser_repertoire(chemin, dossier_sortie=None, forcer=False):
+    """Analyse un classeur ou tous les classeurs d'un répertoire, en sautant ceux déjà analysés"""
+    chemin = Path(chemin)
+    dossier_sortie = Path(dossier_sortie or '.')
+    dossier_sortie.mkdir(parents=True, exist_ok=True)
+    if chemin.is_dir():
+        classeurs = sorted(p for p in chemin.glob('*.xlsx') if not p.name.startswith('~$'))
+    else:
+        classeurs = [chemin]
+
+    cache = charger_cache(dossier_sortie)
+    analyses, ignores = 0, 0
+    for classeur in classeurs:
+        empreinte = empreinte_fichier(classeur)
+        deja_fait = cache.get(empreinte)
+        if not forcer and deja_fait and all((dossier_sortie / r).exists() for r in deja_fait['rapports']):
+            print(f"= {classeur.name}: déjà analysé le {deja_fait['date']} ({', '.join(deja_fait['rapports'])})")
+            ignores += 1
+            continue
+
+        if analyser_fichier_excel(classeur, dossier_sortie) is None:
+            continue
+        cache[empreinte] = {
+            'fichier': classeur.name,
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'rapports': [classeur.stem + "_analyse.jsonl", classeur.stem + "_analyse.md"],
+        }
+        sauver_cache(dossier_sortie, cache)
+        analyses += 1
+
+    return analyses, ignores
+
 if __name__ == "__main__":
-    fichier = "Bases de datos internos.xlsx"
-    
-    if not Path(fichier).exists():
-        print(f"ERREUR: Le fichier '{fichier}' n'existe pas!")
+    parser = argparse.ArgumentParser(description="Profil des feuilles de classeurs Excel")
+    parser.add_argument('chemin', nargs='?', default="Bases de datos internos.xlsx",
+                        help="Classeur .xlsx ou répertoire de classeurs")
+    parser.add_argument('-o', '--sortie', default='.', help="Dossier des rapports")
+    parser.add_argument('--forcer', action='store_true', help="Ré-analyser même les classeurs inchangés")
+    args = parser.parse_args()
+
+    if not Path(args.chemin).exists():
+        print(f"ERREUR: Le fichier '{args.chemin}' n'existe pas!")
         exit(1)
-    
-    resultats = analyser_fichier_excel(fichier)
-    
+
+    analyses, ignores = analyser_repertoire(args.chemin, args.sortie, args.forcer)
+
     print("\n" + "=" * 80)
-    print("ANALYSE TERMINÉE")
+    print(f"ANALYSE TERMINÉE ({analyses} classeur(s) analysé(s), {ignores} inchangé(s))")
     print("=" * 80)
-
@@ -5,22 +5,132 @@ Script d'analyse détaillée d'un fichier Excel
 Analyse lignes 1-54 et colonnes A-BA avec références Excel exactes
 """
 
-import pandas as pd
+import numpy as np
 import openpyxl
 from openpyxl.utils import get_column_letter, column_index_from_string
 from pathlib import Path
 import json
+import sqlite3
 from datetime import datetime
 
+# Zone analysée : lignes 1-54, colonnes A-BA
+NB_LIGNES = 54
+NB_COLONNES = 53
+LETTRES_COLONNES = [get_column_letter(num) for num in range(1, NB_COLONNES + 1)]
+
+# Grilles déjà chargées : (fichier, feuille) -> tableau NumPy (objets) de la zone A1:BA54
+_grilles = {}
+
 def convertir_colonne_excel(num):
     """Convertit un numéro de colonne en lettre Excel (1->A, 27->AA, 53->BA)"""
-    return get_column_letter(num)
+    return LETTRES_COLONNES[num - 1] if 1 <= num <= NB_COLONNES else get_column_letter(num)
+
+def charger_grille(ws):
+    """Charge la zone A1:BA54 d'une feuille en une passe dans une grille NumPy"""
+    grille = np.empty((NB_LIGNES, NB_COLONNES), dtype=object)
+    for i, ligne in enumerate(ws.iter_rows(min_row=1, max_row=NB_LIGNES, max_col=NB_COLONNES, values_only=True)):
+        grille[i, :len(ligne)] = ligne
+    return grille
+
+def charger_grilles(nom_fichier):
+    """Charge toutes les feuilles d'un classeur (une seule ouverture) et les garde en cache"""
+    wb = openpyxl.load_workbook(nom_fichier, read_only=True, data_only=True)
+    try:
+        for sheet_name in wb.sheetnames:
+            _grilles[(str(nom_fichier), sheet_name)] = charger_grille(wb[sheet_name])
+        return wb.sheetnames
+    finally:
+        wb.close()
+
+def grille_feuille(nom_fichier, sheet_name):
+    """Retourne la grille d'une feuille, en chargeant le classeur au premier accès"""
+    if (str(nom_fichier), sheet_name) not in _grilles:
+        charger_grilles(nom_fichier)
+    return _grilles[(str(nom_fichier), sheet_name)]
+
+def valeur_grille(grille, ligne, colonne_lettre):
+    """Accès O(1) à une cellule de la grille par référence Excel"""
+    return grille[ligne - 1, column_index_from_string(colonne_lettre) - 1]
 
 def analyser_cellule_excel(nom_fichier, sheet_name, ligne, colonne_lettre):
     """Lit une cellule spécifique avec référence Excel"""
-    wb = openpyxl.load_workbook(nom_fichier, data_only=True)
-    ws = wb[sheet_name]
-    return ws[f"{colonne_lettre}{ligne}"].value
+    return valeur_grille(grille_feuille(nom_fichier, sheet_name), ligne, colonne_lettre)
+
+def est_numerique(valeur):
+    """Vrai pour les valeurs prises en compte dans les statistiques numériques"""
+    return isinstance(valeur, (int, float))
+
+est_non_vide_grille = np.frompyfunc(lambda v: v is not None, 1, 1)
+est_numerique_grille = np.frompyfunc(est_numerique, 1, 1)
+
+# Stockage compact des résultats : une ligne par cellule non vide, rangée par feuille/colonne/ligne.
+# Une valeur numérique n'est stockée qu'une fois (valeur_num) ; pas d'index sur les valeurs : à cette
+# taille, la recherche d'une valeur par interroger_analyse.py parcourt la table plus vite qu'on ne la lit
+SCHEMA_ANALYSE = """
+CREATE TABLE cellules (
+    feuille TEXT NOT NULL,
+    ligne INTEGER NOT NULL,
+    colonne TEXT NOT NULL,
+    type TEXT NOT NULL,
+    valeur_texte TEXT,
+    valeur_num NUMERIC,
+    PRIMARY KEY (feuille, colonne, ligne)
+) WITHOUT ROWID;
+CREATE TABLE colonnes (
+    feuille TEXT NOT NULL,
+    colonne TEXT NOT NULL,
+    cellules_non_vides INTEGER,
+    pourcentage_rempli REAL,
+    types_donnees TEXT,
+    min REAL,
+    max REAL,
+    moyenne REAL,
+    PRIMARY KEY (feuille, colonne)
+);
+CREATE TABLE feuilles (
+    feuille TEXT PRIMARY KEY,
+    cellules_non_vides INTEGER,
+    pourcentage_rempli REAL,
+    sections TEXT
+);
+"""
+
+def valeurs_stockees(valeur):
+    """(valeur_texte, valeur_num) d'une cellule : les nombres (int, float) ne sont pas dupliqués en texte"""
+    if type(valeur) in (int, float):
+        return None, valeur
+    return str(valeur), float(valeur) if est_numerique(valeur) else None
+
+def sauver_analyse_sqlite(nom_resultat, nom_fichier, resultats):
+    """Écrit les résultats (cellules, colonnes, feuilles) dans une base SQLite compacte"""
+    Path(nom_resultat).unlink(missing_ok=True)
+    conn = sqlite3.connect(nom_resultat)
+    try:
+        conn.executescript(SCHEMA_ANALYSE)
+        for sheet_name, stats in resultats.items():
+            grille = grille_feuille(nom_fichier, sheet_name)
+            lignes, colonnes = np.nonzero(est_non_vide_grille(grille).astype(bool))
+            conn.executemany(
+                "INSERT INTO cellules VALUES (?, ?, ?, ?, ?, ?)",
+                ((sheet_name, int(i) + 1, LETTRES_COLONNES[j], type(grille[i, j]).__name__)
+                 + valeurs_stockees(grille[i, j])
+                 for i, j in zip(lignes, colonnes)))
+            conn.executemany(
+                "INSERT INTO colonnes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((sheet_name, col_lettre, c['cellules_non_vides'], c['pourcentage_rempli'],
+                  json.dumps(c['types_donnees']),
+                  c.get('statistiques', {}).get('min'), c.get('statistiques', {}).get('max'),
+                  c.get('statistiques', {}).get('moyenne'))
+                 for col_lettre, c in stats.get('colonnes', {}).items()))
+            sg = stats['statistiques_globales']
+            conn.execute("INSERT INTO feuilles VALUES (?, ?, ?, ?)",
+                         (sheet_name, sg['total_cellules_non_vides'], sg['pourcentage_rempli'],
+                          json.dumps(stats['sections'], ensure_ascii=False, default=str)))
+        conn.commit()
+        # Réécrit les pages à moitié remplies par les insertions hors de l'ordre de la clé primaire
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
 
 def analyser_fichier_excel_detaille(nom_fichier):
     """
@@ -32,54 +142,51 @@ def analyser_fichier_excel_detaille(nom_fichier):
     print("=" * 100)
     print(f"Date d'analyse: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     
-    # Ouvrir avec openpyxl pour accès direct aux cellules
+    # Ouvrir le classeur une seule fois : chaque feuille est chargée dans une grille A1:BA54
     try:
-        wb = openpyxl.load_workbook(nom_fichier, data_only=True)
+        sheetnames = charger_grilles(nom_fichier)
     except Exception as e:
         print(f"ERREUR: Impossible d'ouvrir le fichier: {e}")
         return None
     
-    # Ouvrir avec pandas pour analyse de données
-    xl_file = pd.ExcelFile(nom_fichier)
-    
-    print(f"Nombre de feuilles: {len(wb.sheetnames)}")
-    print(f"Feuilles disponibles: {wb.sheetnames}\n")
+    print(f"Nombre de feuilles: {len(sheetnames)}")
+    print(f"Feuilles disponibles: {sheetnames}\n")
     
     resultats = {}
     
     # Analyser chaque feuille
-    for sheet_name in wb.sheetnames:
+    for sheet_name in sheetnames:
         print("\n" + "=" * 100)
         print(f"FEUILLE: {sheet_name}")
         print("=" * 100)
         
-        ws = wb[sheet_name]
-        df = pd.read_excel(xl_file, sheet_name=sheet_name, header=None)
+        grille = grille_feuille(nom_fichier, sheet_name)
+        resultats[sheet_name] = {}
+        non_vides = est_non_vide_grille(grille).astype(bool)
+        numeriques = est_numerique_grille(grille).astype(bool)
+        lignes_occupees, colonnes_occupees = np.nonzero(non_vides)
         
         # Dimensions Excel réelles
         print(f"\nDimensions Excel: Lignes 1-54, Colonnes A-BA (53 colonnes)")
-        print(f"Dimensions pandas: {df.shape[0]} lignes × {df.shape[1]} colonnes")
+        if len(lignes_occupees):
+            print(f"Zone occupée: {lignes_occupees.max() + 1} lignes × {colonnes_occupees.max() + 1} colonnes")
+        else:
+            print("Zone occupée: feuille vide")
         
         # Analyser chaque ligne avec référence Excel
         print(f"\n{'='*100}")
         print("ANALYSE LIGNE PAR LIGNE (Références Excel)")
         print(f"{'='*100}\n")
         
-        # Analyser les lignes 1-54
-        for ligne_excel in range(1, 55):  # Lignes 1 à 54
-            ligne_pandas = ligne_excel - 1  # pandas indexe à partir de 0
+        # Analyser les lignes 1-54 (seules les lignes non vides de la grille sont parcourues)
+        for ligne_pandas in np.flatnonzero(non_vides.any(axis=1)):
+            ligne_pandas = int(ligne_pandas)
+            ligne_excel = ligne_pandas + 1
             
             # Collecter les données non nulles de cette ligne
-            donnees_ligne = {}
-            cellules_non_vides = []
-            
-            for col_num in range(1, 54):  # Colonnes A (1) à BA (53)
-                col_lettre = convertir_colonne_excel(col_num)
-                valeur = ws[f"{col_lettre}{ligne_excel}"].value
-                
-                if valeur is not None:
-                    donnees_ligne[col_lettre] = valeur
-                    cellules_non_vides.append(f"{col_lettre}{ligne_excel}: {valeur}")
+            indices = np.flatnonzero(non_vides[ligne_pandas])
+            donnees_ligne = {LETTRES_COLONNES[j]: grille[ligne_pandas, j] for j in indices}
+            cellules_non_vides = [f"{col_lettre}{ligne_excel}: {valeur}" for col_lettre, valeur in donnees_ligne.items()]
             
             # Afficher seulement les lignes avec des données
             if cellules_non_vides:
@@ -107,16 +214,14 @@ def analyser_fichier_excel_detaille(nom_fichier):
         print("ANALYSE COLONNE PAR COLONNE (Références Excel)")
         print(f"{'='*100}\n")
         
-        for col_num in range(1, 54):  # Colonnes A à BA
-            col_lettre = convertir_colonne_excel(col_num)
-            col_pandas = col_num - 1  # pandas indexe à partir de 0
+        remplissage_colonnes = non_vides.sum(axis=0)
+        for col_pandas in np.flatnonzero(remplissage_colonnes):
+            col_pandas = int(col_pandas)
+            col_lettre = LETTRES_COLONNES[col_pandas]
             
             # Analyser la colonne
-            valeurs_colonne = []
-            for ligne_excel in range(1, 55):
-                valeur = ws[f"{col_lettre}{ligne_excel}"].value
-                if valeur is not None:
-                    valeurs_colonne.append((ligne_excel, valeur))
+            indices = np.flatnonzero(non_vides[:, col_pandas])
+            valeurs_colonne = [(int(i) + 1, grille[i, col_pandas]) for i in indices]
             
             if valeurs_colonne:
                 print(f"\n--- COLONNE {col_lettre} (Excel) / Colonne {col_pandas} (pandas) ---")
@@ -138,12 +243,12 @@ def analyser_fichier_excel_detaille(nom_fichier):
                 print(f"Types de données: {types_valeurs}")
                 
                 # Statistiques si numérique
-                valeurs_numeriques = [v for _, v in valeurs_colonne if isinstance(v, (int, float))]
-                if valeurs_numeriques:
+                valeurs_numeriques = grille[numeriques[:, col_pandas], col_pandas].astype(float)
+                if valeurs_numeriques.size:
                     print(f"Statistiques numériques:")
-                    print(f"  Min: {min(valeurs_numeriques)}")
-                    print(f"  Max: {max(valeurs_numeriques)}")
-                    print(f"  Moyenne: {sum(valeurs_numeriques)/len(valeurs_numeriques):.2f}")
+                    print(f"  Min: {valeurs_numeriques.min()}")
+                    print(f"  Max: {valeurs_numeriques.max()}")
+                    print(f"  Moyenne: {valeurs_numeriques.mean():.2f}")
                 
                 # Stocker dans les résultats
                 if 'colonnes' not in resultats[sheet_name]:
@@ -154,12 +259,12 @@ def analyser_fichier_excel_detaille(nom_fichier):
                     'types_donnees': types_valeurs,
                     'valeurs': [(ligne, str(v)) for ligne, v in valeurs_colonne[:50]]  # Limiter à 50
                 }
-                if valeurs_numeriques:
+                if valeurs_numeriques.size:
                     resultats[sheet_name]['colonnes'][col_lettre]['statistiques'] = {
-                        'min': min(valeurs_numeriques),
-                        'max': max(valeurs_numeriques),
-                        'moyenne': sum(valeurs_numeriques)/len(valeurs_numeriques),
-                        'count': len(valeurs_numeriques)
+                        'min': float(valeurs_numeriques.min()),
+                        'max': float(valeurs_numeriques.max()),
+                        'moyenne': float(valeurs_numeriques.mean()),
+                        'count': int(valeurs_numeriques.size)
                     }
         
         # Analyse structurelle: identifier les sections
@@ -169,12 +274,12 @@ def analyser_fichier_excel_detaille(nom_fichier):
         
         # Chercher les en-têtes et sections
         sections = {}
-        for ligne_excel in range(1, 55):
+        for ligne_excel in range(1, NB_LIGNES + 1):
             # Chercher les cellules avec du texte qui pourrait être un en-tête
             en_tetes_ligne = []
-            for col_num in range(1, 54):
-                col_lettre = convertir_colonne_excel(col_num)
-                valeur = ws[f"{col_lettre}{ligne_excel}"].value
+            for col_pandas in np.flatnonzero(non_vides[ligne_excel - 1]):
+                col_lettre = LETTRES_COLONNES[col_pandas]
+                valeur = grille[ligne_excel - 1, col_pandas]
                 if isinstance(valeur, str) and valeur.strip():
                     # Vérifier si c'est un en-tête potentiel (texte en majuscules ou mots-clés)
                     if any(mot in valeur.lower() for mot in ['total', 'prix', 'nbr', 'date', 'jour', 'ref', 'client', 'pax', 'adulte', 'enfant']):
@@ -194,17 +299,9 @@ def analyser_fichier_excel_detaille(nom_fichier):
         print(f"{'='*100}\n")
         
         matrice = {}
-        total_cellules_non_vides = 0
-        for ligne_excel in range(1, 55):
-            ligne_data = {}
-            for col_num in range(1, 54):
-                col_lettre = convertir_colonne_excel(col_num)
-                valeur = ws[f"{col_lettre}{ligne_excel}"].value
-                if valeur is not None:
-                    ligne_data[col_lettre] = valeur
-                    total_cellules_non_vides += 1
-            if ligne_data:
-                matrice[ligne_excel] = ligne_data
+        for i, j in zip(lignes_occupees, colonnes_occupees):
+            matrice.setdefault(int(i) + 1, {})[LETTRES_COLONNES[j]] = grille[i, j]
+        total_cellules_non_vides = int(non_vides.sum())
         
         print(f"Total de cellules non vides dans la feuille: {total_cellules_non_vides}")
         print(f"Total de cellules possibles: {54 * 53} = {54 * 53}")
@@ -222,7 +319,7 @@ def analyser_fichier_excel_detaille(nom_fichier):
     print("RÉSUMÉ FINAL")
     print("=" * 100)
     print(f"\nFichier analysé: {nom_fichier}")
-    print(f"Nombre total de feuilles: {len(wb.sheetnames)}")
+    print(f"Nombre total de feuilles: {len(sheetnames)}")
     for sheet_name, stats in resultats.items():
         print(f"\nFeuille '{sheet_name}':")
         if 'statistiques_globales' in stats:
@@ -234,13 +331,11 @@ def analyser_fichier_excel_detaille(nom_fichier):
         if 'colonnes' in stats:
             print(f"  - Colonnes avec données: {len(stats['colonnes'])}")
     
-    # Sauvegarder les résultats en JSON
-    nom_resultat = Path(nom_fichier).stem + "_analyse_detaille.json"
-    with open(nom_resultat, 'w', encoding='utf-8') as f:
-        json.dump(resultats, f, ensure_ascii=False, indent=2, default=str)
+    # Sauvegarder les résultats dans une base SQLite (interrogeable via interroger_analyse.py)
+    nom_resultat = Path(nom_fichier).stem + "_analyse_detaille.sqlite"
+    sauver_analyse_sqlite(nom_resultat, nom_fichier, resultats)
     print(f"\nRésultats détaillés sauvegardés dans: {nom_resultat}")
     
-    wb.close()
     return resultats
 
 if __name__ == "__main__":
@@ -4,14 +4,23 @@
 Application Flask pour la gestion des devis de voyage à Madagascar
 """
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, make_response
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from decimal import Decimal
 import os
+import json
+import time
+import heapq
+import hmac
+from bisect import bisect_right
 from functools import wraps
 from dotenv import load_dotenv
 
+from montants import ariary, decimal, montant, somme_ariary, appliquer_marge, centimes_euro, en_centimes, euros
+from versions import difference, est_vide, taille, reconstruire, est_point_de_reprise
+
 # Charger les variables d'environnement depuis .env
 load_dotenv()
 
@@ -63,6 +72,348 @@ def db_query(query, params=None, fetch_one=False, fetch_all=False):
         cur.close()
         conn.close()
 
+# Taux de change Ariary/Euro
+TAUX_CHANGE_DEFAUT = 4420
+DUREE_CACHE_TAUX_CHANGE = 300  # secondes avant rechargement de l'historique
+# Seuls les brouillons sont re-convertis : les devis envoyés, acceptés ou refusés sont figés (devis_figes)
+STATUTS_OUVERTS = ('brouillon',)
+
+# Cache mémoire de l'historique des taux (dates triées et taux correspondants)
+_cache_taux_change = {'dates': [], 'taux': [], 'charge_le': None}
+
+def charger_taux_change(forcer=False):
+    """Charge l'historique des taux de change en mémoire (une requête par expiration du cache)"""
+    maintenant = time.monotonic()
+    charge_le = _cache_taux_change['charge_le']
+    if not forcer and charge_le is not None and maintenant - charge_le < DUREE_CACHE_TAUX_CHANGE:
+        return _cache_taux_change
+
+    historique = db_query("""
+        SELECT date_effet, taux FROM taux_change_historique ORDER BY date_effet
+    """, fetch_all=True)
+
+    # En cas d'erreur on garde l'ancien historique
+    if historique is not None:
+        _cache_taux_change['dates'] = [h['date_effet'] for h in historique]
+        _cache_taux_change['taux'] = [float(h['taux']) for h in historique]
+    _cache_taux_change['charge_le'] = maintenant
+    return _cache_taux_change
+
+def taux_change_a_date(jour=None):
+    """Retourne le taux de change en vigueur à une date (aujourd'hui par défaut)"""
+    cache = charger_taux_change()
+    index = bisect_right(cache['dates'], jour or date.today())
+    return cache['taux'][index - 1] if index else TAUX_CHANGE_DEFAUT
+
+def reconvertir_devis_ouverts(taux_change):
+    """Applique un taux de change à tous les devis brouillons en une seule transaction"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE devis
+            SET taux_change = %s, total_euro = ROUND(COALESCE(total_ariary, 0) / %s, 2),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE COALESCE(statut, 'brouillon') IN %s AND taux_change IS DISTINCT FROM %s
+              AND supprime_le IS NULL
+            RETURNING id
+        """, (taux_change, taux_change, STATUTS_OUVERTS, taux_change))
+        devis_ids = [row[0] for row in cur.fetchall()]
+
+        cur.execute("""
+            UPDATE couts_devis
+            SET montant_euro = ROUND(montant_ariary / %s, 2)
+            WHERE devis_id = ANY(%s)
+        """, (taux_change, devis_ids))
+        conn.commit()
+        cur.close()
+        return len(devis_ids)
+    except Exception as e:
+        conn.rollback()
+        print(f"Erreur lors de la re-conversion des devis: {e}")
+        return None
+    finally:
+        conn.close()
+
+# Prix saisonniers des hôtels et des visites
+DUREE_CACHE_PRIX_SAISONNIERS = 300  # secondes
+
+# Cache mémoire des prix résolus : entité -> {(id, date): ligne de prix}, valable pour une version
+# des prix du catalogue (séquence version_prix_saisonniers, incrémentée par déclencheurs)
+_cache_prix_saisonniers = {'hotels': {}, 'visites': {}, 'charge_le': None, 'version': None}
+
+# Une requête par entité résout toutes les paires (id, date) demandées ;
+# sans période applicable (ou sans date), le prix de base du catalogue s'applique
+REQUETES_PRIX_SAISONNIERS = {
+    'hotels': """
+        SELECT d.entite_id, d.jour, h.nom,
+               COALESCE(p.prix_double, h.prix_double) as prix_double,
+               COALESCE(p.prix_triple, h.prix_triple) as prix_triple,
+               p.libelle as periode
+        FROM unnest(%s::int[], %s::date[]) AS d(entite_id, jour)
+        JOIN hotels h ON h.id = d.entite_id
+        LEFT JOIN periodes_prix_hotels p ON p.hotel_id = d.entite_id AND p.periode @> d.jour
+    """,
+    'visites': """
+        SELECT d.entite_id, d.jour, v.id, v.nom,
+               COALESCE(p.prix_par_personne, v.prix_par_personne) as prix_par_personne,
+               COALESCE(p.prix_par_voiture, v.prix_par_voiture) as prix_par_voiture,
+               v.type_prix, v.guidage_obligatoire,
+               COALESCE(p.guidage_prix_base, v.guidage_prix_base) as guidage_prix_base,
+               v.guidage_nb_personnes_base, v.guidage_type_calcul,
+               COALESCE(p.taxe_communale, v.taxe_communale) as taxe_communale,
+               p.libelle as periode
+        FROM unnest(%s::int[], %s::date[]) AS d(entite_id, jour)
+        JOIN visites v ON v.id = d.entite_id
+        LEFT JOIN periodes_prix_visites p ON p.visite_id = d.entite_id AND p.periode @> d.jour
+    """
+}
+
+def invalider_prix_saisonniers():
+    """Vide le cache des prix saisonniers"""
+    _cache_prix_saisonniers['hotels'].clear()
+    _cache_prix_saisonniers['visites'].clear()
+    _cache_prix_saisonniers['charge_le'] = time.monotonic()
+
+def version_prix_saisonniers():
+    """Version actuelle des prix du catalogue (None si illisible)"""
+    ligne = db_query("""
+        SELECT CASE WHEN is_called THEN last_value ELSE 0 END as version FROM version_prix_saisonniers
+    """, fetch_one=True)
+    return ligne['version'] if ligne else None
+
+def resoudre_prix_saisonniers(entite, demandes):
+    """Retourne les prix en vigueur pour des paires (id, date), en une requête pour les paires non cachées"""
+    # Un prix modifié par un autre processus (charger_catalogue.py, importer_tarifs.py) change la version
+    version = version_prix_saisonniers()
+    charge_le = _cache_prix_saisonniers['charge_le']
+    if (charge_le is None or time.monotonic() - charge_le >= DUREE_CACHE_PRIX_SAISONNIERS
+            or version is None or version != _cache_prix_saisonniers['version']):
+        invalider_prix_saisonniers()
+        _cache_prix_saisonniers['version'] = version
+
+    cache = _cache_prix_saisonniers[entite]
+    manquants = [d for d in set(demandes) if d not in cache]
+    if manquants:
+        lignes = db_query(REQUETES_PRIX_SAISONNIERS[entite],
+                          ([m[0] for m in manquants], [m[1] for m in manquants]), fetch_all=True)
+        for ligne in (lignes or []):
+            cache[(ligne['entite_id'], ligne['jour'])] = ligne
+
+    return {d: cache[d] for d in demandes if d in cache}
+
+def date_du_jour(date_depart, numero_jour):
+    """Date réelle du jour N d'un voyage (None si la date de départ est inconnue)"""
+    if not date_depart or not numero_jour:
+        return None
+    if isinstance(date_depart, str):
+        date_depart = datetime.strptime(date_depart, '%Y-%m-%d').date()
+    return date_depart + timedelta(days=int(numero_jour) - 1)
+
+def visites_du_jour(jour_data):
+    """Retourne la liste des visites d'un jour (le formulaire peut l'envoyer en JSON)"""
+    visites_data = jour_data.get('visites', [])
+    if isinstance(visites_data, str):
+        try:
+            visites_data = json.loads(visites_data)
+        except ValueError:
+            visites_data = []
+    return visites_data if isinstance(visites_data, list) else []
+
+def hebergements_du_jour(jour_data):
+    """
+    Retourne les hébergements d'un jour : liste 'hebergements' (une entrée par type de chambre, comme
+    proposée par /api/optimiser_hotels) ou, à défaut, l'hôtel unique du formulaire
+    """
+    hebergements = jour_data.get('hebergements')
+    if not isinstance(hebergements, list):
+        hebergements = [{
+            'hotel_id': jour_data.get('hotel_id'),
+            'type_chambre': jour_data.get('type_chambre', 'Double'),
+            'nombre_chambres': jour_data.get('nombre_chambres', 1),
+            'transfert_htl': jour_data.get('transfert_htl', 0)
+        }]
+    return [h for h in hebergements if isinstance(h, dict) and h.get('hotel_id')]
+
+def tarifer_itineraire(date_depart, jours):
+    """Résout en lot les prix des hôtels et des visites de tout un itinéraire aux dates réelles"""
+    demandes_hotels = []
+    demandes_visites = []
+    for jour_data in jours:
+        jour_date = date_du_jour(date_depart, jour_data.get('numero_jour'))
+        for hebergement in hebergements_du_jour(jour_data):
+            demandes_hotels.append((int(hebergement['hotel_id']), jour_date))
+        for visite_data in visites_du_jour(jour_data):
+            if isinstance(visite_data, dict) and visite_data.get('visite_id'):
+                demandes_visites.append((int(visite_data['visite_id']), jour_date))
+
+    return (resoudre_prix_saisonniers('hotels', demandes_hotels),
+            resoudre_prix_saisonniers('visites', demandes_visites))
+
+def date_reelle_jour_voyage(jour_id):
+    """Date réelle d'un jour de voyage existant"""
+    jour = db_query("""
+        SELECT jv.numero_jour, d.date_depart
+        FROM jours_voyage jv
+        JOIN devis d ON d.id = jv.devis_id
+        WHERE jv.id = %s
+    """, (jour_id,), fetch_one=True)
+    return date_du_jour(jour['date_depart'], jour['numero_jour']) if jour else None
+
+def prix_visite(visite, nombre_personnes):
+    """Entrée, guidage et taxe communale d'une visite (prix résolus) en ariary entiers"""
+    prix_entree = 0
+    if visite['type_prix'] == 'personne':
+        prix_entree = montant(visite['prix_par_personne'], nombre_personnes)
+    elif visite['type_prix'] in ('voiture', 'bateau'):
+        prix_entree = montant(visite['prix_par_voiture'])
+    
+    # Guidage si obligatoire
+    prix_guidage = 0
+    if visite['guidage_obligatoire'] and visite['guidage_prix_base']:
+        guidage_nb_base = int(visite['guidage_nb_personnes_base'] or 4)
+        guidage_type = visite['guidage_type_calcul']
+        
+        if guidage_type == 'par_personne':
+            prix_guidage = montant(visite['guidage_prix_base'], nombre_personnes)
+        elif guidage_type == 'par_voiture':
+            prix_guidage = montant(visite['guidage_prix_base'])
+        else:  # par_groupe
+            nb_groupes = (nombre_personnes + guidage_nb_base - 1) // guidage_nb_base
+            prix_guidage = montant(visite['guidage_prix_base'], nb_groupes)
+    
+    prix_taxe = montant(visite['taxe_communale'], nombre_personnes)
+    return prix_entree, prix_guidage, prix_taxe
+
+def calculer_carburant(kilometrage, consommation_l_100km, prix_pompe):
+    """Consommation (litres, exacte) et prix du carburant en ariary entiers : consommation * (prix_pompe + 500)"""
+    consommation = decimal(kilometrage) * decimal(consommation_l_100km) / 100
+    return consommation, montant(consommation, decimal(prix_pompe) + 500)
+
+# Graphe des distances routières entre itinéraires
+DUREE_VERIFICATION_DISTANCES = 60  # secondes entre deux vérifications de changement du graphe
+
+# Plus courts chemins précalculés : (itinéraire départ, itinéraire arrivée) -> km
+_matrice_distances = {'signature': None, 'distances': {}, 'verifie_le': None}
+
+def calculer_plus_courts_chemins(aretes):
+    """Calcule les distances minimales entre toutes les paires d'itinéraires (Dijkstra depuis chacun)"""
+    voisins = {}
+    for itineraire_a, itineraire_b, km in aretes:
+        voisins.setdefault(itineraire_a, []).append((itineraire_b, km))
+        voisins.setdefault(itineraire_b, []).append((itineraire_a, km))
+
+    distances = {}
+    for source in voisins:
+        meilleures = {source: 0}
+        file = [(0, source)]
+        while file:
+            distance, itineraire = heapq.heappop(file)
+            if distance > meilleures[itineraire]:
+                continue
+            for voisin, km in voisins[itineraire]:
+                candidate = distance + km
+                if candidate < meilleures.get(voisin, float('inf')):
+                    meilleures[voisin] = candidate
+                    heapq.heappush(file, (candidate, voisin))
+        for cible, distance in meilleures.items():
+            distances[(source, cible)] = distance
+    return distances
+
+def matrice_distances():
+    """Retourne la matrice des plus courts chemins, recalculée uniquement si le graphe a changé"""
+    maintenant = time.monotonic()
+    verifie_le = _matrice_distances['verifie_le']
+    if verifie_le is not None and maintenant - verifie_le < DUREE_VERIFICATION_DISTANCES:
+        return _matrice_distances['distances']
+    _matrice_distances['verifie_le'] = maintenant
+
+    etat = db_query("""
+        SELECT COUNT(*) as nombre, MAX(updated_at) as maj, SUM(distance_km) as total
+        FROM distances_itineraires
+    """, fetch_one=True)
+    if etat is None:
+        return _matrice_distances['distances']
+
+    signature = (etat['nombre'], etat['maj'], etat['total'])
+    if signature != _matrice_distances['signature']:
+        aretes = db_query("""
+            SELECT itineraire_a_id, itineraire_b_id, distance_km FROM distances_itineraires
+        """, fetch_all=True)
+        if aretes is not None:
+            _matrice_distances['distances'] = calculer_plus_courts_chemins(
+                [(a['itineraire_a_id'], a['itineraire_b_id'], a['distance_km']) for a in aretes])
+            _matrice_distances['signature'] = signature
+    return _matrice_distances['distances']
+
+def kilometrages_itineraire(itineraire_ids, itineraire_depart_id=None):
+    """Kilométrage de chaque jour depuis l'itinéraire de la veille (None si aucun chemin connu)"""
+    distances = matrice_distances()
+    precedent = itineraire_depart_id
+    kilometrages = []
+    for itineraire_id in itineraire_ids:
+        if precedent is None or itineraire_id is None or precedent == itineraire_id:
+            kilometrages.append(0)
+        else:
+            kilometrages.append(distances.get((precedent, itineraire_id)))
+        if itineraire_id is not None:
+            precedent = itineraire_id
+    return kilometrages
+
+# Devis finalisés : figés dans un instantané JSONB (devis_figes, migration v17)
+STATUTS_FINAUX = ('envoyé', 'accepté', 'refusé')
+
+def devis_fige(devis_id):
+    """Vrai si le devis a quitté le brouillon ou a été supprimé (son contenu ne doit plus changer)"""
+    devis = db_query("SELECT statut, supprime_le FROM devis WHERE id = %s", (devis_id,), fetch_one=True)
+    return bool(devis) and (devis['supprime_le'] is not None or (devis['statut'] or 'brouillon') != 'brouillon')
+
+def jour_du_devis(devis_id, jour_id):
+    """Vrai si le jour de voyage appartient au devis"""
+    return db_query("SELECT 1 FROM jours_voyage WHERE id = %s AND devis_id = %s",
+                    (jour_id, devis_id), fetch_one=True) is not None
+
+def brouillon_requis(vue):
+    """Refuse les modifications d'un devis finalisé ou supprimé (409) et d'un jour d'un autre devis (404)"""
+    @wraps(vue)
+    def verifiee(devis_id, *args, **kwargs):
+        if devis_fige(devis_id):
+            return jsonify({'error': 'Devis finalisé (le rouvrir pour le modifier) ou supprimé'}), 409
+        if 'jour_id' in kwargs and not jour_du_devis(devis_id, kwargs['jour_id']):
+            return jsonify({'error': 'Jour non trouvé dans ce devis'}), 404
+        return vue(devis_id, *args, **kwargs)
+    return verifiee
+
+def versionnee(vue):
+    """Enregistre une version du devis après chaque modification réussie (et son état d'origine avant la première)"""
+    @wraps(vue)
+    def enregistree(devis_id, *args, **kwargs):
+        enregistrer_version_initiale(devis_id)
+        reponse = make_response(vue(devis_id, *args, **kwargs))
+        if reponse.status_code < 400:
+            enregistrer_version(devis_id)
+        return reponse
+    return enregistree
+
+def valeur_json(valeur):
+    """Sérialisation de l'instantané : montants en nombres, dates au format ISO"""
+    if isinstance(valeur, Decimal):
+        return int(valeur) if valeur == valeur.to_integral_value() else float(valeur)
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    raise TypeError(f"Valeur non sérialisable: {type(valeur).__name__}")
+
+def depuis_instantane(contenu):
+    """Contexte de devis_detail.html depuis l'instantané (dates du devis reconverties)"""
+    devis = contenu['devis']
+    for champ in ('date_cotation', 'date_depart'):
+        if devis.get(champ):
+            devis[champ] = date.fromisoformat(devis[champ])
+    return contenu
+
 # Routes principales
 @app.route('/')
 def index():
@@ -71,6 +422,7 @@ def index():
         SELECT d.*, c.nom as client_nom, c.reference as client_ref
         FROM devis d
         LEFT JOIN clients c ON d.client_id = c.id
+        WHERE d.supprime_le IS NULL
         ORDER BY d.created_at DESC
         LIMIT 50
     """, fetch_all=True)
@@ -79,111 +431,130 @@ def index():
 
 @app.route('/devis/<int:devis_id>')
 def voir_devis(devis_id):
-    """Affiche les détails d'un devis"""
+    """Affiche les détails d'un devis (depuis son instantané s'il est finalisé)"""
+    fige = db_query("""
+        SELECT f.contenu, f.fige_le, d.statut
+        FROM devis_figes f
+        JOIN devis d ON d.id = f.devis_id
+        WHERE f.devis_id = %s AND d.supprime_le IS NULL
+    """, (devis_id,), fetch_one=True)
+    
+    if fige:
+        contenu = depuis_instantane(fige['contenu'])
+        contenu['devis']['statut'] = fige['statut']
+        return render_template('devis_detail.html', fige_le=fige['fige_le'], **contenu)
+    
     devis = db_query("""
         SELECT d.*, c.nom as client_nom, c.reference as client_ref,
                c.email, c.telephone
         FROM devis d
         LEFT JOIN clients c ON d.client_id = c.id
-        WHERE d.id = %s
+        WHERE d.id = %s AND d.supprime_le IS NULL
     """, (devis_id,), fetch_one=True)
     
     if not devis:
-        flash('Devis non trouvé', 'error')
+        archive = db_query("SELECT reference FROM archives.devis WHERE id = %s", (devis_id,), fetch_one=True)
+        if archive:
+            flash(f"Devis {archive['reference']} archivé (database/archiver_devis.py --restaurer {devis_id})", 'error')
+        else:
+            flash('Devis non trouvé', 'error')
         return redirect(url_for('index'))
     
     # Recalculer les totaux avant d'afficher
     calculer_totaux_devis(devis_id)
     
+    return render_template('devis_detail.html', fige_le=None, **charger_contenu_devis(devis))
+
+def charger_contenu_devis(devis, cur=None):
+    """Jours, lignes, coûts et totaux par jour d'un devis : contexte de devis_detail.html
+    (lus sur `cur` s'il est fourni, dans la transaction de l'appelant)"""
+    devis_id = devis['id']
+    
+    def lire(requete, params):
+        if cur is None:
+            return db_query(requete, params, fetch_all=True)
+        cur.execute(requete, params)
+        return cur.fetchall()
+    
     # Récupérer les jours de voyage
-    jours = db_query("""
+    jours = lire("""
         SELECT * FROM jours_voyage
         WHERE devis_id = %s
         ORDER BY numero_jour
-    """, (devis_id,), fetch_all=True)
+    """, (devis_id,))
     
     # Récupérer les coûts par catégorie
-    couts = db_query("""
+    couts = lire("""
         SELECT cc.nom, cd.montant_ariary, cd.montant_euro
         FROM couts_devis cd
         JOIN categories_couts cc ON cd.categorie_id = cc.id
         WHERE cd.devis_id = %s
         ORDER BY cc.ordre
-    """, (devis_id,), fetch_all=True)
+    """, (devis_id,))
     
     # Récupérer les détails pour chaque jour
     jours_details = []
     for jour in jours or []:
         jour_id = jour['id']
         
-        transferts = db_query("""
+        transferts = lire("""
             SELECT * FROM transferts WHERE jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        locations = db_query("""
+        locations = lire("""
             SELECT l.*, tv.nom as type_voiture_nom, tv.consommation_l_100km
             FROM locations_vehicules l
             LEFT JOIN types_voitures tv ON l.type_voiture_id = tv.id
             WHERE l.jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        guidages = db_query("""
+        guidages = lire("""
             SELECT * FROM guidages WHERE jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        reserves = db_query("""
+        reserves = lire("""
             SELECT * FROM reserves_parcs WHERE jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        hebergements = db_query("""
+        hebergements = lire("""
             SELECT h.*, ho.nom as hotel_nom
             FROM hebergements h
             LEFT JOIN hotels ho ON h.hotel_id = ho.id
             WHERE h.jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        repas = db_query("""
+        repas = lire("""
             SELECT * FROM repas WHERE jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        visites = db_query("""
+        visites = lire("""
             SELECT vj.*, v.nom as visite_nom
             FROM visites_jour vj
             LEFT JOIN visites v ON vj.visite_id = v.id
             WHERE vj.jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        locations_journalieres = db_query("""
+        locations_journalieres = lire("""
             SELECT lj.*, tlj.nom as type_location_nom
             FROM locations_journalieres lj
             LEFT JOIN types_locations_journalieres tlj ON lj.type_location_id = tlj.id
             WHERE lj.jour_voyage_id = %s
-        """, (jour_id,), fetch_all=True)
+        """, (jour_id,))
         
-        # Calculer les totaux par jour
-        total_hebergement_jour = sum(
-            (float(h.get('prix_ariary') or 0) + float(h.get('transfert_htl') or 0))
+        # Calculer les totaux par jour (ariary entiers, comme lignes_devis)
+        total_hebergement_jour = somme_ariary(
+            ariary(h.get('prix_ariary')) + ariary(h.get('transfert_htl'))
             for h in (hebergements or [])
         )
         
-        total_visites_jour = sum(
-            float(v.get('prix_total') or 0)
-            for v in (visites or [])
-        )
+        total_visites_jour = somme_ariary(v.get('prix_total') for v in (visites or []))
         
-        total_carburant_jour = sum(
-            float(l.get('prix_carburant_total') or 0)
-            for l in (locations or [])
-        )
+        total_carburant_jour = somme_ariary(l.get('prix_carburant_total') for l in (locations or []))
         
-        total_locations_jour = sum(
-            float(l.get('prix_ariary') or 0)
-            for l in (locations or [])
-        )
+        total_locations_jour = somme_ariary(l.get('prix_ariary') for l in (locations or []))
         
-        total_locations_journalieres_jour = sum(
-            float(lj.get('prix_total') or 0)
-            for lj in (locations_journalieres or [])
+        total_locations_journalieres_jour = somme_ariary(
+            lj.get('prix_total') for lj in (locations_journalieres or [])
         )
         
         total_jour = (total_hebergement_jour + total_visites_jour + 
@@ -209,27 +580,28 @@ def voir_devis(devis_id):
         })
     
     # Récupérer les imprévus
-    imprevus = db_query("""
+    imprevus = lire("""
         SELECT * FROM imprevus WHERE devis_id = %s
-    """, (devis_id,), fetch_all=True)
+    """, (devis_id,))
     
     # Récupérer les transferts aéroport
-    transferts_aeroport = db_query("""
+    transferts_aeroport = lire("""
         SELECT * FROM transferts_aeroport WHERE devis_id = %s
-    """, (devis_id,), fetch_all=True)
+    """, (devis_id,))
     
     # Récupérer les guides accompagnateurs
-    guides_accompagnateurs = db_query("""
+    guides_accompagnateurs = lire("""
         SELECT * FROM guides_accompagnateurs WHERE devis_id = %s
-    """, (devis_id,), fetch_all=True)
+    """, (devis_id,))
     
-    return render_template('devis_detail.html', 
-                         devis=devis,
-                         jours_details=jours_details,
-                         couts=couts or [],
-                         imprevus=imprevus or [],
-                         transferts_aeroport=transferts_aeroport or [],
-                         guides_accompagnateurs=guides_accompagnateurs or [])
+    return {
+        'devis': devis,
+        'jours_details': jours_details,
+        'couts': couts or [],
+        'imprevus': imprevus or [],
+        'transferts_aeroport': transferts_aeroport or [],
+        'guides_accompagnateurs': guides_accompagnateurs or []
+    }
 
 @app.route('/devis/nouveau', methods=['GET', 'POST'])
 def nouveau_devis():
@@ -244,9 +616,13 @@ def nouveau_devis():
     # Si on modifie un devis existant, charger ses données
     if devis_id and request.method == 'GET':
         devis_existant = db_query("""
-            SELECT * FROM devis WHERE id = %s
+            SELECT * FROM devis WHERE id = %s AND supprime_le IS NULL
         """, (devis_id,), fetch_one=True)
         
+        if devis_existant and (devis_existant['statut'] or 'brouillon') != 'brouillon':
+            flash('Devis finalisé : le rouvrir pour le modifier', 'error')
+            return redirect(url_for('voir_devis', devis_id=devis_id))
+        
         if devis_existant:
             # Charger les jours de voyage avec leurs données
             jours_raw = db_query("""
@@ -316,25 +692,39 @@ def nouveau_devis():
         client_id = request.form.get('client_id')
         reference = request.form.get('reference')
         date_cotation = request.form.get('date_cotation')
+        date_depart = request.form.get('date_depart') or None
         nombre_personnes = int(request.form.get('nombre_personnes', 0))
         nombre_adultes = int(request.form.get('nombre_adultes', 0))
         nombre_enfants = int(request.form.get('nombre_enfants', 0))
         nombre_bebes = int(request.form.get('nombre_bebes', 0))
         nombre_chambres = int(request.form.get('nombre_chambres', 0))
-        taux_change = float(request.form.get('taux_change', 4420))
+        taux_change = request.form.get('taux_change', type=float) or taux_change_a_date()
         marge_percent = float(request.form.get('marge_percent', 18))
         
+        if devis_id_form and devis_fige(devis_id_form):
+            flash('Devis finalisé (le rouvrir pour le modifier) ou supprimé', 'error')
+            return redirect(url_for('voir_devis', devis_id=devis_id_form))
+        
+        # Valider la date de départ avant toute écriture (elle sert à tarifer les jours)
+        if date_depart:
+            try:
+                date_depart = datetime.strptime(date_depart, '%Y-%m-%d').date()
+            except ValueError:
+                flash('Date de départ invalide (format attendu AAAA-MM-JJ)', 'error')
+                return redirect(url_for('nouveau_devis', devis_id=devis_id_form))
+        
         # Si c'est une modification, mettre à jour le devis existant
         if devis_id_form:
+            enregistrer_version_initiale(devis_id_form)
             db_query("""
                 UPDATE devis SET
                     client_id = %s, reference = %s, date_cotation = %s, nombre_personnes = %s,
                     nombre_adultes = %s, nombre_enfants = %s, nombre_bebes = %s, nombre_chambres = %s,
-                    taux_change = %s, marge_percent = %s
+                    taux_change = %s, marge_percent = %s, date_depart = %s
                 WHERE id = %s
             """, (client_id, reference, date_cotation, nombre_personnes,
                   nombre_adultes, nombre_enfants, nombre_bebes, nombre_chambres,
-                  taux_change, marge_percent, devis_id_form))
+                  taux_change, marge_percent, date_depart, devis_id_form))
             devis_id = devis_id_form
             
             # Supprimer les jours existants pour les recréer
@@ -347,12 +737,12 @@ def nouveau_devis():
                 INSERT INTO devis (
                     client_id, reference, date_cotation, nombre_personnes,
                     nombre_adultes, nombre_enfants, nombre_bebes, nombre_chambres,
-                    taux_change, marge_percent
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    taux_change, marge_percent, date_depart
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 RETURNING id
             """, (client_id, reference, date_cotation, nombre_personnes,
                   nombre_adultes, nombre_enfants, nombre_bebes, nombre_chambres,
-                  taux_change, marge_percent), fetch_one=True)
+                  taux_change, marge_percent, date_depart), fetch_one=True)
             
             if result:
                 devis_id = result['id']
@@ -367,7 +757,8 @@ def nouveau_devis():
                                      jours_existants=[],
                                      guides_accompagnateurs=[],
                                      transferts_aeroport=[],
-                                     type_location_journaliere=None)
+                                     type_location_journaliere=None,
+                                     taux_change_defaut=taux_change_a_date())
         
         if devis_id:
             
@@ -375,17 +766,23 @@ def nouveau_devis():
             jours_data = request.form.getlist('jours[]')
             created_jour_ids = []  # Pour stocker les IDs des jours créés
             if jours_data:
-                import json
+                jours_parses = []
                 for jour_json in jours_data:
                     try:
-                        jour_data = json.loads(jour_json)
+                        jours_parses.append(json.loads(jour_json))
+                    except ValueError as e:
+                        print(f"Erreur lors de la lecture du jour: {e}")
+                
+                # Tarifer tout l'itinéraire en une seule résolution des prix (saisonniers)
+                hotels_resolus, visites_resolues = tarifer_itineraire(date_depart, jours_parses)
+                
+                for jour_data in jours_parses:
+                    try:
                         numero_jour = int(jour_data.get('numero_jour', 0))
                         itineraire_id = jour_data.get('itineraire_id')
                         date_jour = jour_data.get('date_jour')
-                        hotel_id = jour_data.get('hotel_id')
-                        type_chambre = jour_data.get('type_chambre', 'Double')
-                        nombre_chambres_jour = int(jour_data.get('nombre_chambres', 1))
-                        transfert_htl = float(jour_data.get('transfert_htl', 0))
+                        
+                        jour_date = date_du_jour(date_depart, numero_jour)
                         
                         if numero_jour and itineraire_id:
                             # Créer le jour de voyage
@@ -399,12 +796,16 @@ def nouveau_devis():
                                 jour_voyage_id = jour_result['id']
                                 created_jour_ids.append(jour_voyage_id)
                                 
-                                # Ajouter l'hébergement si un hôtel est sélectionné
-                                if hotel_id:
-                                    hotel = db_query("SELECT prix_double, prix_triple, nom FROM hotels WHERE id = %s", (hotel_id,), fetch_one=True)
+                                # Ajouter l'hébergement si un hôtel est sélectionné (un par type de chambre)
+                                for hebergement in hebergements_du_jour(jour_data):
+                                    hotel_id = int(hebergement['hotel_id'])
+                                    type_chambre = hebergement.get('type_chambre') or 'Double'
+                                    nombre_chambres_jour = int(hebergement.get('nombre_chambres', 1) or 0)
+                                    transfert_htl = ariary(hebergement.get('transfert_htl', 0))
+                                    hotel = hotels_resolus.get((hotel_id, jour_date))
                                     if hotel:
-                                        prix_chambre = float(hotel['prix_triple'] if type_chambre == 'Triple' and hotel['prix_triple'] else hotel['prix_double'])
-                                        prix_total = prix_chambre * nombre_chambres_jour
+                                        prix_chambre = hotel['prix_triple'] if type_chambre == 'Triple' and hotel['prix_triple'] else hotel['prix_double']
+                                        prix_total = montant(prix_chambre, nombre_chambres_jour)
                                         
                                         db_query("""
                                             INSERT INTO hebergements (jour_voyage_id, hotel_id, type_chambre, nom_hotel, nombre_chambres, prix_ariary, transfert_htl)
@@ -412,57 +813,16 @@ def nouveau_devis():
                                         """, (jour_voyage_id, hotel_id, type_chambre, hotel['nom'], nombre_chambres_jour, prix_total, transfert_htl))
                                 
                                 # Ajouter les visites si fournies (peut être plusieurs)
-                                visites_data = jour_data.get('visites', [])
-                                if isinstance(visites_data, str):
-                                    # Si c'est une chaîne JSON, la parser
-                                    try:
-                                        visites_data = json.loads(visites_data)
-                                    except:
-                                        visites_data = []
-                                
-                                # S'assurer que visites_data est une liste
-                                if not isinstance(visites_data, list):
-                                    visites_data = []
-                                
-                                for visite_data in visites_data:
+                                for visite_data in visites_du_jour(jour_data):
                                     visite_id = visite_data.get('visite_id') if isinstance(visite_data, dict) else None
                                     nb_personnes_visite = int(visite_data.get('nb_personnes', 0) or 0) if isinstance(visite_data, dict) else 0
                                     
                                     if visite_id and nb_personnes_visite > 0:
-                                        visite = db_query("""
-                                            SELECT id, nom, prix_par_personne, prix_par_voiture, type_prix,
-                                                   guidage_obligatoire, guidage_prix_base, guidage_nb_personnes_base,
-                                                   guidage_type_calcul, taxe_communale
-                                            FROM visites WHERE id = %s
-                                        """, (visite_id,), fetch_one=True)
+                                        visite = visites_resolues.get((int(visite_id), jour_date))
                                         
                                         if visite:
-                                            # Calculer le prix d'entrée
-                                            prix_entree = 0
-                                            if visite['type_prix'] == 'personne':
-                                                prix_entree = float(visite['prix_par_personne'] or 0) * nb_personnes_visite
-                                            elif visite['type_prix'] in ('voiture', 'bateau'):
-                                                prix_entree = float(visite['prix_par_voiture'] or 0)
-                                            
-                                            # Calculer le prix du guidage si obligatoire
-                                            prix_guidage = 0
-                                            if visite['guidage_obligatoire'] and visite['guidage_prix_base']:
-                                                guidage_prix_base = float(visite['guidage_prix_base'])
-                                                guidage_nb_base = int(visite['guidage_nb_personnes_base'] or 4)
-                                                guidage_type = visite['guidage_type_calcul']
-                                                
-                                                if guidage_type == 'par_personne':
-                                                    prix_guidage = guidage_prix_base * nb_personnes_visite
-                                                elif guidage_type == 'par_voiture':
-                                                    prix_guidage = guidage_prix_base
-                                                else:  # par_groupe
-                                                    nb_groupes = (nb_personnes_visite + guidage_nb_base - 1) // guidage_nb_base
-                                                    prix_guidage = guidage_prix_base * nb_groupes
-                                            
-                                            # Calculer la taxe communale
-                                            prix_taxe = float(visite['taxe_communale'] or 0) * nb_personnes_visite
-                                            
-                                            # Prix total de la visite
+                                            # Prix total de la visite (somme des composantes arrondies à l'ariary)
+                                            prix_entree, prix_guidage, prix_taxe = prix_visite(visite, nb_personnes_visite)
                                             prix_total_visite = prix_entree + prix_guidage + prix_taxe
                                             
                                             db_query("""
@@ -474,8 +834,8 @@ def nouveau_devis():
                                 
                                 # Ajouter la location de véhicule si fournie
                                 type_voiture_id = jour_data.get('type_voiture_id')
-                                kilometrage = float(jour_data.get('kilometrage', 0) or 0)
-                                prix_carburant_pompe = float(jour_data.get('prix_carburant_pompe', 0) or 0)
+                                kilometrage = decimal(jour_data.get('kilometrage', 0))
+                                prix_carburant_pompe = decimal(jour_data.get('prix_carburant_pompe', 0))
                                 
                                 if type_voiture_id and kilometrage > 0:
                                     type_voiture = db_query("""
@@ -483,13 +843,9 @@ def nouveau_devis():
                                     """, (type_voiture_id,), fetch_one=True)
                                     
                                     if type_voiture:
-                                        consommation_l_100km = float(type_voiture['consommation_l_100km'])
-                                        
-                                        # Calculer la consommation totale
-                                        consommation_totale = (kilometrage * consommation_l_100km) / 100
-                                        
-                                        # Calculer le prix total du carburant
-                                        prix_carburant_total = consommation_totale * (prix_carburant_pompe + 500)
+                                        # Consommation totale et prix du carburant (ariary entiers)
+                                        consommation_totale, prix_carburant_total = calculer_carburant(
+                                            kilometrage, type_voiture['consommation_l_100km'], prix_carburant_pompe)
                                         
                                         db_query("""
                                             INSERT INTO locations_vehicules (jour_voyage_id, type_voiture_id, type_location,
@@ -501,14 +857,14 @@ def nouveau_devis():
                     except Exception as e:
                         print(f"Erreur lors de l'ajout du jour: {e}")
             
-            # Traiter le guide accompagnateur si prix fourni
-            prix_guide_par_jour = float(request.form.get('prix_guide_par_jour', 0) or 0)
+            # Traiter le guide accompagnateur si prix fourni (prix négocié : non re-tarifé par config_prix)
+            prix_guide_par_jour = ariary(request.form.get('prix_guide_par_jour', 0))
             
             # Compter le nombre de jours ajoutés
             nombre_jours_guide = len(jours_data) if jours_data else 0
             
             if prix_guide_par_jour > 0 and nombre_jours_guide > 0:
-                prix_total_guide = prix_guide_par_jour * nombre_jours_guide
+                prix_total_guide = montant(prix_guide_par_jour, nombre_jours_guide)
                 
                 db_query("""
                     INSERT INTO guides_accompagnateurs (devis_id, nombre_guides, nombre_jours, prix_par_jour, prix_total)
@@ -528,8 +884,7 @@ def nouveau_devis():
                     """, (type_location_id,), fetch_one=True)
                     
                     if type_location:
-                        prix_par_jour = float(type_location['prix_journalier_sans_carburant'])
-                        prix_total_location = prix_par_jour * nombre_jours
+                        prix_par_jour = ariary(type_location['prix_journalier_sans_carburant'])
                         
                         # Créer une entrée dans locations_journalieres pour chaque jour
                         for jour_id in created_jour_ids:
@@ -545,8 +900,8 @@ def nouveau_devis():
                 
                 # Lire le prix depuis la base de données
                 config = db_query("SELECT valeur FROM config_prix WHERE cle = 'transfert_aeroport_par_trajet'", fetch_one=True)
-                prix_par_trajet = float(config['valeur']) if config else 250000
-                prix_total_transfert = prix_par_trajet * nb_trajets
+                prix_par_trajet = ariary(config['valeur']) if config else 250000
+                prix_total_transfert = montant(prix_par_trajet, nb_trajets)
                 
                 db_query("""
                     INSERT INTO transferts_aeroport (devis_id, type_transfert, nombre_trajets, prix_par_trajet, prix_total)
@@ -555,6 +910,7 @@ def nouveau_devis():
             
             # Calculer automatiquement les totaux
             calculer_totaux_devis(devis_id)
+            enregistrer_version(devis_id)
             
             if devis_id_form:
                 flash('Devis modifié avec succès', 'success')
@@ -575,7 +931,8 @@ def nouveau_devis():
                          jours_existants=jours_existants or [],
                          guides_accompagnateurs=guides_accompagnateurs or [],
                          transferts_aeroport=transferts_aeroport or [],
-                         type_location_journaliere=type_location_journaliere)
+                         type_location_journaliere=type_location_journaliere,
+                         taux_change_defaut=taux_change_a_date())
 
 @app.route('/devis/<int:devis_id>/jours', methods=['GET', 'POST'])
 def gerer_jours_voyage(devis_id):
@@ -584,7 +941,7 @@ def gerer_jours_voyage(devis_id):
         SELECT d.*, c.nom as client_nom
         FROM devis d
         LEFT JOIN clients c ON d.client_id = c.id
-        WHERE d.id = %s
+        WHERE d.id = %s AND d.supprime_le IS NULL
     """, (devis_id,), fetch_one=True)
     
     if not devis:
@@ -639,7 +996,7 @@ def liste_clients():
     clients = db_query("""
         SELECT c.*, COUNT(d.id) as nombre_devis
         FROM clients c
-        LEFT JOIN devis d ON c.id = d.client_id
+        LEFT JOIN devis d ON c.id = d.client_id AND d.supprime_le IS NULL
         GROUP BY c.id
         ORDER BY c.nom
     """, fetch_all=True)
@@ -741,19 +1098,19 @@ def api_calculer_guidage():
     """Calcule le prix du guidage selon les règles"""
     data = request.get_json()
     nb_personnes = int(data.get('nb_personnes', 0))
-    prix_base = float(data.get('prix_base', 0))
+    prix_base = decimal(data.get('prix_base', 0))
     nb_personnes_base = int(data.get('nb_personnes_base', 4))
     type_calcul = data.get('type_calcul', 'par_groupe')
     
     if type_calcul == 'par_personne':
-        prix_total = prix_base * nb_personnes
+        prix_total = montant(prix_base, nb_personnes)
     elif type_calcul == 'par_voiture':
-        prix_total = prix_base  # Prix fixe par voiture
+        prix_total = montant(prix_base)  # Prix fixe par voiture
     else:  # par_groupe
         # Calculer le nombre de groupes nécessaires
         # Ex: 1-4 personnes = 1 groupe, 5-8 = 2 groupes, etc.
         nb_groupes = (nb_personnes + nb_personnes_base - 1) // nb_personnes_base
-        prix_total = prix_base * nb_groupes
+        prix_total = montant(prix_base, nb_groupes)
     
     return jsonify({
         'prix_total': prix_total,
@@ -764,19 +1121,13 @@ def api_calculer_guidage():
 def api_calculer_carburant():
     """Calcule la consommation et le prix du carburant"""
     data = request.get_json()
-    kilometrage = float(data.get('kilometrage', 0))
-    consommation_l_100km = float(data.get('consommation_l_100km', 0))
-    prix_pompe = float(data.get('prix_pompe', 0))
-    
-    # Calcul: (kilometrage * consommation) / 100
-    consommation_totale = (kilometrage * consommation_l_100km) / 100
-    
-    # Prix: consommation * (prix_pompe + 500)
-    prix_total = consommation_totale * (prix_pompe + 500)
+    # Calcul: (kilometrage * consommation) / 100 ; prix: consommation * (prix_pompe + 500)
+    consommation_totale, prix_total = calculer_carburant(
+        data.get('kilometrage', 0), data.get('consommation_l_100km', 0), data.get('prix_pompe', 0))
     
     return jsonify({
-        'consommation_totale': round(consommation_totale, 2),
-        'prix_total': round(prix_total, 2)
+        'consommation_totale': round(float(consommation_totale), 2),
+        'prix_total': prix_total
     })
 
 @app.route('/api/devis/<int:devis_id>/jours', methods=['GET'])
@@ -793,6 +1144,8 @@ def api_jours_devis(devis_id):
     return jsonify([dict(jour) for jour in (jours or [])])
 
 @app.route('/api/devis/<int:devis_id>/jours', methods=['POST'])
+@brouillon_requis
+@versionnee
 def ajouter_jour_devis(devis_id):
     """Ajoute un jour de voyage à un devis"""
     data = request.get_json()
@@ -805,7 +1158,7 @@ def ajouter_jour_devis(devis_id):
         return jsonify({'error': 'Numéro de jour requis'}), 400
     
     # Vérifier que le devis existe
-    devis = db_query("SELECT id FROM devis WHERE id = %s", (devis_id,), fetch_one=True)
+    devis = db_query("SELECT id FROM devis WHERE id = %s AND supprime_le IS NULL", (devis_id,), fetch_one=True)
     if not devis:
         return jsonify({'error': 'Devis non trouvé'}), 404
     
@@ -824,6 +1177,8 @@ def ajouter_jour_devis(devis_id):
         return jsonify({'error': 'Erreur lors de la création du jour'}), 500
 
 @app.route('/api/devis/<int:devis_id>/jours/<int:jour_id>/hebergement', methods=['POST'])
+@brouillon_requis
+@versionnee
 def ajouter_hebergement_jour(devis_id, jour_id):
     """Ajoute un hébergement à un jour de voyage"""
     data = request.get_json()
@@ -831,27 +1186,24 @@ def ajouter_hebergement_jour(devis_id, jour_id):
     hotel_id = data.get('hotel_id')
     type_chambre = data.get('type_chambre', 'Double')
     nombre_chambres = int(data.get('nombre_chambres', 1))
-    transfert_htl = float(data.get('transfert_htl', 0))
+    transfert_htl = ariary(data.get('transfert_htl', 0))
     
-    # Récupérer le prix de l'hôtel
-    hotel = db_query("""
-        SELECT prix_double, prix_triple FROM hotels WHERE id = %s
-    """, (hotel_id,), fetch_one=True)
+    # Récupérer le prix de l'hôtel en vigueur à la date du jour
+    jour_date = date_reelle_jour_voyage(jour_id)
+    hotel = resoudre_prix_saisonniers('hotels', [(int(hotel_id), jour_date)]).get((int(hotel_id), jour_date)) if hotel_id else None
     
     if not hotel:
         return jsonify({'error': 'Hôtel non trouvé'}), 404
     
     # Calculer le prix selon le type de chambre
     if type_chambre == 'Triple' and hotel['prix_triple']:
-        prix_chambre = float(hotel['prix_triple'])
+        prix_chambre = hotel['prix_triple']
     else:
-        prix_chambre = float(hotel['prix_double'])
+        prix_chambre = hotel['prix_double']
     
-    prix_total = prix_chambre * nombre_chambres
+    prix_total = montant(prix_chambre, nombre_chambres)
     
-    # Récupérer le nom de l'hôtel
-    hotel_nom = db_query("SELECT nom FROM hotels WHERE id = %s", (hotel_id,), fetch_one=True)
-    nom_hotel = hotel_nom['nom'] if hotel_nom else None
+    nom_hotel = hotel['nom']
     
     # Créer ou mettre à jour l'hébergement
     result = db_query("""
@@ -874,6 +1226,8 @@ def ajouter_hebergement_jour(devis_id, jour_id):
         return jsonify({'error': 'Erreur lors de l\'ajout de l\'hébergement'}), 500
 
 @app.route('/api/devis/<int:devis_id>/jours/<int:jour_id>/visite', methods=['POST'])
+@brouillon_requis
+@versionnee
 def ajouter_visite_jour(devis_id, jour_id):
     """Ajoute une visite à un jour de voyage"""
     data = request.get_json()
@@ -884,43 +1238,15 @@ def ajouter_visite_jour(devis_id, jour_id):
     if not visite_id:
         return jsonify({'error': 'Visite requise'}), 400
     
-    # Récupérer les informations de la visite
-    visite = db_query("""
-        SELECT id, nom, prix_par_personne, prix_par_voiture, type_prix,
-               guidage_obligatoire, guidage_prix_base, guidage_nb_personnes_base,
-               guidage_type_calcul, taxe_communale
-        FROM visites WHERE id = %s
-    """, (visite_id,), fetch_one=True)
+    # Récupérer les informations de la visite au prix en vigueur à la date du jour
+    jour_date = date_reelle_jour_voyage(jour_id)
+    visite = resoudre_prix_saisonniers('visites', [(int(visite_id), jour_date)]).get((int(visite_id), jour_date))
     
     if not visite:
         return jsonify({'error': 'Visite non trouvée'}), 404
     
-    # Calculer le prix d'entrée
-    prix_entree = 0
-    if visite['type_prix'] == 'personne':
-        prix_entree = float(visite['prix_par_personne']) * nombre_personnes
-    elif visite['type_prix'] in ('voiture', 'bateau'):
-        prix_entree = float(visite['prix_par_voiture'])
-    
-    # Calculer le prix du guidage si obligatoire
-    prix_guidage = 0
-    if visite['guidage_obligatoire'] and visite['guidage_prix_base']:
-        guidage_prix_base = float(visite['guidage_prix_base'])
-        guidage_nb_base = int(visite['guidage_nb_personnes_base'])
-        guidage_type = visite['guidage_type_calcul']
-        
-        if guidage_type == 'par_personne':
-            prix_guidage = guidage_prix_base * nombre_personnes
-        elif guidage_type == 'par_voiture':
-            prix_guidage = guidage_prix_base
-        else:  # par_groupe
-            nb_groupes = (nombre_personnes + guidage_nb_base - 1) // guidage_nb_base
-            prix_guidage = guidage_prix_base * nb_groupes
-    
-    # Calculer la taxe communale
-    prix_taxe = float(visite['taxe_communale'] or 0) * nombre_personnes
-    
-    # Prix total de la visite
+    # Prix total de la visite (somme des composantes arrondies à l'ariary)
+    prix_entree, prix_guidage, prix_taxe = prix_visite(visite, nombre_personnes)
     prix_total = prix_entree + prix_guidage + prix_taxe
     
     # Créer ou mettre à jour la visite du jour
@@ -947,14 +1273,16 @@ def ajouter_visite_jour(devis_id, jour_id):
         return jsonify({'error': 'Erreur lors de l\'ajout de la visite'}), 500
 
 @app.route('/api/devis/<int:devis_id>/jours/<int:jour_id>/location', methods=['POST'])
+@brouillon_requis
+@versionnee
 def ajouter_location_jour(devis_id, jour_id):
     """Ajoute une location de véhicule avec calcul du carburant à un jour de voyage"""
     data = request.get_json()
     
     type_voiture_id = data.get('type_voiture_id')
-    kilometrage = float(data.get('kilometrage', 0))
-    prix_carburant_pompe = float(data.get('prix_carburant_pompe', 0))
-    prix_location = float(data.get('prix_location', 0))
+    kilometrage = decimal(data.get('kilometrage', 0))
+    prix_carburant_pompe = decimal(data.get('prix_carburant_pompe', 0))
+    prix_location = ariary(data.get('prix_location', 0))
     nombre_vehicules = int(data.get('nombre_vehicules', 1))
     
     if not type_voiture_id:
@@ -968,13 +1296,9 @@ def ajouter_location_jour(devis_id, jour_id):
     if not type_voiture:
         return jsonify({'error': 'Type de voiture non trouvé'}), 404
     
-    consommation_l_100km = float(type_voiture['consommation_l_100km'])
-    
-    # Calculer la consommation totale
-    consommation_totale = (kilometrage * consommation_l_100km) / 100
-    
-    # Calculer le prix total du carburant
-    prix_carburant_total = consommation_totale * (prix_carburant_pompe + 500)
+    # Consommation totale et prix du carburant (ariary entiers)
+    consommation_totale, prix_carburant_total = calculer_carburant(
+        kilometrage, type_voiture['consommation_l_100km'], prix_carburant_pompe)
     
     # Créer ou mettre à jour la location
     result = db_query("""
@@ -996,199 +1320,78 @@ def ajouter_location_jour(devis_id, jour_id):
         return jsonify({
             'success': True,
             'location_id': result['id'],
-            'consommation_totale': consommation_totale,
+            'consommation_totale': float(consommation_totale),
             'prix_carburant_total': prix_carburant_total
         })
     else:
         return jsonify({'error': 'Erreur lors de l\'ajout de la location'}), 500
 
-def calculer_totaux_devis(devis_id):
-    """Fonction utilitaire pour calculer les totaux d'un devis"""
-    devis = db_query("SELECT * FROM devis WHERE id = %s", (devis_id,), fetch_one=True)
+def calculer_totaux_devis(devis_id, cur=None):
+    """Fonction utilitaire pour calculer les totaux d'un devis
+    (sur `cur` s'il est fourni, dans la transaction de l'appelant)"""
+    if cur is None:
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            totaux = calculer_totaux_devis(devis_id, cur)
+            conn.commit()
+            cur.close()
+            return totaux
+        except Exception as e:
+            conn.rollback()
+            print(f"Erreur lors de la mise à jour du devis: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    cur.execute("SELECT * FROM devis WHERE id = %s AND supprime_le IS NULL", (devis_id,))
+    devis = cur.fetchone()
     
     if not devis:
         return None
     
-    # Calculer le total depuis les coûts par catégorie
-    couts = db_query("""
-        SELECT SUM(montant_ariary) as total
-        FROM couts_devis
-        WHERE devis_id = %s
-    """, (devis_id,), fetch_one=True)
+    # Somme des services : un seul GROUP BY sur la table de faits lignes_devis (migration v13).
+    # Y sont comptés : hébergements, carburant, visites (entrées parcs et réserves avec guidage compris),
+    # locations hors carburant, locations journalières, guides accompagnateurs et imprévus
+    cur.execute("""
+        SELECT COALESCE(SUM(montant), 0) AS total
+        FROM lignes_devis
+        WHERE devis_id = %s AND dans_total
+    """, (devis_id,))
+    somme_services = ariary(cur.fetchone()['total'])
     
-    # Calculer le total depuis les hébergements
-    hebergements = db_query("""
-        SELECT SUM(COALESCE(prix_ariary, 0) + COALESCE(transfert_htl, 0)) as total
-        FROM hebergements h
-        JOIN jours_voyage jv ON h.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
+    # Appliquer la marge (arrondie à l'ariary)
+    marge_percent = devis.get('marge_percent') or 0
+    total_ariary = appliquer_marge(somme_services, marge_percent)
     
-    # Calculer le total depuis les transferts
-    transferts = db_query("""
-        SELECT SUM(COALESCE(prix_ariary, 0)) as total
-        FROM transferts t
-        JOIN jours_voyage jv ON t.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les locations HORS carburant (prix_ariary seulement)
-    locations_hors_carburant = db_query("""
-        SELECT SUM(COALESCE(prix_ariary, 0)) as total
-        FROM locations_vehicules l
-        JOIN jours_voyage jv ON l.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les guidages
-    guidages = db_query("""
-        SELECT SUM(COALESCE(prix_ariary, 0)) as total
-        FROM guidages g
-        JOIN jours_voyage jv ON g.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les réserves/parcs
-    reserves = db_query("""
-        SELECT SUM(COALESCE(prix_ariary, 0)) as total
-        FROM reserves_parcs r
-        JOIN jours_voyage jv ON r.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les repas
-    repas = db_query("""
-        SELECT SUM(COALESCE(prix_ariary, 0)) as total
-        FROM repas r
-        JOIN jours_voyage jv ON r.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les imprévus
-    imprevus = db_query("""
-        SELECT SUM(COALESCE(prix_ariary, 0)) as total
-        FROM imprevus
-        WHERE devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les visites
-    visites = db_query("""
-        SELECT SUM(COALESCE(prix_total, 0)) as total
-        FROM visites_jour vj
-        JOIN jours_voyage jv ON vj.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis le carburant (locations avec prix_carburant_total)
-    carburant = db_query("""
-        SELECT SUM(COALESCE(prix_carburant_total, 0)) as total
-        FROM locations_vehicules l
-        JOIN jours_voyage jv ON l.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les locations journalières SANS carburant
-    locations_journalieres_sans_carburant = db_query("""
-        SELECT SUM(COALESCE(prix_total, 0)) as total
-        FROM locations_journalieres lj
-        JOIN jours_voyage jv ON lj.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s AND lj.avec_carburant = FALSE
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les locations journalières AVEC carburant
-    locations_journalieres_avec_carburant = db_query("""
-        SELECT SUM(COALESCE(prix_total, 0)) as total
-        FROM locations_journalieres lj
-        JOIN jours_voyage jv ON lj.jour_voyage_id = jv.id
-        WHERE jv.devis_id = %s AND lj.avec_carburant = TRUE
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les réserves/parcs (inclus dans les visites car ils ont guidage obligatoire)
-    # Les réserves/parcs sont déjà inclus dans visites_jour via les visites
-    
-    # Calculer le total depuis les transferts aéroport
-    transferts_aeroport = db_query("""
-        SELECT SUM(COALESCE(prix_total, 0)) as total
-        FROM transferts_aeroport
-        WHERE devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer le total depuis les guides accompagnateurs
-    guides_accompagnateurs = db_query("""
-        SELECT SUM(COALESCE(prix_total, 0)) as total
-        FROM guides_accompagnateurs
-        WHERE devis_id = %s
-    """, (devis_id,), fetch_one=True)
-    
-    # Calculer selon la nouvelle formule :
-    # Prix total hébergement par jour + Total consommation en carburant par jour + 
-    # Total des prix des visites (tous les visites et les entrées parc et réserves avec guidage obligatoire par jour) + 
-    # Total des prix de location hors carburant + location journalière avec carburant + 
-    # Total des prix du guide accompagnateur + la totalité des imprévus
-    
-    total_hebergements = float(hebergements['total']) if hebergements and hebergements['total'] else 0
-    total_carburant = float(carburant['total']) if carburant and carburant['total'] else 0
-    total_visites = float(visites['total']) if visites and visites['total'] else 0
-    total_locations_hors_carburant = float(locations_hors_carburant['total']) if locations_hors_carburant and locations_hors_carburant['total'] else 0
-    total_locations_journalieres_sans_carburant = float(locations_journalieres_sans_carburant['total']) if locations_journalieres_sans_carburant and locations_journalieres_sans_carburant['total'] else 0
-    total_locations_journalieres_avec_carburant = float(locations_journalieres_avec_carburant['total']) if locations_journalieres_avec_carburant and locations_journalieres_avec_carburant['total'] else 0
-    total_guides_accompagnateurs = float(guides_accompagnateurs['total']) if guides_accompagnateurs and guides_accompagnateurs['total'] else 0
-    total_imprevus = float(imprevus['total']) if imprevus and imprevus['total'] else 0
-    
-    # Somme de tous les services selon la formule demandée
-    somme_services = (
-        total_hebergements +  # Prix total hébergement par jour
-        total_carburant +  # Total consommation en carburant par jour
-        total_visites +  # Total des prix des visites (tous les visites et les entrées parc et réserves avec guidage obligatoire par jour)
-        total_locations_hors_carburant +  # Total des prix de location hors carburant
-        total_locations_journalieres_sans_carburant +  # Location journalière sans carburant
-        total_locations_journalieres_avec_carburant +  # Location journalière avec carburant
-        total_guides_accompagnateurs +  # Total des prix du guide accompagnateur
-        total_imprevus  # La totalité des imprévus
-    )
-    
-    # Appliquer la marge
-    marge_percent = float(devis.get('marge_percent', 0) or 0)
-    if marge_percent > 0:
-        total_ariary = somme_services * (1 + marge_percent / 100)
-    else:
-        total_ariary = somme_services
-    
-    # Calculer le total en Euro
-    taux_change = float(devis['taux_change'])
-    total_euro = total_ariary / taux_change if taux_change else 0
+    # Calculer le total en Euro (centimes entiers, convertis une seule fois)
+    taux_change = devis['taux_change']
+    total_euro_centimes = centimes_euro(total_ariary, taux_change)
     
     # Calculer la marge en Ariary
     marge_ariary = total_ariary - somme_services
     
     # Mettre à jour le devis
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-                UPDATE devis
-                SET total_ariary = %s, total_euro = %s, marge = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (total_ariary, total_euro, marge_ariary, devis_id))
-            conn.commit()
-            cur.close()
-        except Exception as e:
-            conn.rollback()
-            print(f"Erreur lors de la mise à jour du devis: {e}")
-        finally:
-            conn.close()
+    cur.execute("""
+        UPDATE devis
+        SET total_ariary = %s, total_euro = %s, marge = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    """, (total_ariary, euros(total_euro_centimes), marge_ariary, devis_id))
     
     return {
         'total_ariary': total_ariary,
-        'total_euro': round(total_euro, 2),
-        'taux_change': taux_change,
-        'marge_percent': marge_percent,
+        'total_euro': float(euros(total_euro_centimes)),
+        'total_euro_centimes': total_euro_centimes,
+        'taux_change': float(taux_change),
+        'marge_percent': float(marge_percent),
         'marge_ariary': marge_ariary,
         'somme_services': somme_services
     }
 
 @app.route('/api/devis/<int:devis_id>/calculer', methods=['POST'])
+@brouillon_requis
 def calculer_devis(devis_id):
     """Calcule les totaux d'un devis (API endpoint)"""
     result = calculer_totaux_devis(devis_id)
@@ -1198,6 +1401,362 @@ def calculer_devis(devis_id):
     
     return jsonify(result)
 
+@app.route('/api/devis/<int:devis_id>/synthese', methods=['GET'])
+def synthese_devis(devis_id):
+    """Montants d'un devis par catégorie et par jour (un GROUP BY sur lignes_devis)"""
+    lignes = db_query("""
+        SELECT GROUPING(categorie) AS par_jour, categorie, numero_jour,
+               SUM(montant) AS montant, SUM(montant) FILTER (WHERE dans_total) AS montant_services
+        FROM lignes_devis
+        WHERE devis_id = %s
+        GROUP BY GROUPING SETS ((categorie), (numero_jour))
+        ORDER BY numero_jour NULLS FIRST, categorie
+    """, (devis_id,), fetch_all=True)
+
+    if lignes is None:
+        return jsonify({'error': 'Erreur lors du calcul de la synthèse'}), 500
+
+    return jsonify({
+        'par_categorie': [{
+            'categorie': l['categorie'],
+            'montant': ariary(l['montant']),
+            'montant_services': ariary(l['montant_services'])
+        } for l in lignes if not l['par_jour']],
+        'par_jour': [{
+            'numero_jour': l['numero_jour'],
+            'montant': ariary(l['montant']),
+            'montant_services': ariary(l['montant_services'])
+        } for l in lignes if l['par_jour']]
+    })
+
+@app.route('/api/devis/<int:devis_id>/finaliser', methods=['POST'])
+def finaliser_devis(devis_id):
+    """Fige un devis brouillon dans un instantané JSONB et change son statut (envoyé par défaut)"""
+    data = request.get_json(silent=True) or {}
+    statut = data.get('statut', 'envoyé')
+    
+    if statut not in STATUTS_FINAUX:
+        return jsonify({'error': f"Statut invalide (attendu: {', '.join(STATUTS_FINAUX)})"}), 400
+    
+    enregistrer_version_initiale(devis_id)
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Erreur de connexion à la base de données'}), 500
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Devis verrouillé jusqu'au commit : l'instantané est lu dans la même transaction que le changement
+        # de statut, aucune modification de ses lignes ne peut s'intercaler
+        cur.execute("""
+            SELECT d.*, c.nom as client_nom, c.reference as client_ref,
+                   c.email, c.telephone
+            FROM devis d
+            LEFT JOIN clients c ON d.client_id = c.id
+            WHERE d.id = %s AND d.supprime_le IS NULL
+            FOR UPDATE OF d
+        """, (devis_id,))
+        devis = cur.fetchone()
+        
+        if not devis:
+            conn.rollback()
+            return jsonify({'error': 'Devis non trouvé'}), 404
+        
+        cur.execute("UPDATE devis SET statut = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s", (statut, devis_id))
+        
+        # Déjà figé : seul le statut change (envoyé -> accepté / refusé), l'instantané est conservé
+        if (devis['statut'] or 'brouillon') != 'brouillon':
+            conn.commit()
+            cur.close()
+            enregistrer_version(devis_id)
+            return jsonify({'success': True, 'statut': statut, 'instantane': False})
+        
+        # Totaux à jour, puis contenu complet (noms et prix du catalogue tels qu'enregistrés dans les lignes)
+        totaux = calculer_totaux_devis(devis_id, cur)
+        devis.update(total_ariary=totaux['total_ariary'], total_euro=totaux['total_euro'],
+                     marge=totaux['marge_ariary'], statut=statut)
+        contenu = charger_contenu_devis(devis, cur)
+        contenu['totaux'] = totaux
+        
+        cur.execute("""
+            INSERT INTO devis_figes (devis_id, contenu, total_ariary, total_euro)
+            VALUES (%s, %s::jsonb, %s, %s)
+            ON CONFLICT (devis_id) DO UPDATE SET
+                contenu = EXCLUDED.contenu,
+                total_ariary = EXCLUDED.total_ariary,
+                total_euro = EXCLUDED.total_euro,
+                fige_le = CURRENT_TIMESTAMP
+        """, (devis_id, json.dumps(contenu, default=valeur_json), totaux['total_ariary'],
+              euros(totaux['total_euro_centimes'])))
+        conn.commit()
+        cur.close()
+        enregistrer_version(devis_id)
+        
+        return jsonify({'success': True, 'statut': statut, 'instantane': True, **totaux})
+    except Exception as e:
+        conn.rollback()
+        print(f"Erreur lors de la finalisation du devis: {e}")
+        return jsonify({'error': f'Erreur lors de la finalisation: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/devis/<int:devis_id>/rouvrir', methods=['POST'])
+def rouvrir_devis(devis_id):
+    """Repasse un devis finalisé en brouillon et supprime son instantané"""
+    enregistrer_version_initiale(devis_id)
+    
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Erreur de connexion à la base de données'}), 500
+    
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE devis SET statut = 'brouillon', updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND supprime_le IS NULL
+        """, (devis_id,))
+        if not cur.rowcount:
+            conn.rollback()
+            return jsonify({'error': 'Devis non trouvé'}), 404
+        cur.execute("DELETE FROM devis_figes WHERE devis_id = %s", (devis_id,))
+        conn.commit()
+        cur.close()
+        enregistrer_version(devis_id)
+        return jsonify({'success': True, 'statut': 'brouillon'})
+    except Exception as e:
+        conn.rollback()
+        print(f"Erreur lors de la réouverture du devis: {e}")
+        return jsonify({'error': f'Erreur lors de la réouverture: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/devis/<int:devis_id>/instantane', methods=['GET'])
+def instantane_devis(devis_id):
+    """Contenu figé d'un devis finalisé (une lecture par clé primaire)"""
+    fige = db_query("""
+        SELECT f.contenu, f.fige_le
+        FROM devis_figes f
+        JOIN devis d ON d.id = f.devis_id
+        WHERE f.devis_id = %s AND d.supprime_le IS NULL
+    """, (devis_id,), fetch_one=True)
+    
+    if not fige:
+        return jsonify({'error': 'Aucun instantané pour ce devis'}), 404
+    
+    return jsonify({'fige_le': fige['fige_le'].isoformat(), **fige['contenu']})
+
+# Historique des versions (versions_devis, migration v18) : lignes versionnées, parents d'abord,
+# rattachées au devis ('devis') ou à un jour ('jour') ; lignes_devis et devis_figes en sont dérivées
+TABLES_VERSIONNEES = [
+    ('jours_voyage', 'devis'),
+    ('couts_devis', 'devis'),
+    ('imprevus', 'devis'),
+    ('transferts_aeroport', 'devis'),
+    ('guides_accompagnateurs', 'devis'),
+    ('transferts', 'jour'),
+    ('locations_vehicules', 'jour'),
+    ('guidages', 'jour'),
+    ('reserves_parcs', 'jour'),
+    ('hebergements', 'jour'),
+    ('repas', 'jour'),
+    ('visites_jour', 'jour'),
+    ('locations_journalieres', 'jour'),
+]
+
+# Identité d'une ligne dans l'historique : colonnes métier stables (les id sont recréés à chaque enregistrement
+# du formulaire), complétées par le rang parmi les lignes de même identité du jour (ou du devis)
+IDENTITES_LIGNES = {
+    'couts_devis': ('categorie_id',),
+    'imprevus': ('description',),
+    'transferts_aeroport': ('type_transfert',),
+    'guides_accompagnateurs': (),
+    'transferts': ('type_transfert',),
+    'locations_vehicules': ('type_voiture_id', 'type_location'),
+    'guidages': ('type_guidage',),
+    'reserves_parcs': ('nom_reserve', 'nom_parc'),
+    'hebergements': ('hotel_id', 'type_chambre'),
+    'repas': ('type_repas',),
+    'visites_jour': ('visite_id',),
+    'locations_journalieres': ('type_location_id', 'avec_carburant'),
+}
+
+# Colonnes recréées à chaque enregistrement, sans valeur métier
+COLONNES_TECHNIQUES = {'id', 'devis_id', 'jour_voyage_id', 'created_at', 'updated_at', 'supprime_le'}
+
+# Verrou consultatif (avec l'id du devis) : une seule nouvelle version à la fois par devis
+CLE_VERROU_VERSIONS = 7_201_050
+
+def etat_devis(cur, devis_id):
+    """État versionné d'un devis {clé de ligne: colonnes métier}, clés stables (IDENTITES_LIGNES), sans les id"""
+    cur.execute("SELECT * FROM devis WHERE id = %s", (devis_id,))
+    devis = cur.fetchone()
+    if not devis:
+        return None
+
+    def colonnes(ligne):
+        return {col: val for col, val in ligne.items() if col not in COLONNES_TECHNIQUES}
+
+    def cle_stable(prefixe, table, ligne, rangs):
+        identite = "|".join(str(ligne.get(col)) for col in IDENTITES_LIGNES[table])
+        cle = f"{prefixe}/{identite}"
+        rangs[cle] = rangs.get(cle, -1) + 1
+        return f"{cle}/{rangs[cle]}"
+
+    etat = {'devis': colonnes(devis)}
+    for table, rattachement in TABLES_VERSIONNEES:
+        rangs = {}
+        if rattachement == 'jour':
+            cur.execute(f"""
+                SELECT jv.numero_jour AS numero_jour_devis, t.*
+                FROM {table} t
+                JOIN jours_voyage jv ON jv.id = t.jour_voyage_id
+                WHERE jv.devis_id = %s
+                ORDER BY jv.numero_jour, t.id
+            """, (devis_id,))
+            for ligne in cur.fetchall():
+                jour = ligne.pop('numero_jour_devis')
+                etat[cle_stable(f"{table}/{jour}", table, ligne, rangs)] = colonnes(ligne)
+        else:
+            cur.execute(f"SELECT * FROM {table} WHERE devis_id = %s ORDER BY id", (devis_id,))
+            for ligne in cur.fetchall():
+                if table == 'jours_voyage':
+                    etat[f"jours_voyage/{ligne['numero_jour']}"] = colonnes(ligne)
+                else:
+                    etat[cle_stable(table, table, ligne, rangs)] = colonnes(ligne)
+    # Même représentation que le JSONB relu (montants en nombres, dates ISO)
+    return json.loads(json.dumps(etat, default=valeur_json))
+
+def reconstruire_version(cur, devis_id, version):
+    """État d'une version : dernier point de reprise complet puis deltas jusqu'à la version"""
+    cur.execute("""
+        SELECT complet, contenu
+        FROM versions_devis
+        WHERE devis_id = %(devis_id)s AND version <= %(version)s
+          AND version >= (SELECT MAX(version) FROM versions_devis
+                          WHERE devis_id = %(devis_id)s AND version <= %(version)s AND complet)
+        ORDER BY version
+    """, {'devis_id': devis_id, 'version': version})
+    versions = cur.fetchall()
+    return reconstruire([(v['complet'], v['contenu']) for v in versions]) if versions else None
+
+def enregistrer_version(devis_id):
+    """Ajoute une version si le devis a changé depuis la précédente ; retourne le numéro de la dernière version"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (CLE_VERROU_VERSIONS, devis_id))
+        etat = etat_devis(cur, devis_id)
+        if etat is None:
+            conn.rollback()
+            return None
+
+        cur.execute("SELECT MAX(version) AS version FROM versions_devis WHERE devis_id = %s", (devis_id,))
+        derniere = cur.fetchone()['version']
+        precedent = reconstruire_version(cur, devis_id, derniere) if derniere else None
+        delta = difference(precedent or {}, etat)
+        if precedent is not None and est_vide(delta):
+            conn.rollback()
+            return derniere
+
+        version = (derniere or 0) + 1
+        complet = precedent is None or est_point_de_reprise(version)
+        cur.execute("""
+            INSERT INTO versions_devis (devis_id, version, complet, contenu, lignes_modifiees)
+            VALUES (%s, %s, %s, %s::jsonb, %s)
+        """, (devis_id, version, complet, json.dumps(etat if complet else delta), taille(delta)))
+        conn.commit()
+        cur.close()
+        return version
+    except Exception as e:
+        conn.rollback()
+        print(f"Erreur lors de l'enregistrement de la version du devis: {e}")
+        return None
+    finally:
+        conn.close()
+
+def enregistrer_version_initiale(devis_id):
+    """Enregistre l'état actuel d'un devis encore sans version (créé avant la migration v18) avant de le modifier"""
+    if not db_query("SELECT 1 FROM versions_devis WHERE devis_id = %s LIMIT 1", (devis_id,), fetch_one=True):
+        enregistrer_version(devis_id)
+
+def lire_versions(devis_id, *numeros):
+    """États reconstruits de plusieurs versions d'un devis (None pour une version absente)"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        etats = [reconstruire_version(cur, devis_id, numero) for numero in numeros]
+        conn.rollback()
+        cur.close()
+        return etats
+    finally:
+        conn.close()
+
+@app.route('/api/devis/<int:devis_id>/versions', methods=['GET'])
+def api_versions_devis(devis_id):
+    """Liste des versions d'un devis (taille stockée de chacune)"""
+    versions = db_query("""
+        SELECT version, complet, lignes_modifiees, pg_column_size(contenu) AS taille_octets, cree_le
+        FROM versions_devis
+        WHERE devis_id = %s
+        ORDER BY version
+    """, (devis_id,), fetch_all=True)
+
+    return jsonify([{
+        'version': v['version'],
+        'complet': v['complet'],
+        'lignes_modifiees': v['lignes_modifiees'],
+        'taille_octets': v['taille_octets'],
+        'cree_le': v['cree_le'].isoformat()
+    } for v in (versions or [])])
+
+@app.route('/api/devis/<int:devis_id>/versions', methods=['POST'])
+def api_enregistrer_version(devis_id):
+    """Enregistre une version du devis (aucune si rien n'a changé)"""
+    version = enregistrer_version(devis_id)
+
+    if version is None:
+        return jsonify({'error': 'Devis non trouvé ou erreur lors de l\'enregistrement'}), 404
+
+    return jsonify({'success': True, 'version': version})
+
+@app.route('/api/devis/<int:devis_id>/versions/<int:version>', methods=['GET'])
+def api_version_devis(devis_id, version):
+    """État complet d'une version, reconstruit depuis le dernier point de reprise"""
+    etats = lire_versions(devis_id, version)
+
+    if not etats or etats[0] is None:
+        return jsonify({'error': 'Version non trouvée'}), 404
+
+    return jsonify({'version': version, 'lignes': etats[0]})
+
+@app.route('/api/devis/<int:devis_id>/versions/<int:version_a>/diff/<int:version_b>', methods=['GET'])
+def api_diff_versions_devis(devis_id, version_a, version_b):
+    """Différences entre deux versions (lignes ajoutées, colonnes modifiées, lignes supprimées)"""
+    etats = lire_versions(devis_id, version_a, version_b)
+
+    if not etats or None in etats:
+        return jsonify({'error': 'Version non trouvée'}), 404
+
+    delta = difference(etats[0], etats[1])
+    modifie = {cle: {col: {'avant': etats[0][cle].get(col), 'apres': val} for col, val in colonnes.items()}
+               for cle, colonnes in delta['modifie'].items()}
+    for cle, colonnes in delta['retire'].items():
+        modifie.setdefault(cle, {}).update({col: {'avant': etats[0][cle][col], 'apres': None} for col in colonnes})
+    return jsonify({
+        'de': version_a,
+        'a': version_b,
+        'ajoute': delta['ajoute'],
+        'modifie': modifie,
+        'supprime': {cle: etats[0][cle] for cle in delta['supprime']},
+        'lignes_modifiees': taille(delta)
+    })
+
 @app.route('/api/types_locations_journalieres', methods=['GET'])
 def api_types_locations_journalieres():
     """Retourne la liste des types de locations journalières"""
@@ -1216,6 +1775,8 @@ def api_types_locations_journalieres():
     } for t in (types or [])])
 
 @app.route('/api/devis/<int:devis_id>/transfert_aeroport', methods=['POST'])
+@brouillon_requis
+@versionnee
 def ajouter_transfert_aeroport(devis_id):
     """Ajoute un transfert aéroport au devis"""
     data = request.get_json()
@@ -1225,9 +1786,9 @@ def ajouter_transfert_aeroport(devis_id):
     
     # Lire le prix depuis la base de données
     config = db_query("SELECT valeur FROM config_prix WHERE cle = 'transfert_aeroport_par_trajet'", fetch_one=True)
-    prix_par_trajet = float(config['valeur']) if config else 250000  # Prix par défaut si non trouvé
+    prix_par_trajet = ariary(config['valeur']) if config else 250000  # Prix par défaut si non trouvé
     
-    prix_total = prix_par_trajet * nombre_trajets
+    prix_total = montant(prix_par_trajet, nombre_trajets)
     
     result = db_query("""
         INSERT INTO transferts_aeroport (devis_id, type_transfert, nombre_trajets, prix_par_trajet, prix_total)
@@ -1242,6 +1803,8 @@ def ajouter_transfert_aeroport(devis_id):
         return jsonify({'error': 'Erreur lors de l\'ajout du transfert'}), 500
 
 @app.route('/api/devis/<int:devis_id>/guide_accompagnateur', methods=['POST'])
+@brouillon_requis
+@versionnee
 def ajouter_guide_accompagnateur(devis_id):
     """Ajoute un guide accompagnateur au devis"""
     data = request.get_json()
@@ -1251,13 +1814,14 @@ def ajouter_guide_accompagnateur(devis_id):
     
     # Lire le prix depuis la base de données
     config = db_query("SELECT valeur FROM config_prix WHERE cle = 'guide_accompagnateur_par_jour'", fetch_one=True)
-    prix_par_jour = float(config['valeur']) if config else 280000  # Prix par défaut si non trouvé
+    prix_par_jour = ariary(config['valeur']) if config else 280000  # Prix par défaut si non trouvé
     
-    prix_total = prix_par_jour * nombre_guides * nombre_jours
+    prix_total = montant(prix_par_jour, nombre_guides, nombre_jours)
     
     result = db_query("""
-        INSERT INTO guides_accompagnateurs (devis_id, nombre_guides, nombre_jours, prix_par_jour, prix_total)
-        VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO guides_accompagnateurs (devis_id, nombre_guides, nombre_jours, prix_par_jour, prix_total,
+                                            prix_catalogue)
+        VALUES (%s, %s, %s, %s, %s, TRUE)
         RETURNING id
     """, (devis_id, nombre_guides, nombre_jours, prix_par_jour, prix_total), fetch_one=True)
     
@@ -1268,6 +1832,8 @@ def ajouter_guide_accompagnateur(devis_id):
         return jsonify({'error': 'Erreur lors de l\'ajout du guide'}), 500
 
 @app.route('/api/devis/<int:devis_id>/jours/<int:jour_id>/location_journaliere', methods=['POST'])
+@brouillon_requis
+@versionnee
 def ajouter_location_journaliere(devis_id, jour_id):
     """Ajoute une location journalière à un jour de voyage"""
     data = request.get_json()
@@ -1290,11 +1856,11 @@ def ajouter_location_journaliere(devis_id, jour_id):
         return jsonify({'error': 'Type de location non trouvé'}), 404
     
     if avec_carburant:
-        prix_journalier = float(type_location['prix_journalier_avec_carburant'])
+        prix_journalier = type_location['prix_journalier_avec_carburant']
     else:
-        prix_journalier = float(type_location['prix_journalier_sans_carburant'])
+        prix_journalier = type_location['prix_journalier_sans_carburant']
     
-    prix_total = prix_journalier * nombre_vehicules * nombre_jours
+    prix_total = montant(prix_journalier, nombre_vehicules, nombre_jours)
     
     result = db_query("""
         INSERT INTO locations_journalieres (
@@ -1312,34 +1878,81 @@ def ajouter_location_journaliere(devis_id, jour_id):
 
 @app.route('/api/devis/<int:devis_id>', methods=['DELETE'])
 def supprimer_devis(devis_id):
-    """Supprime un devis et toutes ses données associées"""
-    # Vérifier que le devis existe
-    devis = db_query("SELECT id, reference FROM devis WHERE id = %s", (devis_id,), fetch_one=True)
+    """Supprime un devis : marqué supprimé tout de suite, lignes purgées ensuite par database/purger_devis.py"""
+    devis = db_query("""
+        UPDATE devis SET supprime_le = CURRENT_TIMESTAMP
+        WHERE id = %s AND supprime_le IS NULL
+        RETURNING reference
+    """, (devis_id,), fetch_one=True)
     
     if not devis:
         return jsonify({'error': 'Devis non trouvé'}), 404
     
-    # Supprimer le devis (les données associées seront supprimées automatiquement grâce à ON DELETE CASCADE)
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Erreur de connexion à la base de données'}), 500
+    return jsonify({
+        'success': True,
+        'message': f'Devis "{devis["reference"]}" supprimé avec succès'
+    })
+
+# Filtres de la suppression en masse : clé JSON -> condition SQL
+FILTRES_SUPPRESSION = {
+    'statut': "COALESCE(statut, 'brouillon') = %s",
+    'client_id': "client_id = %s",
+    'cote_avant': "date_cotation < %s",
+    'cree_avant': "created_at < %s",
+    'reference': "reference LIKE %s ESCAPE '\\'",
+}
+
+def prefixe_like(texte):
+    """Motif LIKE d'un préfixe pris littéralement (\\, % et _ échappés)"""
+    return str(texte).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def admin_requis(vue):
+    """Réserve un endpoint aux appels portant l'en-tête X-Admin-Token (variable ADMIN_TOKEN)"""
+    @wraps(vue)
+    def verifiee(*args, **kwargs):
+        jeton = os.environ.get('ADMIN_TOKEN')
+        fourni = request.headers.get('X-Admin-Token', '')
+        if not jeton or not hmac.compare_digest(fourni.encode('utf-8'), jeton.encode('utf-8')):
+            return jsonify({'error': 'Accès administrateur requis'}), 403
+        return vue(*args, **kwargs)
+    return verifiee
+
+@app.route('/api/admin/devis/supprimer', methods=['POST'])
+@admin_requis
+def supprimer_devis_en_masse():
+    """Marque supprimés tous les devis d'un filtre (statut, client_id, cote_avant, cree_avant, reference)"""
+    data = request.get_json() or {}
+    filtres = {cle: data[cle] for cle in FILTRES_SUPPRESSION if data.get(cle) not in (None, '')}
+    
+    if not filtres:
+        return jsonify({'error': 'Au moins un filtre est requis'}), 400
+    
+    conditions = " AND ".join(FILTRES_SUPPRESSION[cle] for cle in filtres)
+    params = tuple(prefixe_like(valeur) if cle == 'reference' else valeur for cle, valeur in filtres.items())
+    
+    if data.get('simulation'):
+        resultat = db_query(f"""
+            SELECT COUNT(*) AS nombre FROM devis WHERE supprime_le IS NULL AND {conditions}
+        """, params, fetch_one=True)
+        if resultat is None:
+            return jsonify({'error': 'Erreur lors du comptage des devis'}), 500
+        return jsonify({'simulation': True, 'nombre_devis': resultat['nombre'], 'filtres': filtres})
+    
+    devis = db_query(f"""
+        UPDATE devis SET supprime_le = CURRENT_TIMESTAMP
+        WHERE supprime_le IS NULL AND {conditions}
+        RETURNING id
+    """, params, fetch_all=True)
     
-    try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM devis WHERE id = %s", (devis_id,))
-        conn.commit()
-        cur.close()
-        
-        return jsonify({
-            'success': True,
-            'message': f'Devis "{devis["reference"]}" supprimé avec succès'
-        })
-    except Exception as e:
-        conn.rollback()
-        print(f"Erreur lors de la suppression du devis: {e}")
-        return jsonify({'error': f'Erreur lors de la suppression: {str(e)}'}), 500
-    finally:
-        conn.close()
+    if devis is None:
+        return jsonify({'error': 'Erreur lors de la suppression des devis'}), 500
+    
+    return jsonify({
+        'success': True,
+        'nombre_devis': len(devis),
+        'devis_ids': [d['id'] for d in devis],
+        'filtres': filtres
+    })
 
 @app.route('/api/config_prix', methods=['GET'])
 def api_config_prix():
@@ -1357,6 +1970,609 @@ def api_config_prix():
     
     return jsonify(result)
 
+@app.route('/api/taux_change', methods=['GET'])
+def api_taux_change():
+    """Retourne le taux de change en vigueur à une date (?date=AAAA-MM-JJ)"""
+    jour = request.args.get('date')
+    try:
+        jour = datetime.strptime(jour, '%Y-%m-%d').date() if jour else date.today()
+    except ValueError:
+        return jsonify({'error': 'Date invalide (format attendu AAAA-MM-JJ)'}), 400
+
+    return jsonify({'date': jour.isoformat(), 'taux_change': taux_change_a_date(jour)})
+
+@app.route('/api/taux_change', methods=['POST'])
+def publier_taux_change():
+    """Publie un nouveau taux de change et re-convertit les devis ouverts"""
+    data = request.get_json()
+
+    taux = float(data.get('taux', 0) or 0)
+    if taux <= 0:
+        return jsonify({'error': 'Taux de change invalide'}), 400
+    try:
+        date_effet = datetime.strptime(data['date_effet'], '%Y-%m-%d').date() if data.get('date_effet') else date.today()
+    except ValueError:
+        return jsonify({'error': 'Date invalide (format attendu AAAA-MM-JJ)'}), 400
+
+    result = db_query("""
+        INSERT INTO taux_change_historique (date_effet, taux, source)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (date_effet) DO UPDATE SET taux = EXCLUDED.taux, source = EXCLUDED.source
+        RETURNING id, taux
+    """, (date_effet, taux, data.get('source')), fetch_one=True)
+
+    if not result:
+        return jsonify({'error': 'Erreur lors de l\'enregistrement du taux'}), 500
+
+    # Taux tel qu'enregistré (arrondi à l'échelle de la colonne), seul comparable à celui du cache
+    taux = float(result['taux'])
+    charger_taux_change(forcer=True)
+
+    # Seul le taux en vigueur aujourd'hui est appliqué aux devis ouverts
+    devis_reconvertis = 0
+    if data.get('reconvertir', True) and taux_change_a_date() == taux:
+        devis_reconvertis = reconvertir_devis_ouverts(taux)
+        if devis_reconvertis is None:
+            return jsonify({'error': 'Erreur lors de la re-conversion des devis'}), 500
+
+    return jsonify({
+        'success': True,
+        'date_effet': date_effet.isoformat(),
+        'taux_change': taux,
+        'devis_reconvertis': devis_reconvertis
+    })
+
+@app.route('/api/tarifs/itineraire', methods=['POST'])
+def api_tarifer_itineraire():
+    """Retourne les prix en vigueur des hôtels et visites d'un itinéraire complet aux dates réelles"""
+    data = request.get_json()
+    date_depart = data.get('date_depart')
+    jours = data.get('jours', [])
+
+    try:
+        hotels_resolus, visites_resolues = tarifer_itineraire(date_depart, jours)
+    except ValueError:
+        return jsonify({'error': 'Date de départ invalide (format attendu AAAA-MM-JJ)'}), 400
+
+    resultat = []
+    for jour_data in jours:
+        jour_date = date_du_jour(date_depart, jour_data.get('numero_jour'))
+        hotel = hotels_resolus.get((int(jour_data['hotel_id']), jour_date)) if jour_data.get('hotel_id') else None
+        visites = [visites_resolues.get((int(v['visite_id']), jour_date))
+                   for v in visites_du_jour(jour_data) if isinstance(v, dict) and v.get('visite_id')]
+        resultat.append({
+            'numero_jour': jour_data.get('numero_jour'),
+            'date': jour_date.isoformat() if jour_date else None,
+            'hotel': {
+                'id': hotel['entite_id'],
+                'nom': hotel['nom'],
+                'prix_double': float(hotel['prix_double'] or 0),
+                'prix_triple': float(hotel['prix_triple'] or 0),
+                'periode': hotel['periode']
+            } if hotel else None,
+            'visites': [{
+                'id': v['id'],
+                'nom': v['nom'],
+                'prix_par_personne': float(v['prix_par_personne'] or 0),
+                'prix_par_voiture': float(v['prix_par_voiture'] or 0),
+                'guidage_prix_base': float(v['guidage_prix_base'] or 0),
+                'taxe_communale': float(v['taxe_communale'] or 0),
+                'periode': v['periode']
+            } for v in visites if v]
+        })
+
+    return jsonify(resultat)
+
+# Colonnes de prix modifiables par période, par entité du catalogue
+COLONNES_PERIODES_PRIX = {
+    'hotels': ('periodes_prix_hotels', 'hotel_id', ('prix_double', 'prix_triple')),
+    'visites': ('periodes_prix_visites', 'visite_id',
+                ('prix_par_personne', 'prix_par_voiture', 'guidage_prix_base', 'taxe_communale')),
+}
+
+@app.route('/api/<any(hotels, visites):entite>/<int:entite_id>/periodes', methods=['GET'])
+def api_periodes_prix(entite, entite_id):
+    """Retourne les périodes de prix d'un hôtel ou d'une visite"""
+    table, colonne_id, colonnes_prix = COLONNES_PERIODES_PRIX[entite]
+    periodes = db_query(f"""
+        SELECT id, lower(periode) as debut, upper(periode) as fin, libelle, {', '.join(colonnes_prix)}
+        FROM {table}
+        WHERE {colonne_id} = %s
+        ORDER BY lower(periode)
+    """, (entite_id,), fetch_all=True)
+
+    return jsonify([{
+        'id': p['id'],
+        'debut': p['debut'].isoformat() if p['debut'] else None,
+        'fin': p['fin'].isoformat() if p['fin'] else None,
+        'libelle': p['libelle'],
+        **{col: float(p[col]) if p[col] is not None else None for col in colonnes_prix}
+    } for p in (periodes or [])])
+
+@app.route('/api/<any(hotels, visites):entite>/<int:entite_id>/periodes', methods=['POST'])
+def ajouter_periode_prix(entite, entite_id):
+    """Ajoute une période de prix [debut, fin) à un hôtel ou une visite"""
+    data = request.get_json()
+    table, colonne_id, colonnes_prix = COLONNES_PERIODES_PRIX[entite]
+
+    if not data.get('debut') or not data.get('fin'):
+        return jsonify({'error': 'Début et fin de période requis'}), 400
+
+    valeurs = [data.get(col) for col in colonnes_prix]
+    result = db_query(f"""
+        INSERT INTO {table} ({colonne_id}, periode, libelle, {', '.join(colonnes_prix)})
+        VALUES (%s, daterange(%s, %s), %s, {', '.join(['%s'] * len(colonnes_prix))})
+        RETURNING id
+    """, (entite_id, data['debut'], data['fin'], data.get('libelle'), *valeurs), fetch_one=True)
+
+    if not result:
+        return jsonify({'error': 'Erreur lors de l\'ajout de la période (chevauchement ?)'}), 400
+
+    invalider_prix_saisonniers()
+    return jsonify({'success': True, 'periode_id': result['id']})
+
+@app.route('/api/kilometrage/itineraire', methods=['POST'])
+def api_kilometrage_itineraire():
+    """Calcule le kilométrage journalier d'une suite d'itinéraires"""
+    data = request.get_json()
+    itineraire_ids = [int(i) if i else None for i in data.get('itineraire_ids', [])]
+    itineraire_depart_id = data.get('itineraire_depart_id')
+
+    kilometrages = kilometrages_itineraire(itineraire_ids, int(itineraire_depart_id) if itineraire_depart_id else None)
+
+    return jsonify({
+        'kilometrages': [km or 0 for km in kilometrages],
+        'non_relies': [i for i, km in enumerate(kilometrages) if km is None],
+        'total_km': sum(km or 0 for km in kilometrages)
+    })
+
+@app.route('/api/devis/<int:devis_id>/kilometrage', methods=['POST'])
+@brouillon_requis
+@versionnee
+def remplir_kilometrage_devis(devis_id):
+    """Remplit en une fois le kilométrage et le carburant de tous les jours d'un devis"""
+    data = request.get_json() or {}
+    type_voiture_id = data.get('type_voiture_id')
+    prix_carburant_pompe = data.get('prix_carburant_pompe')
+    prix_carburant_pompe = float(prix_carburant_pompe) if prix_carburant_pompe not in (None, '') else None
+    itineraire_depart_id = data.get('itineraire_depart_id')
+
+    jours = db_query("""
+        SELECT id, numero_jour, itineraire_id FROM jours_voyage
+        WHERE devis_id = %s
+        ORDER BY numero_jour
+    """, (devis_id,), fetch_all=True)
+
+    if not jours:
+        return jsonify({'error': 'Aucun jour de voyage pour ce devis'}), 404
+
+    kilometrages = kilometrages_itineraire([j['itineraire_id'] for j in jours],
+                                           int(itineraire_depart_id) if itineraire_depart_id else None)
+    # Les jours sans chemin connu sont laissés tels quels (kilométrage saisi à la main conservé)
+    connus = [(j['id'], int(round(km))) for j, km in zip(jours, kilometrages) if km is not None]
+    jour_ids = [jour_id for jour_id, _ in connus]
+    kms = [km for _, km in connus]
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Erreur de connexion à la base de données'}), 500
+
+    try:
+        cur = conn.cursor()
+        # Mettre à jour les locations existantes (consommation selon leur type de voiture)
+        cur.execute("""
+            UPDATE locations_vehicules lv
+            SET type_voiture_id = tv.id,
+                kilometrage = k.kilometrage,
+                prix_carburant_pompe = COALESCE(%s, lv.prix_carburant_pompe),
+                consommation_carburant = k.kilometrage * tv.consommation_l_100km / 100,
+                prix_carburant_total = ROUND(k.kilometrage * tv.consommation_l_100km / 100
+                    * (COALESCE(%s, lv.prix_carburant_pompe, 0) + 500))
+            FROM unnest(%s::int[], %s::int[]) AS k(jour_voyage_id, kilometrage), types_voitures tv
+            WHERE lv.jour_voyage_id = k.jour_voyage_id
+              AND tv.id = COALESCE(lv.type_voiture_id, %s)
+        """, (prix_carburant_pompe, prix_carburant_pompe, jour_ids, kms, type_voiture_id))
+        locations_modifiees = cur.rowcount
+
+        # Créer une location pour les jours roulés qui n'en ont pas encore
+        locations_creees = 0
+        if type_voiture_id:
+            cur.execute("""
+                INSERT INTO locations_vehicules (jour_voyage_id, type_voiture_id, type_location,
+                                                nombre_vehicules, prix_ariary, kilometrage,
+                                                consommation_carburant, prix_carburant_pompe, prix_carburant_total)
+                SELECT k.jour_voyage_id, tv.id, 'Location sans carburant', 1, 0, k.kilometrage,
+                       k.kilometrage * tv.consommation_l_100km / 100, %s,
+                       ROUND(k.kilometrage * tv.consommation_l_100km / 100 * (%s + 500))
+                FROM unnest(%s::int[], %s::int[]) AS k(jour_voyage_id, kilometrage)
+                JOIN types_voitures tv ON tv.id = %s
+                WHERE k.kilometrage > 0
+                  AND NOT EXISTS (SELECT 1 FROM locations_vehicules lv WHERE lv.jour_voyage_id = k.jour_voyage_id)
+            """, (prix_carburant_pompe or 0, prix_carburant_pompe or 0, jour_ids, kms, type_voiture_id))
+            locations_creees = cur.rowcount
+
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        conn.rollback()
+        print(f"Erreur lors du calcul du kilométrage: {e}")
+        return jsonify({'error': f'Erreur lors du calcul du kilométrage: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+    calculer_totaux_devis(devis_id)
+
+    return jsonify({
+        'success': True,
+        'jours': [{'numero_jour': j['numero_jour'],
+                   'kilometrage': int(round(km)) if km is not None else None,
+                   'chemin_connu': km is not None}
+                  for j, km in zip(jours, kilometrages)],
+        'total_km': sum(kms),
+        'sans_trajet_connu': [j['numero_jour'] for j, km in zip(jours, kilometrages) if km is None],
+        'locations_modifiees': locations_modifiees,
+        'locations_creees': locations_creees
+    })
+
+# Optimiseur d'hébergement
+DUREE_CACHE_QUANTILES = 300  # secondes
+
+# Gammes de budget : bornes (quantile bas, quantile haut) du prix double par itinéraire
+GAMMES_BUDGET = {
+    'economique': (None, 'p50'),
+    'standard': ('p25', 'p75'),
+    'luxe': ('p50', None),
+}
+
+_cache_quantiles = {'quantiles': {}, 'charge_le': None}
+
+def quantiles_prix_hotels():
+    """Retourne les quantiles de prix précalculés par itinéraire (vue matérialisée, en cache)"""
+    charge_le = _cache_quantiles['charge_le']
+    if charge_le is not None and time.monotonic() - charge_le < DUREE_CACHE_QUANTILES:
+        return _cache_quantiles['quantiles']
+
+    lignes = db_query("SELECT * FROM quantiles_prix_hotels", fetch_all=True)
+    if lignes is not None:
+        _cache_quantiles['quantiles'] = {q['itineraire_id']: q for q in lignes}
+    _cache_quantiles['charge_le'] = time.monotonic()
+    return _cache_quantiles['quantiles']
+
+def dans_gamme(prix_double, quantiles, gamme):
+    """Vérifie qu'un prix double est dans la gamme de budget de son itinéraire"""
+    if not gamme or not quantiles:
+        return True
+    borne_basse, borne_haute = GAMMES_BUDGET[gamme]
+    if borne_basse and prix_double < quantiles[borne_basse]:
+        return False
+    if borne_haute and prix_double > quantiles[borne_haute]:
+        return False
+    return True
+
+def optimiser_hotels(itineraire_ids, nombre_doubles, nombre_triples, gamme=None,
+                     categorie_min=None, meme_hotel=True, date_depart=None):
+    """Choisit l'hôtel de chaque jour minimisant le coût total sous contraintes"""
+    hotels = db_query("""
+        SELECT id, itineraire_id, nom, prix_double, prix_triple, categorie
+        FROM hotels
+        WHERE itineraire_id = ANY(%s) AND actif = TRUE
+    """, (list(set(itineraire_ids)),), fetch_all=True) or []
+    quantiles = quantiles_prix_hotels()
+
+    # Candidats par itinéraire : catégorie minimale puis gamme (relâchée si elle est vide)
+    candidats = {}
+    gammes_relachees = set()
+    for itineraire_id in set(itineraire_ids):
+        eligibles = [h for h in hotels if h['itineraire_id'] == itineraire_id
+                     and (not categorie_min or (h['categorie'] or 0) >= categorie_min)]
+        dans_budget = [h for h in eligibles
+                       if dans_gamme(float(h['prix_double']), quantiles.get(itineraire_id), gamme)]
+        if eligibles and not dans_budget:
+            gammes_relachees.add(itineraire_id)
+        candidats[itineraire_id] = dans_budget or eligibles
+
+    # Prix de chaque candidat à chaque date, résolus en une requête
+    dates = [date_du_jour(date_depart, numero) for numero in range(1, len(itineraire_ids) + 1)]
+    prix = resoudre_prix_saisonniers('hotels', [(h['id'], dates[i])
+                                                for i, itineraire_id in enumerate(itineraire_ids)
+                                                for h in candidats[itineraire_id]])
+
+    def couts_chambres(hotel, jour_date):
+        ligne = prix.get((hotel['id'], jour_date), hotel)
+        prix_double = float(ligne['prix_double'] or 0)
+        prix_triple = float(ligne['prix_triple']) if ligne['prix_triple'] else prix_double
+        return {'Double': prix_double * nombre_doubles, 'Triple': prix_triple * nombre_triples}
+
+    def cout_nuit(hotel, jour_date):
+        return sum(couts_chambres(hotel, jour_date).values())
+
+    # Les nuits consécutives sur un même itinéraire forment un bloc au même hôtel :
+    # le coût étant additif, le meilleur hôtel de chaque bloc donne l'optimum global
+    blocs = []
+    for i, itineraire_id in enumerate(itineraire_ids):
+        if meme_hotel and blocs and itineraire_ids[blocs[-1][-1]] == itineraire_id:
+            blocs[-1].append(i)
+        else:
+            blocs.append([i])
+
+    choix = [None] * len(itineraire_ids)
+    for bloc in blocs:
+        options = candidats[itineraire_ids[bloc[0]]]
+        if not options:
+            continue
+        meilleur = min(options, key=lambda h: sum(cout_nuit(h, dates[i]) for i in bloc))
+        for i in bloc:
+            choix[i] = (meilleur, couts_chambres(meilleur, dates[i]))
+
+    return choix, dates, gammes_relachees
+
+@app.route('/api/optimiser_hotels', methods=['POST'])
+def api_optimiser_hotels():
+    """Propose l'hébergement le moins cher pour une suite d'itinéraires (format des jours[] du devis)"""
+    data = request.get_json() or {}
+
+    itineraire_ids = [int(i) for i in data.get('itineraire_ids', []) if i]
+    if not itineraire_ids:
+        return jsonify({'error': 'Suite d\'itinéraires requise'}), 400
+
+    gamme = data.get('gamme')
+    if gamme and gamme not in GAMMES_BUDGET:
+        return jsonify({'error': f'Gamme inconnue (valeurs possibles: {", ".join(GAMMES_BUDGET)})'}), 400
+
+    # Répartition des chambres : par défaut des doubles pour tous les voyageurs
+    nb_personnes = int(data.get('nb_personnes', 0) or 0)
+    nombre_doubles = int(data.get('nombre_doubles', 0) or 0)
+    nombre_triples = int(data.get('nombre_triples', 0) or 0)
+    if not nombre_doubles and not nombre_triples:
+        nombre_doubles = max((nb_personnes + 1) // 2, 1)
+
+    plafond = float(data['plafond']) if data.get('plafond') else None
+    categorie_min = int(data['categorie_min']) if data.get('categorie_min') else None
+
+    # Avec un plafond, on retient la meilleure gamme dont le coût total tient sous le plafond
+    # (en descendant depuis la gamme demandée, ou depuis la plus haute), sinon la solution la moins chère
+    essais = [gamme]
+    if plafond is not None:
+        ordre = list(GAMMES_BUDGET)
+        depart = ordre.index(gamme) if gamme else len(ordre) - 1
+        essais = ordre[depart::-1] + [None]
+
+    try:
+        for gamme_retenue in essais:
+            choix, dates, gammes_relachees = optimiser_hotels(
+                itineraire_ids, nombre_doubles, nombre_triples, gamme=gamme_retenue,
+                categorie_min=categorie_min, meme_hotel=data.get('meme_hotel', True),
+                date_depart=data.get('date_depart'))
+            total = sum(sum(c[1].values()) for c in choix if c)
+            if plafond is None or total <= plafond:
+                break
+    except ValueError:
+        return jsonify({'error': 'Date de départ invalide (format attendu AAAA-MM-JJ)'}), 400
+
+    # Un hébergement par type de chambre, au format des jours[] acceptés par nouveau_devis
+    chambres = [(type_chambre, nombre) for type_chambre, nombre in (('Double', nombre_doubles),
+                                                                   ('Triple', nombre_triples)) if nombre]
+    jours = []
+    for i, itineraire_id in enumerate(itineraire_ids):
+        hotel, couts = choix[i] if choix[i] else (None, {})
+        jours.append({
+            'numero_jour': i + 1,
+            'itineraire_id': itineraire_id,
+            'date_jour': dates[i].day if dates[i] else None,
+            'hotel_id': hotel['id'] if hotel else None,
+            'hotel_nom': hotel['nom'] if hotel else None,
+            'hebergements': [{
+                'hotel_id': hotel['id'],
+                'type_chambre': type_chambre,
+                'nombre_chambres': nombre,
+                'transfert_htl': 0,
+                'prix_ariary': couts[type_chambre]
+            } for type_chambre, nombre in chambres] if hotel else [],
+            'prix_hebergement': sum(couts.values()),
+            'visites': []
+        })
+
+    return jsonify({
+        'jours': jours,
+        'total_hebergement': total,
+        'gamme_retenue': gamme_retenue,
+        'respecte_plafond': plafond is None or total <= plafond,
+        'itineraires_sans_hotel': sorted({j['itineraire_id'] for j in jours if not j['hotel_id']}),
+        'gammes_relachees': sorted(gammes_relachees)
+    })
+
+# Re-tarification des lignes de devis après un changement de prix du catalogue
+# entité du catalogue -> (table des lignes, vue des prix attendus, colonnes recalculées)
+LIGNES_PAR_ENTITE = {
+    'hotels': ('hebergements', 'prix_attendus_hebergements', ('prix_ariary',)),
+    'visites': ('visites_jour', 'prix_attendus_visites_jour',
+                ('prix_entree', 'prix_guidage', 'prix_taxe_communale', 'prix_total')),
+    'types_voitures': ('locations_vehicules', 'prix_attendus_locations_vehicules',
+                       ('consommation_carburant', 'prix_carburant_total')),
+    'types_locations_journalieres': ('locations_journalieres', 'prix_attendus_locations_journalieres',
+                                     ('prix_total',)),
+}
+
+# clé de config_prix -> (table des lignes, vue des prix attendus, colonnes recalculées)
+LIGNES_PAR_CLE_CONFIG = {
+    'transfert_aeroport_par_trajet': ('transferts_aeroport', 'prix_attendus_transferts_aeroport',
+                                      ('prix_par_trajet', 'prix_total')),
+    'guide_accompagnateur_par_jour': ('guides_accompagnateurs', 'prix_attendus_guides_accompagnateurs',
+                                      ('prix_par_jour', 'prix_total')),
+}
+
+def retarifer_lignes(cur, table, vue, colonnes, devis_ids, entite_ids=None):
+    """Remplace les prix des lignes par les prix attendus du catalogue actuel"""
+    affectations = ', '.join(f"{col} = a.{col}" for col in colonnes)
+    if entite_ids is None:
+        cur.execute(f"""
+            UPDATE {table} t SET {affectations}
+            FROM {vue} a
+            WHERE a.id = t.id AND a.devis_id = ANY(%s)
+        """, (devis_ids,))
+    else:
+        # Seules les paires (devis, entité) signalées sont re-tarifées
+        cur.execute(f"""
+            UPDATE {table} t SET {affectations}
+            FROM {vue} a
+            WHERE a.id = t.id
+              AND (a.devis_id, a.entite_id) IN (SELECT * FROM unnest(%s::int[], %s::int[]))
+        """, (devis_ids, entite_ids))
+    return cur.rowcount
+
+def recalculer_devis_impactes():
+    """
+    Traite la file des devis impactés : re-tarifie les lignes des devis brouillon, recalcule leurs totaux
+    et ne retire de la file que les signalements traités avec succès
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Un devis finalisé depuis son signalement garde les totaux de son instantané (devis_figes) :
+        # son signalement est retiré sans recalcul
+        cur.execute("""
+            DELETE FROM devis_a_recalculer f
+            USING devis d
+            WHERE d.id = f.devis_id AND COALESCE(d.statut, 'brouillon') <> 'brouillon'
+        """)
+        cur.execute("""
+            SELECT f.id, f.devis_id, f.entite, f.entite_id, f.cle,
+                   d.reference, d.total_ariary, d.total_euro
+            FROM devis_a_recalculer f
+            JOIN devis d ON d.id = f.devis_id
+            WHERE d.supprime_le IS NULL AND COALESCE(d.statut, 'brouillon') = 'brouillon'
+            ORDER BY f.id
+        """)
+        signalements = cur.fetchall()
+
+        # Regrouper les signalements par entité pour un UPDATE ensembliste par table
+        par_entite = {}
+        par_cle = {}
+        avant = {}
+        for s in signalements:
+            avant[s['devis_id']] = s
+            if s['entite'] == 'config_prix':
+                par_cle.setdefault(s['cle'], set()).add(s['devis_id'])
+            else:
+                par_entite.setdefault(s['entite'], []).append((s['devis_id'], s['entite_id']))
+
+        # Devis encore sans version (créés avant la migration v18) : état d'origine avant re-tarification
+        for devis_id in avant:
+            enregistrer_version_initiale(devis_id)
+
+        lignes_modifiees = 0
+        for entite, paires in par_entite.items():
+            if entite not in LIGNES_PAR_ENTITE:
+                continue
+            table, vue, colonnes = LIGNES_PAR_ENTITE[entite]
+            lignes_modifiees += retarifer_lignes(cur, table, vue, colonnes,
+                                                 [p[0] for p in paires], [p[1] for p in paires])
+        for cle, devis_ids in par_cle.items():
+            if cle not in LIGNES_PAR_CLE_CONFIG:
+                continue
+            table, vue, colonnes = LIGNES_PAR_CLE_CONFIG[cle]
+            lignes_modifiees += retarifer_lignes(cur, table, vue, colonnes, list(devis_ids))
+
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        print(f"Erreur lors de la re-tarification des devis: {e}")
+        return None
+
+    # Recalculer les totaux des seuls devis impactés
+    rapport, deltas_centimes, traites = [], [], []
+    for devis_id, ancien in avant.items():
+        nouveau = calculer_totaux_devis(devis_id)
+        if not nouveau:
+            continue
+        traites.append(devis_id)
+        ancien_total = ariary(ancien['total_ariary'])
+        delta_centimes = nouveau['total_euro_centimes'] - en_centimes(ancien['total_euro'])
+        deltas_centimes.append(delta_centimes)
+        rapport.append({
+            'devis_id': devis_id,
+            'reference': ancien['reference'],
+            'ancien_total_ariary': ancien_total,
+            'nouveau_total_ariary': nouveau['total_ariary'],
+            'delta_ariary': nouveau['total_ariary'] - ancien_total,
+            'delta_euro': float(euros(delta_centimes))
+        })
+
+    # Une version par devis re-tarifié
+    for devis_id in traites:
+        enregistrer_version(devis_id)
+
+    # Retirer de la file les signalements lus dont le devis a été recalculé (les autres restent en file,
+    # comme ceux ajoutés pendant le traitement)
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM devis_a_recalculer WHERE id = ANY(%s) AND devis_id = ANY(%s)",
+                    ([s['id'] for s in signalements], traites))
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        conn.rollback()
+        print(f"Erreur lors du retrait des devis recalculés de la file: {e}")
+    finally:
+        conn.close()
+
+    return {
+        'nombre_devis': len(rapport),
+        'lignes_modifiees': lignes_modifiees,
+        'delta_total_ariary': sum(r['delta_ariary'] for r in rapport),
+        'delta_total_euro': float(euros(sum(deltas_centimes))),
+        'devis': rapport
+    }
+
+@app.route('/api/catalogue/impact', methods=['GET'])
+def api_impact_catalogue():
+    """Liste les devis brouillon qui utilisent une entité du catalogue (?entite=hotels&id=3 ou ?cle=...)"""
+    entite = request.args.get('entite', 'config_prix')
+    entite_id = request.args.get('id', type=int)
+    cle = request.args.get('cle')
+
+    if entite != 'config_prix' and entite not in LIGNES_PAR_ENTITE:
+        return jsonify({'error': 'Entité du catalogue inconnue'}), 400
+    if entite == 'config_prix' and not cle:
+        return jsonify({'error': 'Clé de configuration requise'}), 400
+    if entite != 'config_prix' and not entite_id:
+        return jsonify({'error': 'Identifiant de l\'entité requis'}), 400
+
+    devis = db_query("""
+        SELECT d.id, d.reference, d.total_ariary, COUNT(*) as nombre_lignes
+        FROM dependances_catalogue dc
+        JOIN devis d ON d.id = dc.devis_id
+        WHERE dc.entite = %s
+          AND (dc.entite_id = %s OR dc.cle = %s)
+          AND d.statut = 'brouillon' AND d.supprime_le IS NULL
+        GROUP BY d.id, d.reference, d.total_ariary
+        ORDER BY d.id
+    """, (entite, entite_id, cle), fetch_all=True)
+
+    return jsonify([{
+        'devis_id': d['id'],
+        'reference': d['reference'],
+        'total_ariary': ariary(d['total_ariary']),
+        'nombre_lignes': d['nombre_lignes']
+    } for d in (devis or [])])
+
+@app.route('/api/catalogue/recalculer', methods=['POST'])
+def api_recalculer_catalogue():
+    """Re-tarifie les devis brouillon impactés par les derniers changements du catalogue"""
+    rapport = recalculer_devis_impactes()
+
+    if rapport is None:
+        return jsonify({'error': 'Erreur lors de la re-tarification des devis'}), 500
+
+    return jsonify(rapport)
+
 if __name__ == '__main__':
+    # Précalculer la matrice des distances au démarrage
+    matrice_distances()
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Application des migrations versionnées : schema.sql (version 1) puis migrate_to_vN.sql.
+Chaque version appliquée est enregistrée avec la somme de contrôle du fichier dans schema_migrations ;
+seules les versions en attente sont exécutées, chacune dans sa propre transaction.
+
+Un fichier dont l'en-tête contient la ligne « -- migration: sans transaction » est exécuté instruction
+par instruction en autocommit (CREATE INDEX CONCURRENTLY, ALTER TYPE ... ADD VALUE, ...), ce qui permet
+de déployer sur une base en service sans bloquer les écritures.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+DOSSIER_MIGRATIONS = Path(__file__).resolve().parent
+
+MARQUEUR_SANS_TRANSACTION = '-- migration: sans transaction'
+
+# Verrou consultatif : un seul exécuteur de migrations à la fois
+CLE_VERROU = 7_201_043
+
+SCHEMA_REGISTRE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        fichier VARCHAR(255) NOT NULL,
+        somme_controle CHAR(64) NOT NULL,
+        transactionnelle BOOLEAN NOT NULL DEFAULT TRUE,
+        duree_ms INTEGER,
+        applique_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def lister_migrations(dossier=DOSSIER_MIGRATIONS):
+    """Fichiers de migration triés par version : [(version, chemin)]"""
+    migrations = [(1, dossier / 'schema.sql')]
+    for chemin in dossier.glob('migrate_to_v*.sql'):
+        correspondance = re.fullmatch(r'migrate_to_v(\d+)\.sql', chemin.name)
+        if correspondance:
+            migrations.append((int(correspondance.group(1)), chemin))
+    return sorted(migrations)
+
+def somme_controle(contenu):
+    """SHA-256 du contenu d'un fichier de migration"""
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+def est_sans_transaction(contenu):
+    """Vrai si l'en-tête (commentaires initiaux) déclare la migration non transactionnelle"""
+    for ligne in contenu.splitlines():
+        ligne = ligne.strip()
+        if not ligne:
+            continue
+        if not ligne.startswith('--'):
+            return False
+        if ligne.lower() == MARQUEUR_SANS_TRANSACTION:
+            return True
+    return False
+
+def decouper_instructions(contenu):
+    """Découpe un script SQL en instructions (en respectant chaînes, commentaires et blocs $$)"""
+    instructions, courante = [], []
+    i, n = 0, len(contenu)
+    while i < n:
+        c = contenu[i]
+        if contenu.startswith('--', i):
+            fin = contenu.find('\n', i)
+            fin = n if fin == -1 else fin
+            courante.append(contenu[i:fin])
+            i = fin
+            continue
+        if c == "'":
+            fin = i + 1
+            while fin < n:
+                if contenu[fin] == "'" and contenu.startswith("''", fin):
+                    fin += 2
+                    continue
+                if contenu[fin] == "'":
+                    break
+                fin += 1
+            courante.append(contenu[i:fin + 1])
+            i = fin + 1
+            continue
+        dollar = re.match(r'\$[A-Za-z_]*\$', contenu[i:i + 64]) if c == '$' else None
+        if dollar:
+            balise = dollar.group(0)
+            fin = contenu.find(balise, i + len(balise))
+            fin = n if fin == -1 else fin + len(balise)
+            courante.append(contenu[i:fin])
+            i = fin
+            continue
+        if c == ';':
+            instruction = ''.join(courante).strip()
+            if instruction and not all(l.strip().startswith('--') or not l.strip() for l in instruction.splitlines()):
+                instructions.append(instruction)
+            courante = []
+        else:
+            courante.append(c)
+        i += 1
+    instruction = ''.join(courante).strip()
+    if instruction and not all(l.strip().startswith('--') or not l.strip() for l in instruction.splitlines()):
+        instructions.append(instruction)
+    return instructions
+
+def charger_registre(conn):
+    """Crée le registre si besoin et retourne {version: (fichier, somme de contrôle)}"""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_REGISTRE)
+        cur.execute("SELECT version, fichier, somme_controle FROM schema_migrations")
+        registre = {version: (fichier, somme) for version, fichier, somme in cur.fetchall()}
+    conn.commit()
+    return registre
+
+def etat_migrations(conn, dossier=DOSSIER_MIGRATIONS):
+    """Retourne (en attente, modifiées) : migrations non appliquées et fichiers modifiés depuis leur application"""
+    registre = charger_registre(conn)
+    en_attente, modifiees = [], []
+    for version, chemin in lister_migrations(dossier):
+        contenu = chemin.read_text(encoding='utf-8')
+        if version not in registre:
+            en_attente.append((version, chemin, contenu))
+        elif registre[version][1] != somme_controle(contenu):
+            modifiees.append((version, chemin, contenu))
+    return en_attente, modifiees
+
+def versions_appliquees(conn):
+    """Versions inscrites au registre, en lecture seule (ensemble vide si le registre n'existe pas)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return set()
+        cur.execute("SELECT version FROM schema_migrations")
+        return {version for (version,) in cur.fetchall()}
+
+def versions_en_attente(conn, dossier=DOSSIER_MIGRATIONS):
+    """Versions non appliquées, sans créer ni modifier le registre (vérification des autres scripts)"""
+    appliquees = versions_appliquees(conn)
+    return [version for version, _ in lister_migrations(dossier) if version not in appliquees]
+
+def enregistrer(cur, version, chemin, contenu, transactionnelle, duree_ms):
+    """Inscrit une version appliquée dans le registre"""
+    cur.execute("""
+        INSERT INTO schema_migrations (version, fichier, somme_controle, transactionnelle, duree_ms)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (version) DO UPDATE SET
+            fichier = EXCLUDED.fichier,
+            somme_controle = EXCLUDED.somme_controle,
+            transactionnelle = EXCLUDED.transactionnelle,
+            duree_ms = EXCLUDED.duree_ms,
+            applique_le = CURRENT_TIMESTAMP
+    """, (version, chemin.name, somme_controle(contenu), transactionnelle, duree_ms))
+
+def appliquer(conn, version, chemin, contenu, lock_timeout):
+    """Applique une migration ; retourne sa durée en secondes"""
+    debut = time.perf_counter()
+    if est_sans_transaction(contenu):
+        # Une instruction par transaction implicite : CREATE INDEX CONCURRENTLY ne peut pas être
+        # exécuté dans un bloc de transaction. Les instructions doivent être rejouables (IF NOT EXISTS).
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET lock_timeout = %s", (lock_timeout,))
+                for instruction in decouper_instructions(contenu):
+                    debut_instruction = time.perf_counter()
+                    cur.execute(instruction)
+                    premiere_ligne = next(l for l in instruction.splitlines() if not l.strip().startswith('--'))
+                    print(f"     · {premiere_ligne.strip()[:70]} ({time.perf_counter() - debut_instruction:.2f} s)")
+                cur.execute("RESET lock_timeout")
+                enregistrer(cur, version, chemin, contenu, False, int((time.perf_counter() - debut) * 1000))
+        finally:
+            conn.autocommit = False
+    else:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+                cur.execute(contenu)
+                enregistrer(cur, version, chemin, contenu, True, int((time.perf_counter() - debut) * 1000))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return time.perf_counter() - debut
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Application des migrations de schéma en attente")
+    parser.add_argument('--statut', action='store_true', help="Afficher l'état des migrations sans rien appliquer")
+    parser.add_argument('--jusqu-a', type=int, help="Ne pas appliquer au-delà de cette version")
+    parser.add_argument('--marquer-jusqu-a', type=int,
+                        help="Base existante : inscrire les versions jusqu'à N comme appliquées sans les exécuter")
+    parser.add_argument('--reparer-sommes', action='store_true',
+                        help="Réinscrire la somme de contrôle des fichiers modifiés depuis leur application")
+    parser.add_argument('--lock-timeout', default='5s',
+                        help="Attente maximale d'un verrou par instruction (évite de bloquer les écritures)")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("MIGRATIONS DE SCHÉMA")
+        print("=" * 80)
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (CLE_VERROU,))
+        conn.commit()
+
+        en_attente, modifiees = etat_migrations(conn)
+
+        if args.reparer_sommes and modifiees:
+            with conn.cursor() as cur:
+                for version, chemin, contenu in modifiees:
+                    cur.execute("UPDATE schema_migrations SET somme_controle = %s WHERE version = %s",
+                                (somme_controle(contenu), version))
+                    print(f"  ✓ v{version} ({chemin.name}) : somme de contrôle réinscrite")
+            conn.commit()
+            modifiees = []
+
+        for version, chemin, _ in modifiees:
+            print(f"  ⚠️  v{version} ({chemin.name}) a été modifié depuis son application")
+
+        if args.marquer_jusqu_a:
+            with conn.cursor() as cur:
+                for version, chemin, contenu in en_attente:
+                    if version <= args.marquer_jusqu_a:
+                        enregistrer(cur, version, chemin, contenu, not est_sans_transaction(contenu), None)
+                        print(f"  ✓ v{version} ({chemin.name}) inscrite comme appliquée")
+            conn.commit()
+            en_attente = [m for m in en_attente if m[0] > args.marquer_jusqu_a]
+
+        if args.jusqu_a:
+            en_attente = [m for m in en_attente if m[0] <= args.jusqu_a]
+
+        if args.statut or not en_attente:
+            for version, chemin, contenu in en_attente:
+                mode = "sans transaction" if est_sans_transaction(contenu) else "transaction"
+                print(f"  … v{version} ({chemin.name}, {mode}) en attente")
+            if not en_attente:
+                print("✅ Schéma à jour")
+            return
+
+        if modifiees:
+            print("\n❌ Historique divergent : vérifier les fichiers modifiés ou relancer avec --reparer-sommes")
+            sys.exit(1)
+
+        debut = time.perf_counter()
+        for version, chemin, contenu in en_attente:
+            mode = "sans transaction" if est_sans_transaction(contenu) else "transaction"
+            print(f"\n→ v{version} ({chemin.name}, {mode})")
+            try:
+                duree = appliquer(conn, version, chemin, contenu, args.lock_timeout)
+            except Exception as e:
+                print(f"❌ Échec de la v{version}: {e}")
+                sys.exit(1)
+            print(f"  ✅ appliquée en {duree:.2f} s")
+
+        print(f"\n✅ {len(en_attente)} migration(s) appliquée(s) en {time.perf_counter() - debut:.2f} s")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
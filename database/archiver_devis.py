@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Archivage des devis fermés ou anciens (migration v15) : chaque lot de devis est copié avec toutes ses lignes
+dans le schéma archives (tables partitionnées par année de date_cotation) puis supprimé des tables chaudes,
+dans une seule transaction. Les partitions annuelles sont créées à la demande ; les plus anciennes peuvent
+être détachées (--detacher-avant) pour être sauvegardées puis supprimées hors de la base de production.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+STATUTS_OUVERTS = ('brouillon', 'envoyé')
+
+# Tables archivées, parents d'abord : (table, rattachement) avec rattachement None (devis lui-même),
+# 'devis' (colonne devis_id) ou 'jour' (colonne jour_voyage_id)
+TABLES_ARCHIVEES = [
+    ('devis', None),
+    ('jours_voyage', 'devis'),
+    ('couts_devis', 'devis'),
+    ('imprevus', 'devis'),
+    ('transferts_aeroport', 'devis'),
+    ('guides_accompagnateurs', 'devis'),
+    ('lignes_devis', 'devis'),
+    ('devis_figes', 'devis'),
+    ('versions_devis', 'devis'),
+    ('transferts', 'jour'),
+    ('locations_vehicules', 'jour'),
+    ('guidages', 'jour'),
+    ('reserves_parcs', 'jour'),
+    ('hebergements', 'jour'),
+    ('repas', 'jour'),
+    ('visites_jour', 'jour'),
+    ('locations_journalieres', 'jour'),
+]
+
+# Recalculée par déclencheurs à la restauration des lignes sources
+TABLES_DERIVEES = ('lignes_devis',)
+
+# Devis fermés (acceptés, refusés) cotés depuis plus de --fermes-depuis mois, ou tout devis plus vieux que --tous-depuis
+# (les devis supprimés sont laissés au purgeur)
+CRITERE_ARCHIVAGE = """
+    supprime_le IS NULL
+    AND ((COALESCE(statut, 'brouillon') NOT IN %(ouverts)s
+          AND date_cotation < CURRENT_DATE - make_interval(months => %(fermes)s))
+         OR date_cotation < CURRENT_DATE - make_interval(months => %(tous)s))
+"""
+
+DEVIS_A_ARCHIVER = f"""
+    SELECT id, date_cotation
+    FROM devis
+    WHERE {CRITERE_ARCHIVAGE}
+    ORDER BY date_cotation, id
+    LIMIT %(lot)s
+    FOR UPDATE SKIP LOCKED
+"""
+
+TAILLE_LOT = 200
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def colonnes_communes(cur, table):
+    """Colonnes de public.<table> présentes aussi dans archives.<table>, dans l'ordre de la table chaude"""
+    cur.execute("""
+        SELECT c.column_name
+        FROM information_schema.columns c
+        WHERE c.table_schema = 'public' AND c.table_name = %s
+          AND EXISTS (SELECT 1 FROM information_schema.columns a
+                      WHERE a.table_schema = 'archives' AND a.table_name = c.table_name
+                        AND a.column_name = c.column_name)
+        ORDER BY c.ordinal_position
+    """, (table,))
+    return [ligne['column_name'] for ligne in cur.fetchall()]
+
+def creer_partitions(cur, annees):
+    """Crée les partitions annuelles manquantes de toutes les tables d'archive"""
+    for annee in sorted(annees):
+        for table, _ in TABLES_ARCHIVEES:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS archives.{table}_{annee} PARTITION OF archives.{table}
+                FOR VALUES FROM ('{annee}-01-01') TO ('{annee + 1}-01-01')
+            """)
+
+def copier_vers_archives(cur, table, rattachement, colonnes, devis_ids):
+    """Copie les lignes des devis donnés dans archives.<table> ; retourne le nombre de lignes copiées"""
+    liste = ", ".join(colonnes)
+    source = ", ".join(f"t.{col}" for col in colonnes)
+    if rattachement is None:
+        requete = f"""
+            INSERT INTO archives.{table} ({liste}) SELECT {source} FROM {table} t WHERE t.id = ANY(%s)
+        """
+    elif rattachement == 'devis':
+        requete = f"""
+            INSERT INTO archives.{table} (date_cotation, {liste})
+            SELECT d.date_cotation, {source} FROM {table} t JOIN devis d ON d.id = t.devis_id
+            WHERE t.devis_id = ANY(%s)
+        """
+    else:
+        requete = f"""
+            INSERT INTO archives.{table} (date_cotation, devis_id, {liste})
+            SELECT d.date_cotation, d.id, {source}
+            FROM {table} t
+            JOIN jours_voyage jv ON jv.id = t.jour_voyage_id
+            JOIN devis d ON d.id = jv.devis_id
+            WHERE jv.devis_id = ANY(%s)
+        """
+    cur.execute(requete, (devis_ids,))
+    return cur.rowcount
+
+def archiver_lot(conn, colonnes, fermes, tous, taille_lot):
+    """Archive un lot de devis en une transaction ; retourne ({table: lignes}, nombre de devis)"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute(DEVIS_A_ARCHIVER, {'ouverts': STATUTS_OUVERTS, 'fermes': fermes, 'tous': tous, 'lot': taille_lot})
+        devis = cur.fetchall()
+        if not devis:
+            conn.rollback()
+            return {}, 0
+
+        devis_ids = [d['id'] for d in devis]
+        creer_partitions(cur, {d['date_cotation'].year for d in devis})
+        copies = {table: copier_vers_archives(cur, table, rattachement, colonnes[table], devis_ids)
+                  for table, rattachement in TABLES_ARCHIVEES}
+
+        # Le ON DELETE CASCADE vide les tables de lignes (et lignes_devis par ses déclencheurs)
+        cur.execute("DELETE FROM devis WHERE id = ANY(%s)", (devis_ids,))
+        conn.commit()
+        return copies, len(devis_ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def restaurer(conn, colonnes, devis_id):
+    """Remet un devis archivé dans les tables chaudes (mêmes identifiants) ; retourne le nombre de lignes"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        total = 0
+        for table, rattachement in TABLES_ARCHIVEES:
+            if table in TABLES_DERIVEES:
+                continue
+            liste = ", ".join(colonnes[table])
+            cle = 'id' if rattachement is None else 'devis_id'
+            cur.execute(f"""
+                INSERT INTO {table} ({liste}) SELECT {liste} FROM archives.{table} WHERE {cle} = %s
+            """, (devis_id,))
+            total += cur.rowcount
+            if rattachement is None and not cur.rowcount:
+                conn.rollback()
+                return 0
+        for table, rattachement in reversed(TABLES_ARCHIVEES):
+            cle = 'id' if rattachement is None else 'devis_id'
+            cur.execute(f"DELETE FROM archives.{table} WHERE {cle} = %s", (devis_id,))
+        conn.commit()
+        return total
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def partitions_par_annee(cur):
+    """Années des partitions attachées à archives.devis"""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'archives.devis'::regclass
+    """)
+    return sorted(int(ligne['relname'].rsplit('_', 1)[1]) for ligne in cur.fetchall())
+
+def detacher(conn, avant):
+    """Détache les partitions des années antérieures à `avant` ; retourne les années détachées"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        annees = [annee for annee in partitions_par_annee(cur) if annee < avant]
+        for annee in annees:
+            for table, _ in TABLES_ARCHIVEES:
+                cur.execute(f"ALTER TABLE archives.{table} DETACH PARTITION archives.{table}_{annee}")
+        conn.commit()
+        return annees
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Archivage des devis fermés ou anciens (schéma archives)")
+    parser.add_argument('--fermes-depuis', type=int, default=12,
+                        help="Archiver les devis acceptés ou refusés cotés il y a plus de N mois")
+    parser.add_argument('--tous-depuis', type=int, default=36,
+                        help="Archiver tous les devis cotés il y a plus de N mois, quel que soit leur statut")
+    parser.add_argument('--lot', type=int, default=TAILLE_LOT, help="Nombre de devis archivés par transaction")
+    parser.add_argument('--pause', type=float, default=0.2, help="Pause entre deux lots (secondes)")
+    parser.add_argument('--simulation', action='store_true', help="Compter les devis à archiver sans rien déplacer")
+    parser.add_argument('--restaurer', type=int, metavar='DEVIS_ID', help="Remettre un devis archivé en service")
+    parser.add_argument('--detacher-avant', type=int, metavar='ANNEE',
+                        help="Détacher les partitions d'archive des années antérieures")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("ARCHIVAGE DES DEVIS")
+        print("=" * 80)
+
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        colonnes = {table: colonnes_communes(cur, table) for table, _ in TABLES_ARCHIVEES}
+        conn.commit()
+        cur.close()
+
+        if args.restaurer:
+            lignes = restaurer(conn, colonnes, args.restaurer)
+            if lignes:
+                print(f"✅ Devis #{args.restaurer} restauré ({lignes} ligne(s))")
+            else:
+                print(f"❌ Devis #{args.restaurer} absent des archives")
+            return
+
+        if args.detacher_avant:
+            annees = detacher(conn, args.detacher_avant)
+            if not annees:
+                print(f"✅ Aucune partition antérieure à {args.detacher_avant}")
+            for annee in annees:
+                print(f"  ✓ {annee} détachée : archives.*_{annee} "
+                      f"(pg_dump -t 'archives.*_{annee}' puis DROP TABLE)")
+            return
+
+        if args.simulation:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(f"SELECT COUNT(*) AS nombre FROM devis WHERE {CRITERE_ARCHIVAGE}",
+                        {'ouverts': STATUTS_OUVERTS, 'fermes': args.fermes_depuis, 'tous': args.tous_depuis})
+            print(f"📋 {cur.fetchone()['nombre']} devis à archiver")
+            cur.close()
+            conn.rollback()
+            return
+
+        debut = time.perf_counter()
+        total_devis, total_lignes = 0, {}
+        while True:
+            copies, nombre = archiver_lot(conn, colonnes, args.fermes_depuis, args.tous_depuis, args.lot)
+            if not nombre:
+                break
+            total_devis += nombre
+            for table, lignes in copies.items():
+                total_lignes[table] = total_lignes.get(table, 0) + lignes
+            print(f"  → {total_devis} devis archivé(s) ({time.perf_counter() - debut:.1f} s)")
+            time.sleep(args.pause)
+
+        for table, lignes in total_lignes.items():
+            if lignes:
+                print(f"  • {table:<25} {lignes:>10} ligne(s)")
+        print(f"\n✅ {total_devis} devis archivé(s) en {time.perf_counter() - debut:.2f} s")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
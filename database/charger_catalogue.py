@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chargement en masse du catalogue (types de voitures, itinéraires, hôtels, visites) :
+une instruction INSERT ... ON CONFLICT multi-lignes par table et une seule transaction.
+Mêmes données que insert_itineraires_hotels_complet.py.
+"""
+
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from insert_itineraires_hotels_complet import (
+    ITINERAIRES_HOTELS, VISITES_PAR_LOCALITE, TAXES_COMMUNALES, TYPES_VOITURES
+)
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+# Les lignes inchangées ne sont pas réécrites (WHERE ... IS DISTINCT FROM) : les déclencheurs
+# de signalement des devis impactés ne se déclenchent que pour les prix réellement modifiés
+UPSERT_TYPES_VOITURES = """
+    INSERT INTO types_voitures (nom, consommation_l_100km, ordre, actif)
+    VALUES %s
+    ON CONFLICT (nom) DO UPDATE SET consommation_l_100km = EXCLUDED.consommation_l_100km
+    WHERE types_voitures.consommation_l_100km IS DISTINCT FROM EXCLUDED.consommation_l_100km
+    RETURNING (xmax = 0) AS insere
+"""
+
+# Pas de WHERE ici : toutes les lignes doivent être retournées pour résoudre les ids
+UPSERT_ITINERAIRES = """
+    INSERT INTO itineraires (nom, ordre)
+    VALUES %s
+    ON CONFLICT (nom) DO UPDATE SET ordre = EXCLUDED.ordre
+    RETURNING nom, id, (xmax = 0) AS insere
+"""
+
+UPSERT_HOTELS = """
+    INSERT INTO hotels (itineraire_id, nom, prix_double, actif)
+    VALUES %s
+    ON CONFLICT (itineraire_id, nom)
+    DO UPDATE SET prix_double = EXCLUDED.prix_double, actif = TRUE
+    WHERE (hotels.prix_double, hotels.actif) IS DISTINCT FROM (EXCLUDED.prix_double, TRUE)
+    RETURNING (xmax = 0) AS insere
+"""
+
+UPSERT_VISITES = """
+    INSERT INTO visites (
+        itineraire_id, nom, prix_par_personne, prix_par_voiture, type_prix,
+        guidage_obligatoire, guidage_prix_base, guidage_nb_personnes_base,
+        guidage_type_calcul, taxe_communale, ordre, actif
+    )
+    VALUES %s
+    ON CONFLICT (itineraire_id, nom)
+    DO UPDATE SET
+        prix_par_personne = EXCLUDED.prix_par_personne,
+        prix_par_voiture = EXCLUDED.prix_par_voiture,
+        type_prix = EXCLUDED.type_prix,
+        guidage_obligatoire = EXCLUDED.guidage_obligatoire,
+        guidage_prix_base = EXCLUDED.guidage_prix_base,
+        guidage_nb_personnes_base = EXCLUDED.guidage_nb_personnes_base,
+        guidage_type_calcul = EXCLUDED.guidage_type_calcul,
+        taxe_communale = EXCLUDED.taxe_communale
+    WHERE (visites.prix_par_personne, visites.prix_par_voiture, visites.type_prix,
+           visites.guidage_obligatoire, visites.guidage_prix_base, visites.guidage_nb_personnes_base,
+           visites.guidage_type_calcul, visites.taxe_communale)
+          IS DISTINCT FROM
+          (EXCLUDED.prix_par_personne, EXCLUDED.prix_par_voiture, EXCLUDED.type_prix,
+           EXCLUDED.guidage_obligatoire, EXCLUDED.guidage_prix_base, EXCLUDED.guidage_nb_personnes_base,
+           EXCLUDED.guidage_type_calcul, EXCLUDED.taxe_communale)
+    RETURNING (xmax = 0) AS insere
+"""
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def preparer_catalogue():
+    """
+    Construit en mémoire les lignes de chaque table, dédoublonnées sur leur clé d'unicité
+    (une instruction ON CONFLICT ne peut pas toucher deux fois la même ligne)
+    """
+    types_voitures = {nom: (nom, consommation, ordre, True)
+                      for ordre, (nom, consommation) in enumerate(TYPES_VOITURES, 1)}
+
+    noms_itineraires = sorted(set(ITINERAIRES_HOTELS) | set(VISITES_PAR_LOCALITE))
+    itineraires = [(nom, ordre) for ordre, nom in enumerate(noms_itineraires, 1)]
+
+    hotels = {}
+    for itineraire_nom, liste in ITINERAIRES_HOTELS.items():
+        for hotel_nom, prix in liste:
+            hotels[(itineraire_nom, hotel_nom)] = prix
+
+    visites = {}
+    for localite, liste in VISITES_PAR_LOCALITE.items():
+        taxe_communale = TAXES_COMMUNALES.get(localite, 0)
+        for visite_data in liste:
+            taxe_visite = visite_data[8] if len(visite_data) > 8 else taxe_communale
+            visites[(localite, visite_data[0])] = tuple(visite_data[1:8]) + (taxe_visite, len(visites) + 1)
+
+    return list(types_voitures.values()), itineraires, hotels, visites
+
+def upsert(cur, requete, lignes, template=None):
+    """Un INSERT ... ON CONFLICT multi-lignes ; retourne les lignes RETURNING"""
+    if not lignes:
+        return []
+    return execute_values(cur, requete, lignes, template=template, page_size=len(lignes), fetch=True)
+
+def compter(resultats):
+    """(insérées, mises à jour) d'après la colonne insere de RETURNING"""
+    inseres = sum(1 for r in resultats if r[-1])
+    return inseres, len(resultats) - inseres
+
+def charger_catalogue(conn):
+    """Charge tout le catalogue dans une seule transaction ; retourne les statistiques par table"""
+    types_voitures, itineraires, hotels, visites = preparer_catalogue()
+    statistiques = []
+
+    with conn.cursor() as cur:
+        debut = time.perf_counter()
+        resultats = upsert(cur, UPSERT_TYPES_VOITURES, types_voitures)
+        statistiques.append(('types_voitures', len(types_voitures), *compter(resultats), time.perf_counter() - debut))
+
+        debut = time.perf_counter()
+        resultats = upsert(cur, UPSERT_ITINERAIRES, itineraires)
+        itineraire_ids = {nom: itineraire_id for nom, itineraire_id, _ in resultats}
+        statistiques.append(('itineraires', len(itineraires), *compter(resultats), time.perf_counter() - debut))
+
+        debut = time.perf_counter()
+        lignes = [(itineraire_ids[itineraire_nom], hotel_nom, prix, True)
+                  for (itineraire_nom, hotel_nom), prix in hotels.items()]
+        resultats = upsert(cur, UPSERT_HOTELS, lignes)
+        statistiques.append(('hotels', len(lignes), *compter(resultats), time.perf_counter() - debut))
+
+        debut = time.perf_counter()
+        lignes = [(itineraire_ids[localite], nom_visite) + valeurs + (True,)
+                  for (localite, nom_visite), valeurs in visites.items()]
+        resultats = upsert(cur, UPSERT_VISITES, lignes)
+        statistiques.append(('visites', len(lignes), *compter(resultats), time.perf_counter() - debut))
+
+    conn.commit()
+
+    # Quantiles de prix de l'optimiseur d'hébergement : un seul rafraîchissement, sans bloquer les lectures
+    with conn.cursor() as cur:
+        debut = time.perf_counter()
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY quantiles_prix_hotels")
+        statistiques.append(('quantiles', 0, 0, 0, time.perf_counter() - debut))
+    conn.commit()
+    return statistiques
+
+def main():
+    """Fonction principale"""
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("CHARGEMENT EN MASSE DU CATALOGUE")
+        print("=" * 80)
+
+        debut = time.perf_counter()
+        statistiques = charger_catalogue(conn)
+
+        print(f"\n{'Table':<16} {'Lignes':>8} {'Insérées':>10} {'Modifiées':>10} {'Durée':>10}")
+        for table, lignes, inserees, modifiees, duree in statistiques:
+            print(f"{table:<16} {lignes:>8} {inserees:>10} {modifiees:>10} {duree * 1000:>8.1f} ms")
+        print(f"\n✅ Catalogue chargé en une transaction ({(time.perf_counter() - debut) * 1000:.1f} ms)")
+    except Exception as e:
+        conn.rollback()
+        print(f"\n❌ Erreur: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conseiller d'index : repère dans le catalogue PostgreSQL les clés étrangères sans index,
+les tables parcourues séquentiellement (pg_stat_user_tables) et les index invalides,
+puis génère au besoin une migration d'index créés avec CONCURRENTLY.
+"""
+
+import argparse
+import os
+import sys
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+from appliquer_migrations import DOSSIER_MIGRATIONS, MARQUEUR_SANS_TRANSACTION, lister_migrations
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+# Tables du catalogue lues avec WHERE actif par les endpoints : colonnes de l'index partiel (filtre puis tri)
+INDEX_PARTIELS_CATALOGUE = {
+    'hotels': ('itineraire_id', 'nom'),
+    'visites': ('itineraire_id', 'ordre', 'nom'),
+    'types_voitures': ('ordre', 'nom'),
+    'types_locations_journalieres': ('nom',),
+}
+
+# Clés étrangères dont aucun index valide et non partiel ne commence par les colonnes de la clé
+CLES_SANS_INDEX = """
+    SELECT c.conrelid::regclass::text AS table_enfant,
+           c.confrelid::regclass::text AS table_parent,
+           c.conname AS contrainte,
+           ARRAY(SELECT a.attname FROM unnest(c.conkey) WITH ORDINALITY k(attnum, n)
+                 JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+                 ORDER BY k.n)::text[] AS colonnes,
+           pg_relation_size(c.conrelid) AS taille,
+           COALESCE(s.seq_scan, 0) AS seq_scan,
+           COALESCE(s.n_live_tup, 0) AS lignes
+    FROM pg_constraint c
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.conrelid
+    WHERE c.contype = 'f'
+      AND c.connamespace = 'public'::regnamespace
+      AND NOT EXISTS (
+          SELECT 1 FROM pg_index i
+          WHERE i.indrelid = c.conrelid
+            AND i.indisvalid
+            AND i.indpred IS NULL
+            AND (string_to_array(i.indkey::text, ' ')::int2[])[1:array_length(c.conkey, 1)] @> c.conkey
+      )
+    ORDER BY pg_relation_size(c.conrelid) DESC, 1
+"""
+
+# Tables les plus lues séquentiellement
+PARCOURS_SEQUENTIELS = """
+    SELECT relname AS table_nom, seq_scan, seq_tup_read, COALESCE(idx_scan, 0) AS idx_scan, n_live_tup AS lignes,
+           CASE WHEN seq_scan > 0 THEN seq_tup_read / seq_scan END AS lignes_par_parcours
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'public' AND seq_scan > 0 AND n_live_tup >= %(lignes_min)s
+    ORDER BY seq_tup_read DESC
+    LIMIT %(limite)s
+"""
+
+INDEX_INVALIDES = """
+    SELECT i.indexrelid::regclass::text AS index_nom, i.indrelid::regclass::text AS table_nom
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE NOT i.indisvalid AND c.relnamespace = 'public'::regnamespace
+"""
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def nom_index(table, colonnes):
+    """Nom d'index dans la convention idx_<table>_<colonnes> (63 caractères au plus)"""
+    return f"idx_{table}_{'_'.join(colonnes)}"[:63]
+
+def index_partiels_manquants(cur):
+    """Index partiels WHERE actif du catalogue absents : [(table, colonnes)]"""
+    cur.execute("""
+        SELECT c.relname AS table_nom
+        FROM pg_class c
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relname = ANY(%s)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_index i
+              WHERE i.indrelid = c.oid AND i.indisvalid
+                AND pg_get_expr(i.indpred, i.indrelid) ILIKE '%%actif%%'
+          )
+    """, (list(INDEX_PARTIELS_CATALOGUE),))
+    return [(ligne['table_nom'], INDEX_PARTIELS_CATALOGUE[ligne['table_nom']]) for ligne in cur.fetchall()]
+
+def generer_migration(cles_sans_index, partiels):
+    """Écrit la prochaine migration migrate_to_vN.sql (index CONCURRENTLY, sans transaction) ; retourne son chemin"""
+    version = lister_migrations()[-1][0] + 1
+    chemin = DOSSIER_MIGRATIONS / f"migrate_to_v{version}.sql"
+    lignes = [
+        f"-- Script de migration vers la version {version} : index proposés par conseiller_index.py",
+        MARQUEUR_SANS_TRANSACTION,
+        "",
+    ]
+    if cles_sans_index:
+        lignes.append("-- Clés étrangères sans index")
+        for table, colonnes in dict.fromkeys((cle['table_enfant'], tuple(cle['colonnes'])) for cle in cles_sans_index):
+            lignes.append(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nom_index(table, colonnes)} "
+                          f"ON {table}({', '.join(colonnes)});")
+        lignes.append("")
+    if partiels:
+        lignes.append("-- Catalogue actif (WHERE actif)")
+        for table, colonnes in partiels:
+            lignes.append(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nom_index(table, ('actif',))} "
+                          f"ON {table}({', '.join(colonnes)}) WHERE actif;")
+        lignes.append("")
+    chemin.write_text("\n".join(lignes), encoding='utf-8')
+    return chemin
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Conseiller d'index (clés étrangères, parcours séquentiels)")
+    parser.add_argument('--generer', action='store_true',
+                        help="Écrire une migration migrate_to_vN.sql avec les index proposés")
+    parser.add_argument('--lignes-min', type=int, default=1000,
+                        help="Taille minimale d'une table pour signaler ses parcours séquentiels")
+    parser.add_argument('--limite', type=int, default=15, help="Nombre de tables affichées")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        print("=" * 80)
+        print("CONSEILLER D'INDEX")
+        print("=" * 80)
+
+        cur.execute(CLES_SANS_INDEX)
+        cles_sans_index = cur.fetchall()
+        print(f"\n🔗 CLÉS ÉTRANGÈRES SANS INDEX ({len(cles_sans_index)}):")
+        for cle in cles_sans_index:
+            print(f"  • {cle['table_enfant']}({', '.join(cle['colonnes'])}) → {cle['table_parent']} : "
+                  f"{cle['lignes']} ligne(s), {cle['seq_scan']} parcours séquentiel(s)")
+
+        cur.execute(PARCOURS_SEQUENTIELS, {'lignes_min': args.lignes_min, 'limite': args.limite})
+        print("\n🔥 PARCOURS SÉQUENTIELS LES PLUS COÛTEUX:")
+        for t in cur.fetchall():
+            print(f"  • {t['table_nom']:<30} {t['seq_scan']:>10} parcours, {t['seq_tup_read']:>14} lignes lues "
+                  f"({t['lignes_par_parcours']} / parcours), {t['idx_scan']} accès par index")
+
+        partiels = index_partiels_manquants(cur)
+        print(f"\n📋 INDEX PARTIELS DU CATALOGUE MANQUANTS ({len(partiels)}):")
+        for table, colonnes in partiels:
+            print(f"  • {table}({', '.join(colonnes)}) WHERE actif")
+
+        cur.execute(INDEX_INVALIDES)
+        invalides = cur.fetchall()
+        if invalides:
+            print("\n⚠️  INDEX INVALIDES (création CONCURRENTLY interrompue) :")
+            for index in invalides:
+                print(f"  • DROP INDEX CONCURRENTLY {index['index_nom']};  -- {index['table_nom']}")
+        cur.close()
+        conn.rollback()
+
+        if args.generer:
+            if not cles_sans_index and not partiels:
+                print("\n✅ Aucun index à créer")
+            else:
+                chemin = generer_migration(cles_sans_index, partiels)
+                print(f"\n✅ Migration écrite: {chemin} (python database/appliquer_migrations.py)")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
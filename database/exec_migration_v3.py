@@ -72,7 +72,7 @@ def execute_migration():
 if __name__ == "__main__":
     if execute_migration():
         print("\n" + "=" * 80)
-        print("Vous pouvez maintenant exécuter: python3 database/insert_itineraires_hotels_complet.py")
+        print("Vous pouvez maintenant exécuter: python3 database/charger_catalogue.py")
         print("=" * 80)
     else:
         print("\n" + "=" * 80)
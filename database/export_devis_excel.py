@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script d'export des devis vers Excel, dans la disposition de l'ancien classeur
+(celle lue par migrate_excel_to_db.py) : une feuille "Nom X pax" par devis
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, Font, PatternFill, Border, Side, Alignment
+from openpyxl.utils import column_index_from_string
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+from migrate_excel_to_db import (
+    CELLULES_DEVIS, CELLULES_CATEGORIES, CELLULES_IMPREVU, COLONNES_JOUR, LIGNES_JOURS, REPAS_JOUR,
+)
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+TAILLE_LOT = 100  # Devis chargés par lot depuis la base
+
+# Libellés fixes de l'ancien classeur (cellules non lues par l'import)
+LIBELLES = {
+    'A1': 'Taux', 'A3': 'Nbr de pax', 'A4': 'Adulte', 'A5': 'Enfant', 'A6': 'Bébé',
+    'A7': 'Date de cotation', 'A8': 'chbre',
+    'D1': 'Transfert', 'D11': 'S Total', 'D13': 'Imprevu', 'E13': 'Nbr', 'F13': 'Prix',
+    'H3': 'Total', 'H4': 'Marge', 'H6': 'Tarif en Euro',
+}
+LIBELLES.update({f"D{ref[1:]}": categorie for categorie, ref in CELLULES_CATEGORIES.items()})
+
+# En-têtes des colonnes jour par jour (ligne 19)
+LIGNE_ENTETES = 19
+ENTETES_JOURS = {
+    'A': 'Jour', 'B': 'Date', 'C': 'Itinéraire', 'D': 'Transfert', 'E': 'Nbr de voiture', 'F': 'Prix',
+    'G': 'Pirogue', 'H': 'Nbr', 'I': 'Prix', 'J': 'bateau', 'K': 'nbr', 'L': 'prix',
+    'M': 'Location sans carburant', 'N': 'Nbr', 'O': 'prix', 'P': 'Kilometrage',
+    'Q': 'Guidage', 'R': 'Nbr', 'S': 'Prix', 'T': 'Reserve', 'U': 'Prix', 'V': 'Nbr',
+    'Y': 'NOM', 'Z': 'PN', 'AA': 'Nbr', 'AE': 'Transfert htl',
+    'AH': 'Hotel', 'AI': 'prix', 'AJ': 'nbr',
+    'AP': 'Vinette', 'AQ': 'nbr', 'AR': 'prix', 'AS': 'PD', 'AT': 'nbr', 'AU': 'prix',
+    'AV': 'DN', 'AW': 'Nbr', 'AX': 'Prix', 'AY': 'DJ', 'AZ': 'Nbr', 'BA': 'prix',
+}
+
+# Transferts : type -> (colonne nombre, colonne prix)
+TRANSFERTS_JOUR = {
+    'Transfert': (None, 'transfert_prix'),
+    'Pirogue': ('pirogue_nbr', 'pirogue_prix'),
+    'Bateau': ('bateau_nbr', 'bateau_prix'),
+}
+
+# Lignes jour par jour chargées par lot : clé -> requête (jour_voyage_id en première colonne)
+REQUETES_LIGNES_JOUR = {
+    'transferts': """
+        SELECT t.jour_voyage_id, t.type_transfert, t.nombre_personnes, t.prix_ariary
+        FROM transferts t JOIN jours_voyage jv ON jv.id = t.jour_voyage_id
+        WHERE jv.devis_id = ANY(%s) ORDER BY t.id
+    """,
+    'locations': """
+        SELECT l.jour_voyage_id, l.nombre_vehicules, l.prix_ariary, l.kilometrage
+        FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+        WHERE jv.devis_id = ANY(%s) ORDER BY l.id
+    """,
+    'guidages': """
+        SELECT g.jour_voyage_id, g.nombre_guides, g.prix_ariary
+        FROM guidages g JOIN jours_voyage jv ON jv.id = g.jour_voyage_id
+        WHERE jv.devis_id = ANY(%s) ORDER BY g.id
+    """,
+    'reserves': """
+        SELECT r.jour_voyage_id, r.nom_reserve, r.nom_parc, r.nombre_personnes, r.prix_ariary
+        FROM reserves_parcs r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+        WHERE jv.devis_id = ANY(%s) ORDER BY r.id
+    """,
+    'visites': """
+        SELECT vj.jour_voyage_id, v.nom, vj.nombre_personnes, vj.prix_total
+        FROM visites_jour vj
+        JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+        JOIN visites v ON v.id = vj.visite_id
+        WHERE jv.devis_id = ANY(%s) ORDER BY vj.id
+    """,
+    'hebergements': """
+        SELECT h.jour_voyage_id, h.nom_hotel, h.nombre_chambres, h.prix_ariary, h.transfert_htl
+        FROM hebergements h JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+        WHERE jv.devis_id = ANY(%s) ORDER BY h.id
+    """,
+    'repas': """
+        SELECT r.jour_voyage_id, r.type_repas, r.nombre_personnes, r.prix_ariary
+        FROM repas r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+        WHERE jv.devis_id = ANY(%s) ORDER BY r.id
+    """,
+}
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def position(reference):
+    """Convertit une référence Excel ('AH21') en (ligne, colonne)"""
+    colonne = reference.rstrip('0123456789')
+    return int(reference[len(colonne):]), column_index_from_string(colonne)
+
+def selectionner_devis(conn, devis_ids=None, statut=None):
+    """Retourne les identifiants des devis à exporter"""
+    cur = conn.cursor()
+    conditions, params = ["supprime_le IS NULL"], []
+    if devis_ids:
+        conditions.append("id = ANY(%s)")
+        params.append(list(devis_ids))
+    if statut:
+        conditions.append("statut = %s")
+        params.append(statut)
+    where = f"WHERE {' AND '.join(conditions)}"
+    cur.execute(f"SELECT id FROM devis {where} ORDER BY id", params)
+    ids = [ligne[0] for ligne in cur.fetchall()]
+    cur.close()
+    return ids
+
+def charger_devis_par_lots(conn, devis_ids, taille_lot=TAILLE_LOT):
+    """Charge les devis par lots (une requête par table et par lot) et les produit un par un"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    for i in range(0, len(devis_ids), taille_lot):
+        lot = devis_ids[i:i + taille_lot]
+
+        cur.execute("""
+            SELECT d.*, c.reference AS client_reference, c.nom AS client_nom
+            FROM devis d
+            LEFT JOIN clients c ON c.id = d.client_id
+            WHERE d.id = ANY(%s)
+            ORDER BY d.id
+        """, (lot,))
+        devis_lot = {d['id']: dict(d, couts={}, jours=[], imprevus=[]) for d in cur.fetchall()}
+
+        cur.execute("""
+            SELECT cd.devis_id, cc.nom, SUM(cd.montant_ariary) AS montant
+            FROM couts_devis cd
+            JOIN categories_couts cc ON cc.id = cd.categorie_id
+            WHERE cd.devis_id = ANY(%s)
+            GROUP BY cd.devis_id, cc.nom
+        """, (lot,))
+        for ligne in cur.fetchall():
+            devis_lot[ligne['devis_id']]['couts'][ligne['nom']] = ligne['montant']
+
+        cur.execute("""
+            SELECT devis_id, nombre, prix_ariary
+            FROM imprevus
+            WHERE devis_id = ANY(%s)
+            ORDER BY id
+        """, (lot,))
+        for ligne in cur.fetchall():
+            devis_lot[ligne['devis_id']]['imprevus'].append(ligne)
+
+        cur.execute("""
+            SELECT id, devis_id, numero_jour, date_jour, destination
+            FROM jours_voyage
+            WHERE devis_id = ANY(%s)
+            ORDER BY devis_id, numero_jour
+        """, (lot,))
+        jours = {}
+        for ligne in cur.fetchall():
+            jour = dict(ligne, **{cle: [] for cle in REQUETES_LIGNES_JOUR})
+            jours[jour['id']] = jour
+            devis_lot[jour['devis_id']]['jours'].append(jour)
+
+        for cle, requete in REQUETES_LIGNES_JOUR.items():
+            cur.execute(requete, (lot,))
+            for ligne in cur.fetchall():
+                jours[ligne['jour_voyage_id']][cle].append(ligne)
+
+        for devis_id in lot:
+            if devis_id in devis_lot:
+                yield devis_lot[devis_id]
+    cur.close()
+
+def cumuler(cellules, ligne, colonne, valeur):
+    """Ajoute une valeur à une cellule (plusieurs lignes de même type le même jour)"""
+    if valeur is None:
+        return
+    cle = (ligne, column_index_from_string(colonne))
+    if isinstance(valeur, str):
+        cellules[cle] = f"{cellules[cle]} + {valeur}" if cle in cellules else valeur
+    else:
+        cellules[cle] = cellules.get(cle, 0) + valeur
+
+def cellules_devis(devis):
+    """Retourne {(ligne, colonne): valeur} d'un devis dans la disposition de l'ancien classeur"""
+    cellules = {position(ref): libelle for ref, libelle in LIBELLES.items()}
+    cellules.update({(LIGNE_ENTETES, column_index_from_string(col)): libelle
+                     for col, libelle in ENTETES_JOURS.items()})
+
+    # En-tête du devis
+    valeurs = {
+        'ref_client': devis['client_reference'],
+        'taux_change': devis['taux_change'],
+        'total_ariary': devis['total_ariary'],
+        'marge': devis['marge'],
+        'total_euro': devis['total_euro'],
+    }
+    for champ, ref in CELLULES_DEVIS.items():
+        cellules[position(ref)] = valeurs[champ]
+    cellules[position('B1')] = devis['taux_change']
+    cellules[position('B3')] = devis['nombre_personnes']
+    cellules[position('B4')] = devis['nombre_adultes']
+    cellules[position('B5')] = devis['nombre_enfants']
+    cellules[position('B6')] = devis['nombre_bebes']
+    cellules[position('B7')] = devis['date_cotation']
+    cellules[position('B8')] = devis['nombre_chambres']
+
+    # Coûts par catégorie et sous-total
+    for categorie, ref in CELLULES_CATEGORIES.items():
+        if categorie in devis['couts']:
+            cellules[position(ref)] = devis['couts'][categorie]
+    cellules[position('E11')] = sum(devis['couts'].values())
+
+    # Imprévus (ligne 14)
+    if devis['imprevus']:
+        nombre = sum(i['nombre'] or 0 for i in devis['imprevus'])
+        prix = sum(i['prix_ariary'] or 0 for i in devis['imprevus'])
+        cellules[position(CELLULES_IMPREVU['montant'])] = prix / nombre if nombre else prix
+        cellules[position(CELLULES_IMPREVU['nombre'])] = nombre
+        cellules[position(CELLULES_IMPREVU['prix'])] = prix
+
+    # Jours de voyage (lignes 21 à 34)
+    for ligne, jour in zip(LIGNES_JOURS, devis['jours']):
+        col = COLONNES_JOUR
+        cellules[(ligne, column_index_from_string(col['jour_num']))] = jour['numero_jour']
+        cellules[(ligne, column_index_from_string(col['date_jour']))] = jour['date_jour']
+        cellules[(ligne, column_index_from_string(col['destination']))] = jour['destination']
+
+        for t in jour['transferts']:
+            col_nbr, col_prix = TRANSFERTS_JOUR.get(t['type_transfert'], TRANSFERTS_JOUR['Transfert'])
+            if col_nbr:
+                cumuler(cellules, ligne, col[col_nbr], t['nombre_personnes'])
+            cumuler(cellules, ligne, col[col_prix], t['prix_ariary'])
+
+        for l in jour['locations']:
+            cumuler(cellules, ligne, col['location_nbr'], l['nombre_vehicules'])
+            cumuler(cellules, ligne, col['location_prix'], l['prix_ariary'])
+            cumuler(cellules, ligne, col['kilometrage'], l['kilometrage'])
+
+        for g in jour['guidages']:
+            cumuler(cellules, ligne, col['guidage_nbr'], g['nombre_guides'])
+            cumuler(cellules, ligne, col['guidage_prix'], g['prix_ariary'])
+
+        for r in jour['reserves']:
+            prefixe = 'reserve' if r['nom_reserve'] or not r['nom_parc'] else 'parc'
+            cumuler(cellules, ligne, col[f'{prefixe}_nom'], r['nom_reserve'] or r['nom_parc'])
+            cumuler(cellules, ligne, col[f'{prefixe}_nbr'], r['nombre_personnes'])
+            cumuler(cellules, ligne, col[f'{prefixe}_prix'], r['prix_ariary'])
+
+        # Les visites du catalogue occupent les colonnes des réserves
+        for v in jour['visites']:
+            cumuler(cellules, ligne, col['reserve_nom'], v['nom'])
+            cumuler(cellules, ligne, col['reserve_nbr'], v['nombre_personnes'])
+            cumuler(cellules, ligne, col['reserve_prix'], v['prix_total'])
+
+        for h in jour['hebergements']:
+            cumuler(cellules, ligne, col['hotel_nom'], h['nom_hotel'])
+            cumuler(cellules, ligne, col['hotel_nbr'], h['nombre_chambres'])
+            cumuler(cellules, ligne, col['hotel_prix'], h['prix_ariary'])
+            cumuler(cellules, ligne, col['transfert_htl'], h['transfert_htl'])
+
+        for r in jour['repas']:
+            if r['type_repas'] in REPAS_JOUR:
+                col_nbr, col_prix = REPAS_JOUR[r['type_repas']]
+                cumuler(cellules, ligne, col[col_nbr], r['nombre_personnes'])
+                cumuler(cellules, ligne, col[col_prix], r['prix_ariary'])
+
+    return cellules
+
+def creer_styles(wb):
+    """Enregistre une seule fois les styles partagés du classeur et retourne leurs noms"""
+    bordure = Side(style='thin', color='999999')
+    styles = {
+        'libelle': NamedStyle(name='devis_libelle', font=Font(bold=True)),
+        'entete': NamedStyle(name='devis_entete', font=Font(bold=True, color='FFFFFF'),
+                             fill=PatternFill('solid', fgColor='1F4E78'),
+                             border=Border(left=bordure, right=bordure, top=bordure, bottom=bordure),
+                             alignment=Alignment(horizontal='center', wrap_text=True)),
+        'montant': NamedStyle(name='devis_montant', number_format='#,##0'),
+        'euro': NamedStyle(name='devis_euro', number_format='#,##0.00 "€"'),
+        'date': NamedStyle(name='devis_date', number_format='DD/MM/YYYY'),
+    }
+    for style in styles.values():
+        wb.add_named_style(style)
+    return {cle: style.name for cle, style in styles.items()}
+
+def titre_feuille(devis, titres_pris):
+    """Titre "Nom X pax" (lu par l'import), unique et valide pour Excel"""
+    nom = re.sub(r'[\[\]:*?/\\\s]+', '_', (devis['client_nom'] or 'Client').strip()) or 'Client'
+    base = f"{nom} {devis['nombre_personnes'] or 0} pax"[:31]
+    titre, n = base, 2
+    while titre.lower() in titres_pris:
+        suffixe = f" ({n})"
+        titre = base[:31 - len(suffixe)] + suffixe
+        n += 1
+    titres_pris.add(titre.lower())
+    return titre
+
+def ecrire_feuille(wb, titre, cellules, styles):
+    """Écrit une feuille ligne par ligne (mode write_only : aucune grille gardée en mémoire)"""
+    ws = wb.create_sheet(title=titre)
+    ws.column_dimensions['C'].width = 18
+    ws.column_dimensions['AH'].width = 22
+
+    par_ligne = defaultdict(dict)
+    for (ligne, colonne), valeur in cellules.items():
+        par_ligne[ligne][colonne] = valeur
+    euro = position(CELLULES_DEVIS['total_euro'])
+
+    for ligne in range(1, max(par_ligne) + 1):
+        valeurs = par_ligne.get(ligne, {})
+        rangee = []
+        for colonne in range(1, max(valeurs, default=0) + 1):
+            valeur = valeurs.get(colonne)
+            if valeur is None:
+                rangee.append(None)
+                continue
+            cellule = WriteOnlyCell(ws, value=valeur)
+            if ligne == LIGNE_ENTETES:
+                cellule.style = styles['entete']
+            elif isinstance(valeur, str):
+                cellule.style = styles['libelle']
+            elif (ligne, colonne) == euro:
+                cellule.style = styles['euro']
+            elif hasattr(valeur, 'isoformat'):
+                cellule.style = styles['date']
+            else:
+                cellule.style = styles['montant']
+            rangee.append(cellule)
+        ws.append(rangee)
+
+def exporter(conn, devis_ids, fichier_sortie, taille_lot=TAILLE_LOT):
+    """Exporte les devis dans un classeur (une feuille par devis), en flux"""
+    wb = openpyxl.Workbook(write_only=True)
+    styles = creer_styles(wb)
+    titres_pris = set()
+    nombre = 0
+
+    for devis in charger_devis_par_lots(conn, devis_ids, taille_lot):
+        if len(devis['jours']) > len(LIGNES_JOURS):
+            print(f"  ⚠️  {devis['reference']}: {len(devis['jours'])} jours, "
+                  f"seuls les {len(LIGNES_JOURS)} premiers tiennent dans la disposition")
+        ecrire_feuille(wb, titre_feuille(devis, titres_pris), cellules_devis(devis), styles)
+        nombre += 1
+
+    if nombre == 0:
+        wb.create_sheet(title='Aucun devis')
+    wb.save(fichier_sortie)
+    return nombre
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Export des devis au format de l'ancien classeur Excel")
+    parser.add_argument('devis_ids', nargs='*', type=int, help="Identifiants des devis (tous par défaut)")
+    parser.add_argument('--statut', help="Exporter uniquement les devis de ce statut")
+    parser.add_argument('-o', '--sortie', default='export_devis.xlsx', help="Classeur à écrire")
+    parser.add_argument('--lot', type=int, default=TAILLE_LOT, help="Devis chargés par requête")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("EXPORT DES DEVIS VERS EXCEL")
+        print("=" * 80)
+
+        debut = time.perf_counter()
+        devis_ids = selectionner_devis(conn, args.devis_ids, args.statut)
+        nombre = exporter(conn, devis_ids, args.sortie, max(1, args.lot))
+
+        print(f"\n✅ {nombre} devis exporté(s) dans {args.sortie} en {time.perf_counter() - debut:.2f} s")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
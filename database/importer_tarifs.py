@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import des listes de prix fournisseurs (CSV ou XLSX) : compare en mémoire chaque ligne de la liste
+aux lignes actuelles de hotels, visites, types_locations_journalieres et config_prix, affiche les
+différences et, avec --appliquer, n'écrit que les lignes modifiées ou nouvelles (une instruction par lot).
+
+Format : une ligne d'en-tête avec les noms des colonnes de la table ; une cellule vide laisse la valeur
+actuelle inchangée.
+    hotels                        itineraire, nom, prix_double, prix_triple, actif
+    visites                       itineraire, nom, prix_par_personne, prix_par_voiture, type_prix, ...
+    types_locations_journalieres  nom, prix_journalier_sans_carburant, prix_journalier_avec_carburant, actif
+    config_prix                   cle, valeur
+Un classeur XLSX peut contenir une feuille par table (nommée comme la table) ; un CSV vise la table
+donnée par --table ou, à défaut, par le nom du fichier (ex. hotels.csv).
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import openpyxl
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+# Type SQL de chaque colonne de prix importable
+TYPES_COLONNES = {
+    'prix_double': 'NUMERIC', 'prix_triple': 'NUMERIC',
+    'prix_par_personne': 'NUMERIC', 'prix_par_voiture': 'NUMERIC', 'type_prix': 'VARCHAR',
+    'guidage_obligatoire': 'BOOLEAN', 'guidage_prix_base': 'NUMERIC', 'guidage_nb_personnes_base': 'INTEGER',
+    'guidage_type_calcul': 'VARCHAR', 'taxe_communale': 'NUMERIC',
+    'prix_journalier_sans_carburant': 'NUMERIC', 'prix_journalier_avec_carburant': 'NUMERIC',
+    'valeur': 'NUMERIC', 'actif': 'BOOLEAN',
+}
+
+# table -> (colonnes de la clé dans la liste, colonnes importables, colonne identifiant, horodatage de mise à jour)
+TABLES_TARIFS = {
+    'hotels': (('itineraire', 'nom'), ('prix_double', 'prix_triple', 'actif'), 'id', 'updated_at'),
+    'visites': (('itineraire', 'nom'),
+                ('prix_par_personne', 'prix_par_voiture', 'type_prix', 'guidage_obligatoire', 'guidage_prix_base',
+                 'guidage_nb_personnes_base', 'guidage_type_calcul', 'taxe_communale', 'actif'), 'id', None),
+    'types_locations_journalieres': (('nom',), ('prix_journalier_sans_carburant',
+                                                'prix_journalier_avec_carburant', 'actif'), 'id', None),
+    'config_prix': (('cle',), ('valeur',), 'cle', 'updated_at'),
+}
+
+# Lignes actuelles, indexées par la clé de la liste
+REQUETES_ACTUELLES = {
+    'hotels': """
+        SELECT h.id, i.nom AS itineraire, h.nom, h.prix_double, h.prix_triple, h.actif
+        FROM hotels h JOIN itineraires i ON i.id = h.itineraire_id
+    """,
+    'visites': """
+        SELECT v.id, i.nom AS itineraire, v.nom, v.prix_par_personne, v.prix_par_voiture, v.type_prix,
+               v.guidage_obligatoire, v.guidage_prix_base, v.guidage_nb_personnes_base,
+               v.guidage_type_calcul, v.taxe_communale, v.actif
+        FROM visites v JOIN itineraires i ON i.id = v.itineraire_id
+    """,
+    'types_locations_journalieres': """
+        SELECT id, nom, prix_journalier_sans_carburant, prix_journalier_avec_carburant, actif
+        FROM types_locations_journalieres
+    """,
+    'config_prix': "SELECT cle, valeur FROM config_prix",
+}
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def convertir(colonne, valeur):
+    """Convertit une cellule de la liste dans le type de la colonne (None si vide)"""
+    if valeur is None or str(valeur).strip() == '':
+        return None
+    type_sql = TYPES_COLONNES[colonne]
+    if type_sql == 'NUMERIC':
+        try:
+            return Decimal(str(valeur).replace(' ', '').replace(',', '.'))
+        except InvalidOperation:
+            raise ValueError(f"{colonne}: montant invalide '{valeur}'")
+    if type_sql == 'INTEGER':
+        return int(Decimal(str(valeur)))
+    if type_sql == 'BOOLEAN':
+        if isinstance(valeur, bool):
+            return valeur
+        return str(valeur).strip().lower() in ('1', 'true', 'vrai', 'oui', 'x')
+    return str(valeur).strip()
+
+def lire_csv(chemin):
+    """Lignes (dictionnaires) d'un CSV séparé par des virgules ou des points-virgules"""
+    with open(chemin, 'r', encoding='utf-8-sig', newline='') as f:
+        dialecte = csv.Sniffer().sniff(f.read(4096), delimiters=',;')
+        f.seek(0)
+        return list(csv.DictReader(f, dialect=dialecte))
+
+def lire_feuille(ws):
+    """Lignes (dictionnaires) d'une feuille dont la première ligne porte les en-têtes"""
+    lignes = ws.iter_rows(values_only=True)
+    en_tetes = [str(v).strip() if v is not None else '' for v in next(lignes, ())]
+    return [dict(zip(en_tetes, ligne)) for ligne in lignes if any(v is not None for v in ligne)]
+
+def lire_liste(chemin, table=None):
+    """Retourne {table: [lignes]} pour un CSV ou un classeur XLSX"""
+    chemin = Path(chemin)
+    if chemin.suffix.lower() in ('.xlsx', '.xlsm'):
+        wb = openpyxl.load_workbook(chemin, read_only=True, data_only=True)
+        try:
+            if table:
+                return {table: lire_feuille(wb.worksheets[0])}
+            return {nom: lire_feuille(wb[nom]) for nom in wb.sheetnames if nom in TABLES_TARIFS}
+        finally:
+            wb.close()
+    return {table or chemin.stem: lire_csv(chemin)}
+
+def charger_actuels(cur, table):
+    """Lignes actuelles de la table, indexées par la clé de la liste"""
+    cle, _, _, _ = TABLES_TARIFS[table]
+    cur.execute(REQUETES_ACTUELLES[table])
+    return {tuple(ligne[c] for c in cle): ligne for ligne in cur.fetchall()}
+
+def calculer_diff(table, lignes_liste, actuels):
+    """
+    Compare la liste aux lignes actuelles ; retourne (modifications, ajouts, erreurs) où
+    modifications = [(ligne actuelle, {colonne: (ancienne, nouvelle)})] et ajouts = [(clé, {colonne: valeur})]
+    """
+    cle, colonnes, _, _ = TABLES_TARIFS[table]
+    modifications, ajouts, erreurs = [], [], []
+    vus = set()
+
+    for numero, ligne in enumerate(lignes_liste, 2):
+        valeurs_cle = tuple(str(ligne.get(c) or '').strip() for c in cle)
+        if not all(valeurs_cle):
+            erreurs.append(f"ligne {numero}: clé incomplète ({', '.join(cle)})")
+            continue
+        if valeurs_cle in vus:
+            erreurs.append(f"ligne {numero}: {' / '.join(valeurs_cle)} en double dans la liste")
+            continue
+        vus.add(valeurs_cle)
+
+        try:
+            nouvelles = {c: convertir(c, ligne.get(c)) for c in colonnes if c in ligne}
+        except ValueError as e:
+            erreurs.append(f"ligne {numero}: {e}")
+            continue
+        nouvelles = {c: v for c, v in nouvelles.items() if v is not None}
+
+        actuelle = actuels.get(valeurs_cle)
+        if actuelle is None:
+            ajouts.append((valeurs_cle, nouvelles))
+            continue
+
+        changements = {c: (actuelle[c], v) for c, v in nouvelles.items() if actuelle[c] != v}
+        if changements:
+            modifications.append((actuelle, changements))
+
+    return modifications, ajouts, erreurs
+
+def appliquer_modifications(cur, table, modifications):
+    """Un UPDATE ... FROM (VALUES ...) par ensemble de colonnes modifiées ; les autres lignes ne sont pas touchées"""
+    _, _, identifiant, horodatage = TABLES_TARIFS[table]
+    par_colonnes = {}
+    for actuelle, changements in modifications:
+        colonnes = tuple(sorted(changements))
+        par_colonnes.setdefault(colonnes, []).append(
+            (actuelle[identifiant],) + tuple(changements[c][1] for c in colonnes))
+
+    total = 0
+    for colonnes, lignes in par_colonnes.items():
+        affectations = ", ".join(f"{c} = v.{c}" for c in colonnes)
+        if horodatage:
+            affectations += f", {horodatage} = CURRENT_TIMESTAMP"
+        type_id = 'VARCHAR' if identifiant == 'cle' else 'INTEGER'
+        template = "(" + ", ".join([f"%s::{type_id}"] + [f"%s::{TYPES_COLONNES[c]}" for c in colonnes]) + ")"
+        execute_values(cur, f"""
+            UPDATE {table} t SET {affectations}
+            FROM (VALUES %s) AS v({identifiant}, {', '.join(colonnes)})
+            WHERE t.{identifiant} = v.{identifiant}
+        """, lignes, template=template, page_size=1000)
+        total += len(lignes)
+    return total
+
+def appliquer_ajouts(cur, table, ajouts, itineraire_ids):
+    """Insère les nouvelles lignes (un INSERT multi-lignes par ensemble de colonnes) ; retourne (insérées, ignorées)"""
+    cle, _, _, _ = TABLES_TARIFS[table]
+    par_colonnes, ignores = {}, []
+    for valeurs_cle, nouvelles in ajouts:
+        if cle[0] == 'itineraire':
+            if valeurs_cle[0] not in itineraire_ids:
+                ignores.append(f"{' / '.join(valeurs_cle)}: itinéraire inconnu")
+                continue
+            colonnes_cle, valeurs = ('itineraire_id', 'nom'), (itineraire_ids[valeurs_cle[0]], valeurs_cle[1])
+        else:
+            colonnes_cle, valeurs = cle, valeurs_cle
+        colonnes = tuple(sorted(nouvelles))
+        par_colonnes.setdefault((colonnes_cle, colonnes), []).append(valeurs + tuple(nouvelles[c] for c in colonnes))
+
+    total = 0
+    for (colonnes_cle, colonnes), lignes in par_colonnes.items():
+        execute_values(cur, f"INSERT INTO {table} ({', '.join(colonnes_cle + colonnes)}) VALUES %s",
+                       lignes, page_size=1000)
+        total += len(lignes)
+    return total, ignores
+
+def afficher_diff(table, modifications, ajouts, erreurs, limite):
+    """Affiche les différences d'une table"""
+    print(f"\n📌 {table} : {len(modifications)} modification(s), {len(ajouts)} ajout(s), {len(erreurs)} erreur(s)")
+    for actuelle, changements in modifications[:limite]:
+        cle = ' / '.join(str(actuelle[c]) for c in TABLES_TARIFS[table][0])
+        details = ", ".join(f"{c} {ancienne} → {nouvelle}" for c, (ancienne, nouvelle) in changements.items())
+        print(f"   ~ {cle} : {details}")
+    for valeurs_cle, nouvelles in ajouts[:limite]:
+        details = ", ".join(f"{c} {v}" for c, v in nouvelles.items())
+        print(f"   + {' / '.join(valeurs_cle)} : {details}")
+    if len(modifications) > limite or len(ajouts) > limite:
+        print("   ...")
+    for erreur in erreurs:
+        print(f"   ⚠️  {erreur}")
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Import des listes de prix fournisseurs (différences seulement)")
+    parser.add_argument('fichiers', nargs='+', help="Listes de prix .csv ou .xlsx")
+    parser.add_argument('--table', choices=sorted(TABLES_TARIFS), help="Table visée (sinon nom du fichier ou des feuilles)")
+    parser.add_argument('--appliquer', action='store_true', help="Écrire les différences (sinon simple aperçu)")
+    parser.add_argument('--sans-ajouts', action='store_true', help="Ne pas créer les lignes absentes de la base")
+    parser.add_argument('--limite', type=int, default=50, help="Différences affichées par table")
+    args = parser.parse_args()
+
+    listes = {}
+    for fichier in args.fichiers:
+        for table, lignes in lire_liste(fichier, args.table).items():
+            if table not in TABLES_TARIFS:
+                print(f"ERREUR: Table inconnue '{table}' ({fichier}) ; utiliser --table")
+                sys.exit(1)
+            listes.setdefault(table, []).extend(lignes)
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("IMPORT DES LISTES DE PRIX FOURNISSEURS")
+        print("=" * 80)
+
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT nom, id FROM itineraires")
+        itineraire_ids = {ligne['nom']: ligne['id'] for ligne in cur.fetchall()}
+
+        differences = {}
+        for table, lignes in listes.items():
+            debut = time.perf_counter()
+            modifications, ajouts, erreurs = calculer_diff(table, lignes, charger_actuels(cur, table))
+            if args.sans_ajouts:
+                ajouts = []
+            afficher_diff(table, modifications, ajouts, erreurs, args.limite)
+            print(f"   ({len(lignes)} ligne(s) comparée(s) en {time.perf_counter() - debut:.2f} s)")
+            differences[table] = (modifications, ajouts)
+
+        if not args.appliquer:
+            conn.rollback()
+            print("\nAperçu seulement : relancer avec --appliquer pour écrire les différences")
+            return
+
+        # Toutes les tables dans une transaction ; les tables sans différence ne sont pas touchées
+        debut = time.perf_counter()
+        for table, (modifications, ajouts) in differences.items():
+            modifiees = appliquer_modifications(cur, table, modifications) if modifications else 0
+            inserees, ignores = appliquer_ajouts(cur, table, ajouts, itineraire_ids) if ajouts else (0, [])
+            print(f"\n✓ {table} : {modifiees} ligne(s) mise(s) à jour, {inserees} ajoutée(s)")
+            for ignore in ignores:
+                print(f"   ⚠️  {ignore}")
+        conn.commit()
+
+        # Quantiles de prix de l'optimiseur d'hébergement : rafraîchis une fois si les hôtels ont changé
+        if any(differences.get('hotels', ())):
+            cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY quantiles_prix_hotels")
+            conn.commit()
+            print("✓ quantiles_prix_hotels rafraîchie")
+        cur.close()
+        print(f"\n✅ Différences appliquées ({time.perf_counter() - debut:.2f} s)")
+    except Exception as e:
+        conn.rollback()
+        print(f"\n❌ Erreur: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script pour insérer le graphe des distances routières entre itinéraires
+depuis le fichier database/distances_itineraires.csv
+"""
+
+import csv
+import psycopg2
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+# Distances routières approximatives (km), une arête par ligne
+FICHIER_DISTANCES = 'database/distances_itineraires.csv'
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def lire_distances(nom_fichier):
+    """Lit les arêtes (itinéraire A, itinéraire B, distance en km) du fichier CSV"""
+    with open(nom_fichier, 'r', encoding='utf-8', newline='') as f:
+        return [(ligne['itineraire_a'].strip(), ligne['itineraire_b'].strip(), int(ligne['distance_km']))
+                for ligne in csv.DictReader(f)]
+
+def insert_data():
+    """Insère les distances dans la base de données"""
+    conn = connect_db()
+    if not conn:
+        return
+
+    cur = conn.cursor()
+
+    try:
+        print("=" * 80)
+        print("INSERTION DU GRAPHE DES DISTANCES ENTRE ITINÉRAIRES")
+        print("=" * 80)
+
+        distances = lire_distances(FICHIER_DISTANCES)
+
+        cur.execute("SELECT nom, id FROM itineraires")
+        itineraire_ids = dict(cur.fetchall())
+
+        print(f"\n1. Insertion de {len(distances)} distance(s)...")
+        total = 0
+        for nom_a, nom_b, distance_km in distances:
+            if nom_a not in itineraire_ids or nom_b not in itineraire_ids:
+                print(f"  ⚠️  Itinéraire inconnu: {nom_a} / {nom_b}")
+                continue
+
+            id_a, id_b = sorted((itineraire_ids[nom_a], itineraire_ids[nom_b]))
+            cur.execute("""
+                INSERT INTO distances_itineraires (itineraire_a_id, itineraire_b_id, distance_km)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (itineraire_a_id, itineraire_b_id) DO UPDATE SET
+                    distance_km = EXCLUDED.distance_km,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE distances_itineraires.distance_km IS DISTINCT FROM EXCLUDED.distance_km
+            """, (id_a, id_b, distance_km))
+            total += 1
+            print(f"  ✓ {nom_a} ↔ {nom_b}: {distance_km} km")
+
+        conn.commit()
+
+        print(f"\n✅ Insertion terminée!")
+        print(f"   - {total} distance(s)")
+
+    except Exception as e:
+        print(f"\n❌ Erreur: {e}")
+        import traceback
+        traceback.print_exc()
+        conn.rollback()
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    insert_data()
+    print("\n" + "=" * 80)
@@ -4,15 +4,23 @@
 Script de migration des données Excel vers PostgreSQL
 """
 
-import pandas as pd
+import argparse
+import csv
+import hashlib
+import io
+import os
+import time
 import openpyxl
-from openpyxl.utils import get_column_letter
+from openpyxl.utils import get_column_letter, column_index_from_string
 import psycopg2
 from psycopg2.extras import execute_values
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import sys
 from pathlib import Path
 
+from appliquer_migrations import versions_en_attente
+
 # Configuration de la base de données
 DB_CONFIG = {
     'host': 'localhost',
@@ -22,6 +30,83 @@ DB_CONFIG = {
     'port': 5432
 }
 
+# Zone lue dans chaque feuille : lignes 1-54, colonnes A-BA
+DERNIERE_LIGNE = 54
+DERNIERE_COLONNE = 53
+
+# Cellules de l'en-tête du devis
+CELLULES_DEVIS = {
+    'ref_client': 'A2',
+    'taux_change': 'L2',
+    'total_ariary': 'I3',
+    'marge': 'I4',
+    'total_euro': 'I6',
+}
+
+# Coûts par catégorie (lignes 2-10) : catégorie -> cellule du montant
+CELLULES_CATEGORIES = {
+    'Pirogue': 'E2',
+    'Bateau': 'E3',
+    'Location': 'E4',
+    'Guidage': 'E5',
+    'Carburant': 'E6',
+    'Reserves': 'E7',
+    'Parcs': 'E8',
+    'hebergements': 'E9',
+    'Repas': 'E10',
+}
+
+# Imprévus (ligne 14)
+CELLULES_IMPREVU = {
+    'montant': 'D14',
+    'nombre': 'E14',
+    'prix': 'F14',
+}
+
+# Lignes jour par jour de l'itinéraire (21 à 34) : champ -> colonne
+LIGNES_JOURS = range(21, 35)
+COLONNES_JOUR = {
+    'jour_num': 'A',
+    'date_jour': 'B',
+    'destination': 'C',
+    'transfert_prix': 'F',
+    'pirogue_nbr': 'H',
+    'pirogue_prix': 'I',
+    'bateau_nbr': 'K',
+    'bateau_prix': 'L',
+    'location_nbr': 'N',
+    'location_prix': 'O',
+    'kilometrage': 'P',
+    'guidage_nbr': 'R',
+    'guidage_prix': 'S',
+    'reserve_nom': 'T',
+    'reserve_prix': 'U',
+    'reserve_nbr': 'V',
+    'parc_nom': 'Y',
+    'parc_prix': 'Z',
+    'parc_nbr': 'AA',
+    'transfert_htl': 'AE',
+    'hotel_nom': 'AH',
+    'hotel_prix': 'AI',
+    'hotel_nbr': 'AJ',
+    'vinette_nbr': 'AQ',
+    'vinette_prix': 'AR',
+    'pd_nbr': 'AT',
+    'pd_prix': 'AU',
+    'dn_nbr': 'AW',
+    'dn_prix': 'AX',
+    'dj_nbr': 'AZ',
+    'dj_prix': 'BA',
+}
+
+# Repas : type -> (colonne nombre, colonne prix)
+REPAS_JOUR = {
+    'Vinette': ('vinette_nbr', 'vinette_prix'),
+    'PD': ('pd_nbr', 'pd_prix'),
+    'DN': ('dn_nbr', 'dn_prix'),
+    'DJ': ('dj_nbr', 'dj_prix'),
+}
+
 def convertir_colonne_excel(num):
     """Convertit un numéro de colonne en lettre Excel"""
     return get_column_letter(num)
@@ -35,280 +120,803 @@ def connect_db():
         print(f"Erreur de connexion à la base de données: {e}")
         sys.exit(1)
 
-def migrer_feuille_excel(nom_fichier, nom_feuille, conn):
-    """Migre une feuille Excel vers la base de données"""
-    print(f"\n{'='*80}")
-    print(f"Migration de la feuille: {nom_feuille}")
-    print(f"{'='*80}")
-    
-    wb = openpyxl.load_workbook(nom_fichier, data_only=True)
-    ws = wb[nom_feuille]
-    cur = conn.cursor()
-    
+def lire_lignes_feuille(ws):
+    """Charge la zone A1:BA54 d'une feuille en une seule passe (tampon de lignes)"""
+    return [list(ligne) for ligne in ws.iter_rows(min_row=1, max_row=DERNIERE_LIGNE,
+                                                  max_col=DERNIERE_COLONNE, values_only=True)]
+
+def valeur_cellule(lignes, reference):
+    """Retourne la valeur d'une cellule du tampon à partir de sa référence Excel (ex: 'AH21')"""
+    colonne = reference.rstrip('0123456789')
+    ligne = int(reference[len(colonne):])
+    return valeur_colonne(lignes, ligne, colonne)
+
+def valeur_colonne(lignes, ligne, colonne):
+    """Retourne la valeur d'une colonne (lettre Excel) d'une ligne du tampon"""
+    index = column_index_from_string(colonne) - 1
+    if ligne > len(lignes) or index >= len(lignes[ligne - 1]):
+        return None
+    return lignes[ligne - 1][index]
+
+def lire_feuille_excel(nom_feuille, lignes):
+    """Extrait le devis d'une feuille (tampon de lignes) selon les tables de correspondance"""
     # Extraire les informations du client depuis le nom de la feuille
     # Format attendu: "Nom X pax" où X est le nombre de personnes
     parts = nom_feuille.split()
     nom_client = parts[0] if len(parts) > 0 else nom_feuille
     nb_pax = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
-    
-    # Lire les données de base (lignes 1-18)
-    ref_client = ws['A2'].value or f"CLIENT_{nom_client}"
-    date_cotation = datetime.now().date()  # Par défaut aujourd'hui
-    taux_change = ws['L2'].value if ws['L2'].value else 4420
-    
+
+    entete = {champ: valeur_cellule(lignes, ref) for champ, ref in CELLULES_DEVIS.items()}
+    taux_change = entete['taux_change'] if entete['taux_change'] else 4420
+
     # Extraire le nombre d'adultes, enfants, bébés
     nb_adultes = 0
     nb_enfants = 0
     nb_bebes = 0
-    
+
     for row in range(2, 8):
-        label = ws[f'A{row}'].value
+        label = valeur_colonne(lignes, row, 'A')
         if label == 'Adulte':
             nb_adultes = nb_pax  # Approximation
         elif label == 'Enfant':
             nb_enfants = 0  # À déterminer depuis les données
         elif label == 'Bébé':
             nb_bebes = 0
-    
-    # Extraire les totaux
-    total_ariary = ws['I3'].value or 0
-    marge = ws['I4'].value or 0
-    total_euro = ws['I6'].value or 0
-    
+
+    devis = {
+        'nom_feuille': nom_feuille,
+        'nom_client': nom_client,
+        'ref_client': entete['ref_client'] or f"CLIENT_{nom_client}",
+        'reference': f"DEV-{nom_client}-{datetime.now().strftime('%Y%m%d')}",
+        'date_cotation': datetime.now().date(),  # Par défaut aujourd'hui
+        'nombre_personnes': nb_pax,
+        'nombre_adultes': nb_adultes,
+        'nombre_enfants': nb_enfants,
+        'nombre_bebes': nb_bebes,
+        'taux_change': taux_change,
+        'total_ariary': entete['total_ariary'] or 0,
+        'marge': entete['marge'] or 0,
+        'total_euro': entete['total_euro'] or 0,
+        'couts': [],
+        'jours': [],
+        'imprevus': [],
+    }
+
+    # Coûts par catégorie
+    for cat_nom, cellule in CELLULES_CATEGORIES.items():
+        montant = valeur_cellule(lignes, cellule)
+        if montant:
+            devis['couts'].append((cat_nom, montant, montant / taux_change if taux_change else 0))
+
+    # Jours de voyage
+    for row in LIGNES_JOURS:
+        c = {champ: valeur_colonne(lignes, row, col) for champ, col in COLONNES_JOUR.items()}
+        jour_num = c['jour_num']
+        if not (jour_num and isinstance(jour_num, (int, float))):
+            continue
+
+        jour = {
+            'numero_jour': int(jour_num),
+            'date_jour': int(c['date_jour']) if c['date_jour'] else None,
+            'destination': c['destination'],
+            'transferts': [],
+            'locations': [],
+            'guidages': [],
+            'reserves': [],
+            'hebergements': [],
+            'repas': [],
+        }
+
+        # (type_transfert, nombre_personnes, prix_ariary)
+        if c['transfert_prix']:
+            jour['transferts'].append(('Transfert', 0, c['transfert_prix']))
+        if c['pirogue_nbr'] or c['pirogue_prix']:
+            jour['transferts'].append(('Pirogue', c['pirogue_nbr'] or 0, c['pirogue_prix'] or 0))
+        if c['bateau_nbr'] or c['bateau_prix']:
+            jour['transferts'].append(('Bateau', c['bateau_nbr'] or 0, c['bateau_prix'] or 0))
+
+        # (type_location, nombre_vehicules, prix_ariary, kilometrage)
+        if c['location_nbr'] or c['location_prix']:
+            jour['locations'].append(('Location sans carburant', c['location_nbr'] or 0,
+                                      c['location_prix'] or 0, c['kilometrage'] or 0))
+
+        # (nombre_guides, prix_ariary)
+        if c['guidage_nbr'] or c['guidage_prix']:
+            jour['guidages'].append((c['guidage_nbr'] or 0, c['guidage_prix'] or 0))
+
+        # (nom_reserve, nom_parc, nombre_personnes, prix_ariary)
+        if c['reserve_nom'] or c['reserve_prix']:
+            jour['reserves'].append((c['reserve_nom'], None, c['reserve_nbr'] or 0, c['reserve_prix'] or 0))
+        if c['parc_nom'] or c['parc_prix']:
+            jour['reserves'].append((None, c['parc_nom'], c['parc_nbr'] or 0, c['parc_prix'] or 0))
+
+        # (type_chambre, nom_hotel, nombre_chambres, prix_ariary, transfert_htl)
+        if c['hotel_nom'] or c['hotel_prix']:
+            jour['hebergements'].append(('Double', c['hotel_nom'], c['hotel_nbr'] or 0,
+                                         c['hotel_prix'] or 0, c['transfert_htl'] or 0))
+
+        # (type_repas, nombre_personnes, prix_ariary)
+        for type_repas, (col_nbr, col_prix) in REPAS_JOUR.items():
+            if c[col_nbr] or c[col_prix]:
+                jour['repas'].append((type_repas, c[col_nbr] or 0, c[col_prix] or 0))
+
+        devis['jours'].append(jour)
+
+    # Imprévus : (description, nombre, prix_ariary)
+    imprevu = {champ: valeur_cellule(lignes, ref) for champ, ref in CELLULES_IMPREVU.items()}
+    if imprevu['montant'] or imprevu['prix']:
+        devis['imprevus'].append(('Imprevu', imprevu['nombre'] or 0, imprevu['prix'] or 0))
+
+    return devis
+
+# Devis déjà importés que la réimportation de leur feuille ne doit pas écraser : motif, ou NULL
+MOTIF_DEVIS_PROTEGE = """
+    CASE WHEN d.supprime_le IS NOT NULL THEN 'devis supprimé'
+         WHEN COALESCE(d.statut, 'brouillon') <> 'brouillon' THEN 'devis ' || d.statut
+    END
+"""
+
+# Feuille déjà importée dont le devis a quitté la table devis (archivé, purgé) : le registre garde la
+# feuille avec un devis_id NULL (ON DELETE SET NULL) ou, pendant l'import, un id qui n'existe plus
+MOTIF_DEVIS_RETIRE = 'devis archivé ou purgé'
+
+class DevisProtege(Exception):
+    """Feuille modifiée dont le devis ne peut plus être remplacé (motif en message)"""
+
+def charger_categories(conn):
+    """Charge une seule fois les identifiants des catégories de coûts"""
+    cur = conn.cursor()
+    cur.execute("SELECT nom, id FROM categories_couts")
+    categorie_ids = dict(cur.fetchall())
+    cur.close()
+    return categorie_ids
+
+def ecrire_devis(devis, conn, categorie_ids):
+    """Écrit un devis extrait d'une feuille dans la base de données (DevisProtege si son devis est protégé)"""
+    cur = conn.cursor()
+
+    # Un devis protégé (supprimé, finalisé) ou disparu (archivé, purgé) n'est ni remplacé ni ressuscité
+    if devis.get('devis_id'):
+        cur.execute(f"SELECT {MOTIF_DEVIS_PROTEGE} FROM devis d WHERE d.id = %s FOR UPDATE", (devis['devis_id'],))
+        ligne = cur.fetchone()
+        if not ligne or ligne[0]:
+            cur.close()
+            raise DevisProtege(ligne[0] if ligne else MOTIF_DEVIS_RETIRE)
+
     # Créer ou récupérer le client
     cur.execute("""
-        INSERT INTO clients (reference, nom) 
+        INSERT INTO clients (reference, nom)
         VALUES (%s, %s)
         ON CONFLICT (reference) DO UPDATE SET nom = EXCLUDED.nom
         RETURNING id
-    """, (ref_client, nom_client))
+    """, (devis['ref_client'], devis['nom_client']))
     client_id = cur.fetchone()[0]
-    
-    # Créer le devis
-    reference_devis = f"DEV-{nom_client}-{datetime.now().strftime('%Y%m%d')}"
+
+    # Créer le devis (ou remplacer celui d'une feuille déjà importée, en gardant son id et sa référence)
+    reference_devis = devis['reference']
+    devis_id = devis.get('devis_id')
+    if devis_id:
+        cur.execute("DELETE FROM devis WHERE id = %s RETURNING reference", (devis_id,))
+        precedent = cur.fetchone()
+        if precedent:
+            reference_devis = precedent[0]
+    else:
+        cur.execute("SELECT nextval(pg_get_serial_sequence('devis', 'id'))")
+        devis_id = cur.fetchone()[0]
+        cur.execute("SELECT 1 FROM devis WHERE reference = %s", (reference_devis,))
+        if cur.fetchone():
+            reference_devis = f"{reference_devis}-{devis_id}"
+
     cur.execute("""
         INSERT INTO devis (
-            client_id, reference, date_cotation, nombre_personnes,
+            id, client_id, reference, date_cotation, nombre_personnes,
             nombre_adultes, nombre_enfants, nombre_bebes,
             taux_change, total_ariary, total_euro, marge
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        RETURNING id
-    """, (client_id, reference_devis, date_cotation, nb_pax,
-          nb_adultes, nb_enfants, nb_bebes, taux_change,
-          total_ariary, total_euro, marge))
-    devis_id = cur.fetchone()[0]
-    
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (devis_id, client_id, reference_devis, devis['date_cotation'], devis['nombre_personnes'],
+          devis['nombre_adultes'], devis['nombre_enfants'], devis['nombre_bebes'], devis['taux_change'],
+          devis['total_ariary'], devis['total_euro'], devis['marge']))
+
     print(f"Devis créé: {reference_devis} (ID: {devis_id})")
-    
-    # Migrer les coûts par catégorie (lignes 2-11)
-    categories_map = {
-        'Pirogue': ('D2', 'E2'),
-        'Bateau': ('D3', 'E3'),
-        'Location': ('D4', 'E4'),
-        'Guidage': ('D5', 'E5'),
-        'Carburant': ('D6', 'E6'),
-        'Reserves': ('D7', 'E7'),
-        'Parcs': ('D8', 'E8'),
-        'hebergements': ('D9', 'E9'),
-        'Repas': ('D10', 'E10'),
-    }
-    
-    for cat_nom, (cell_nom, cell_montant) in categories_map.items():
-        montant = ws[cell_montant].value
-        if montant:
-            cur.execute("SELECT id FROM categories_couts WHERE nom = %s", (cat_nom,))
-            cat_result = cur.fetchone()
-            if cat_result:
-                cat_id = cat_result[0]
-                montant_euro = montant / taux_change if taux_change else 0
-                cur.execute("""
-                    INSERT INTO couts_devis (devis_id, categorie_id, montant_ariary, montant_euro)
-                    VALUES (%s, %s, %s, %s)
-                """, (devis_id, cat_id, montant, montant_euro))
-    
-    # Migrer les jours de voyage (lignes 21-34)
-    jours_data = []
-    for row in range(21, 35):
-        jour_num = ws[f'A{row}'].value
-        date_jour = ws[f'B{row}'].value
-        destination = ws[f'C{row}'].value
-        
-        if jour_num and isinstance(jour_num, (int, float)):
+
+    # Migrer les coûts par catégorie
+    couts = [(devis_id, categorie_ids[cat_nom], montant, montant_euro)
+             for cat_nom, montant, montant_euro in devis['couts'] if cat_nom in categorie_ids]
+    if couts:
+        execute_values(cur, """
+            INSERT INTO couts_devis (devis_id, categorie_id, montant_ariary, montant_euro) VALUES %s
+        """, couts)
+
+    # Migrer les jours de voyage
+    for jour in devis['jours']:
+        cur.execute("""
+            INSERT INTO jours_voyage (devis_id, numero_jour, date_jour, destination, ordre)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING id
+        """, (devis_id, jour['numero_jour'], jour['date_jour'], jour['destination'], jour['numero_jour']))
+        jour_id = cur.fetchone()[0]
+
+        for type_transfert, nombre_personnes, prix in jour['transferts']:
+            cur.execute("""
+                INSERT INTO transferts (jour_voyage_id, type_transfert, nombre_personnes, prix_ariary)
+                VALUES (%s, %s, %s, %s)
+            """, (jour_id, type_transfert, nombre_personnes, prix))
+
+        for type_location, nombre_vehicules, prix, kilometrage in jour['locations']:
+            cur.execute("""
+                INSERT INTO locations_vehicules (jour_voyage_id, type_location, nombre_vehicules, prix_ariary, kilometrage)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (jour_id, type_location, nombre_vehicules, prix, kilometrage))
+
+        for nombre_guides, prix in jour['guidages']:
+            cur.execute("""
+                INSERT INTO guidages (jour_voyage_id, nombre_guides, prix_ariary)
+                VALUES (%s, %s, %s)
+            """, (jour_id, nombre_guides, prix))
+
+        for nom_reserve, nom_parc, nombre_personnes, prix in jour['reserves']:
             cur.execute("""
-                INSERT INTO jours_voyage (devis_id, numero_jour, date_jour, destination, ordre)
+                INSERT INTO reserves_parcs (jour_voyage_id, nom_reserve, nom_parc, nombre_personnes, prix_ariary)
                 VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-            """, (devis_id, int(jour_num), int(date_jour) if date_jour else None, destination, int(jour_num)))
-            jour_id = cur.fetchone()[0]
-            
-            # Migrer les transferts
-            transfert_prix = ws[f'F{row}'].value
-            if transfert_prix:
-                cur.execute("""
-                    INSERT INTO transferts (jour_voyage_id, type_transfert, prix_ariary)
-                    VALUES (%s, %s, %s)
-                """, (jour_id, 'Transfert', transfert_prix))
-            
-            pirogue_nbr = ws[f'H{row}'].value
-            pirogue_prix = ws[f'I{row}'].value
-            if pirogue_nbr or pirogue_prix:
-                cur.execute("""
-                    INSERT INTO transferts (jour_voyage_id, type_transfert, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, 'Pirogue', pirogue_nbr or 0, pirogue_prix or 0))
-            
-            bateau_nbr = ws[f'K{row}'].value
-            bateau_prix = ws[f'L{row}'].value
-            if bateau_nbr or bateau_prix:
-                cur.execute("""
-                    INSERT INTO transferts (jour_voyage_id, type_transfert, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, 'Bateau', bateau_nbr or 0, bateau_prix or 0))
-            
-            # Migrer les locations
-            location_nbr = ws[f'N{row}'].value
-            location_prix = ws[f'O{row}'].value
-            kilometrage = ws[f'P{row}'].value
-            if location_nbr or location_prix:
-                cur.execute("""
-                    INSERT INTO locations_vehicules (jour_voyage_id, type_location, nombre_vehicules, prix_ariary, kilometrage)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (jour_id, 'Location sans carburant', location_nbr or 0, location_prix or 0, kilometrage or 0))
-            
-            # Migrer les guidages
-            guidage_nbr = ws[f'R{row}'].value
-            guidage_prix = ws[f'S{row}'].value
-            if guidage_nbr or guidage_prix:
-                cur.execute("""
-                    INSERT INTO guidages (jour_voyage_id, nombre_guides, prix_ariary)
-                    VALUES (%s, %s, %s)
-                """, (jour_id, guidage_nbr or 0, guidage_prix or 0))
-            
-            # Migrer les réserves/parcs
-            reserve_nom = ws[f'T{row}'].value
-            reserve_prix = ws[f'U{row}'].value
-            reserve_nbr = ws[f'V{row}'].value
-            parc_nom = ws[f'Y{row}'].value
-            parc_prix = ws[f'Z{row}'].value
-            parc_nbr = ws[f'AA{row}'].value
-            
-            if reserve_nom or reserve_prix:
-                cur.execute("""
-                    INSERT INTO reserves_parcs (jour_voyage_id, nom_reserve, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, reserve_nom, reserve_nbr or 0, reserve_prix or 0))
-            
-            if parc_nom or parc_prix:
-                cur.execute("""
-                    INSERT INTO reserves_parcs (jour_voyage_id, nom_parc, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, parc_nom, parc_nbr or 0, parc_prix or 0))
-            
-            # Migrer les hébergements
-            hotel_nom = ws[f'AH{row}'].value
-            hotel_prix = ws[f'AI{row}'].value
-            hotel_nbr = ws[f'AJ{row}'].value
-            transfert_htl = ws[f'AE{row}'].value
-            
-            if hotel_nom or hotel_prix:
-                cur.execute("""
-                    INSERT INTO hebergements (jour_voyage_id, type_chambre, nom_hotel, nombre_chambres, prix_ariary, transfert_htl)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (jour_id, 'Double', hotel_nom, hotel_nbr or 0, hotel_prix or 0, transfert_htl or 0))
-            
-            # Migrer les repas
-            vinette_nbr = ws[f'AQ{row}'].value
-            vinette_prix = ws[f'AR{row}'].value
-            pd_nbr = ws[f'AT{row}'].value
-            pd_prix = ws[f'AU{row}'].value
-            dn_nbr = ws[f'AW{row}'].value
-            dn_prix = ws[f'AX{row}'].value
-            dj_nbr = ws[f'AZ{row}'].value
-            dj_prix = ws[f'BA{row}'].value
-            
-            if vinette_nbr or vinette_prix:
-                cur.execute("""
-                    INSERT INTO repas (jour_voyage_id, type_repas, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, 'Vinette', vinette_nbr or 0, vinette_prix or 0))
-            
-            if pd_nbr or pd_prix:
-                cur.execute("""
-                    INSERT INTO repas (jour_voyage_id, type_repas, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, 'PD', pd_nbr or 0, pd_prix or 0))
-            
-            if dn_nbr or dn_prix:
-                cur.execute("""
-                    INSERT INTO repas (jour_voyage_id, type_repas, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, 'DN', dn_nbr or 0, dn_prix or 0))
-            
-            if dj_nbr or dj_prix:
-                cur.execute("""
-                    INSERT INTO repas (jour_voyage_id, type_repas, nombre_personnes, prix_ariary)
-                    VALUES (%s, %s, %s, %s)
-                """, (jour_id, 'DJ', dj_nbr or 0, dj_prix or 0))
-    
-    # Migrer les imprévus (ligne 14)
-    imprevu_montant = ws['D14'].value
-    imprevu_nbr = ws['E14'].value
-    imprevu_prix = ws['F14'].value
-    if imprevu_montant or imprevu_prix:
+            """, (jour_id, nom_reserve, nom_parc, nombre_personnes, prix))
+
+        for type_chambre, nom_hotel, nombre_chambres, prix, transfert_htl in jour['hebergements']:
+            cur.execute("""
+                INSERT INTO hebergements (jour_voyage_id, type_chambre, nom_hotel, nombre_chambres, prix_ariary, transfert_htl)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (jour_id, type_chambre, nom_hotel, nombre_chambres, prix, transfert_htl))
+
+        for type_repas, nombre_personnes, prix in jour['repas']:
+            cur.execute("""
+                INSERT INTO repas (jour_voyage_id, type_repas, nombre_personnes, prix_ariary)
+                VALUES (%s, %s, %s, %s)
+            """, (jour_id, type_repas, nombre_personnes, prix))
+
+    # Migrer les imprévus
+    for description, nombre, prix in devis['imprevus']:
         cur.execute("""
             INSERT INTO imprevus (devis_id, description, nombre, prix_ariary)
             VALUES (%s, %s, %s, %s)
-        """, (devis_id, 'Imprevu', imprevu_nbr or 0, imprevu_prix or 0))
-    
-    conn.commit()
-    print(f"✓ Migration terminée pour {nom_feuille}")
+        """, (devis_id, description, nombre, prix))
+
+    # Point de reprise de l'import incrémental
+    if devis.get('hash_contenu'):
+        cur.execute("""
+            INSERT INTO imports_feuilles (fichier, feuille, hash_contenu, devis_id,
+                                          total_ariary_excel, marge_excel, total_euro_excel)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (fichier, feuille) DO UPDATE SET
+                hash_contenu = EXCLUDED.hash_contenu,
+                devis_id = EXCLUDED.devis_id,
+                total_ariary_excel = EXCLUDED.total_ariary_excel,
+                marge_excel = EXCLUDED.marge_excel,
+                total_euro_excel = EXCLUDED.total_euro_excel,
+                importe_le = CURRENT_TIMESTAMP
+        """, (devis['classeur'], devis['nom_feuille'], devis['hash_contenu'], devis_id,
+              devis['total_ariary'], devis['marge'], devis['total_euro']))
+
     return devis_id
 
+# Chargement par lots : COPY dans des tables de transit UNLOGGED puis INSERT ... SELECT
+TAILLE_LOT = 200  # Nombre de feuilles par lot (un lot = une transaction)
+
+SCHEMA_TRANSIT = """
+CREATE UNLOGGED TABLE IF NOT EXISTS import_devis (
+    cle_devis INTEGER PRIMARY KEY,
+    devis_id INTEGER,
+    ref_client TEXT,
+    nom_client TEXT,
+    reference TEXT,
+    date_cotation DATE,
+    nombre_personnes NUMERIC,
+    nombre_adultes NUMERIC,
+    nombre_enfants NUMERIC,
+    nombre_bebes NUMERIC,
+    taux_change NUMERIC,
+    total_ariary NUMERIC,
+    total_euro NUMERIC,
+    marge NUMERIC,
+    classeur TEXT,
+    nom_feuille TEXT,
+    hash_contenu TEXT
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_couts (
+    cle_devis INTEGER, categorie_id INTEGER, montant_ariary NUMERIC, montant_euro NUMERIC
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_jours (
+    cle_jour INTEGER PRIMARY KEY, jour_id INTEGER, cle_devis INTEGER,
+    numero_jour NUMERIC, date_jour NUMERIC, destination TEXT
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_transferts (
+    cle_jour INTEGER, type_transfert TEXT, nombre_personnes NUMERIC, prix_ariary NUMERIC
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_locations (
+    cle_jour INTEGER, type_location TEXT, nombre_vehicules NUMERIC, prix_ariary NUMERIC, kilometrage NUMERIC
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_guidages (
+    cle_jour INTEGER, nombre_guides NUMERIC, prix_ariary NUMERIC
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_reserves (
+    cle_jour INTEGER, nom_reserve TEXT, nom_parc TEXT, nombre_personnes NUMERIC, prix_ariary NUMERIC
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_hebergements (
+    cle_jour INTEGER, type_chambre TEXT, nom_hotel TEXT, nombre_chambres NUMERIC,
+    prix_ariary NUMERIC, transfert_htl NUMERIC
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_repas (
+    cle_jour INTEGER, type_repas TEXT, nombre_personnes NUMERIC, prix_ariary NUMERIC
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS import_imprevus (
+    cle_devis INTEGER, description TEXT, nombre NUMERIC, prix_ariary NUMERIC
+);
+"""
+
+COLONNES_DEVIS_TRANSIT = (
+    'devis_id', 'ref_client', 'nom_client', 'reference', 'date_cotation', 'nombre_personnes',
+    'nombre_adultes', 'nombre_enfants', 'nombre_bebes', 'taux_change',
+    'total_ariary', 'total_euro', 'marge', 'classeur', 'nom_feuille', 'hash_contenu',
+)
+
+# Lignes d'un jour : clé du devis extrait -> (table de transit, table cible, colonnes)
+LIGNES_JOUR_TRANSIT = {
+    'transferts': ('import_transferts', 'transferts', ('type_transfert', 'nombre_personnes', 'prix_ariary')),
+    'locations': ('import_locations', 'locations_vehicules',
+                  ('type_location', 'nombre_vehicules', 'prix_ariary', 'kilometrage')),
+    'guidages': ('import_guidages', 'guidages', ('nombre_guides', 'prix_ariary')),
+    'reserves': ('import_reserves', 'reserves_parcs', ('nom_reserve', 'nom_parc', 'nombre_personnes', 'prix_ariary')),
+    'hebergements': ('import_hebergements', 'hebergements',
+                     ('type_chambre', 'nom_hotel', 'nombre_chambres', 'prix_ariary', 'transfert_htl')),
+    'repas': ('import_repas', 'repas', ('type_repas', 'nombre_personnes', 'prix_ariary')),
+}
+
+def copier_transit(cur, table, colonnes, lignes):
+    """Envoie des lignes dans une table de transit en un seul COPY FROM STDIN (format CSV)"""
+    if not lignes:
+        return
+    tampon = io.StringIO()
+    csv.writer(tampon).writerows(lignes)
+    tampon.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(colonnes)}) FROM STDIN WITH (FORMAT csv)", tampon)
+
+def charger_lot(lot, conn, categorie_ids):
+    """Charge un lot de devis extraits en une transaction (sans commit).
+    Retourne les durées par table et les devis écartés [(devis, motif)]"""
+    cur = conn.cursor()
+    durees = {}
+    debut = time.perf_counter()
+
+    # Un seul chargeur à la fois sur les tables de transit
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('import_excel'))")
+    cur.execute(SCHEMA_TRANSIT)
+    cur.execute("TRUNCATE import_devis, import_couts, import_jours, import_imprevus, "
+                + ", ".join(transit for transit, _, _ in LIGNES_JOUR_TRANSIT.values()))
+
+    # 1. Mise à plat du lot avec des clés locales (devis, jour)
+    lignes_devis, lignes_couts, lignes_jours, lignes_imprevus = [], [], [], []
+    lignes_enfants = {cle: [] for cle in LIGNES_JOUR_TRANSIT}
+    cle_jour = 0
+    for cle_devis, devis in enumerate(lot, start=1):
+        lignes_devis.append((cle_devis,) + tuple(devis.get(col) for col in COLONNES_DEVIS_TRANSIT))
+        lignes_couts.extend((cle_devis, categorie_ids[cat_nom], montant, montant_euro)
+                            for cat_nom, montant, montant_euro in devis['couts'] if cat_nom in categorie_ids)
+        lignes_imprevus.extend((cle_devis,) + imprevu for imprevu in devis['imprevus'])
+        for jour in devis['jours']:
+            cle_jour += 1
+            lignes_jours.append((cle_jour, cle_devis, jour['numero_jour'], jour['date_jour'], jour['destination']))
+            for cle in LIGNES_JOUR_TRANSIT:
+                lignes_enfants[cle].extend((cle_jour,) + ligne for ligne in jour[cle])
+
+    copier_transit(cur, 'import_devis', ('cle_devis',) + COLONNES_DEVIS_TRANSIT, lignes_devis)
+    copier_transit(cur, 'import_couts', ('cle_devis', 'categorie_id', 'montant_ariary', 'montant_euro'), lignes_couts)
+    copier_transit(cur, 'import_jours', ('cle_jour', 'cle_devis', 'numero_jour', 'date_jour', 'destination'),
+                   lignes_jours)
+    copier_transit(cur, 'import_imprevus', ('cle_devis', 'description', 'nombre', 'prix_ariary'), lignes_imprevus)
+    for cle, (transit, _, colonnes) in LIGNES_JOUR_TRANSIT.items():
+        copier_transit(cur, transit, ('cle_jour',) + colonnes, lignes_enfants[cle])
+    durees['copy'] = time.perf_counter() - debut
+
+    # 2. Feuilles déjà importées : écarter les devis protégés (verrouillés jusqu'au commit),
+    #    remplacer les autres en gardant leur id et leur référence
+    debut = time.perf_counter()
+    cur.execute("SELECT 1 FROM devis WHERE id IN (SELECT devis_id FROM import_devis) FOR UPDATE")
+    cur.execute(f"""
+        DELETE FROM import_devis s
+        USING devis d
+        WHERE d.id = s.devis_id AND {MOTIF_DEVIS_PROTEGE} IS NOT NULL
+        RETURNING s.cle_devis, {MOTIF_DEVIS_PROTEGE}
+    """)
+    ecartes = [(lot[cle_devis - 1], motif) for cle_devis, motif in cur.fetchall()]
+    cur.execute("""
+        DELETE FROM import_devis s
+        WHERE s.devis_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM devis d WHERE d.id = s.devis_id)
+        RETURNING s.cle_devis
+    """)
+    ecartes.extend((lot[cle_devis - 1], MOTIF_DEVIS_RETIRE) for (cle_devis,) in cur.fetchall())
+    cur.execute("""
+        UPDATE import_devis s SET reference = d.reference
+        FROM devis d
+        WHERE d.id = s.devis_id
+    """)
+    cur.execute("DELETE FROM devis WHERE id IN (SELECT devis_id FROM import_devis WHERE devis_id IS NOT NULL)")
+    durees['remplacement'] = time.perf_counter() - debut
+
+    # 3. Réserver les identifiants définitifs pour remapper les clés locales
+    debut = time.perf_counter()
+    cur.execute("""
+        UPDATE import_devis SET devis_id = nextval(pg_get_serial_sequence('devis', 'id'))
+        WHERE devis_id IS NULL
+    """)
+    # Références déjà prises (même client le même jour) : suffixer par l'id
+    cur.execute("""
+        UPDATE import_devis s SET reference = s.reference || '-' || s.devis_id
+        WHERE EXISTS (SELECT 1 FROM devis d WHERE d.reference = s.reference)
+           OR EXISTS (SELECT 1 FROM import_devis o WHERE o.reference = s.reference AND o.cle_devis < s.cle_devis)
+    """)
+    cur.execute("UPDATE import_jours SET jour_id = nextval(pg_get_serial_sequence('jours_voyage', 'id'))")
+    durees['identifiants'] = time.perf_counter() - debut
+
+    # 4. Déplacer les lignes vers les tables définitives, en une requête par table
+    debut = time.perf_counter()
+    cur.execute("""
+        INSERT INTO clients (reference, nom)
+        SELECT DISTINCT ON (ref_client) ref_client, nom_client
+        FROM import_devis
+        ORDER BY ref_client, cle_devis DESC
+        ON CONFLICT (reference) DO UPDATE SET nom = EXCLUDED.nom
+    """)
+    durees['clients'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    cur.execute("""
+        INSERT INTO devis (
+            id, client_id, reference, date_cotation, nombre_personnes,
+            nombre_adultes, nombre_enfants, nombre_bebes,
+            taux_change, total_ariary, total_euro, marge
+        )
+        SELECT s.devis_id, c.id, s.reference, s.date_cotation, s.nombre_personnes,
+               s.nombre_adultes, s.nombre_enfants, s.nombre_bebes,
+               s.taux_change, s.total_ariary, s.total_euro, s.marge
+        FROM import_devis s
+        JOIN clients c ON c.reference = s.ref_client
+    """)
+    durees['devis'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    cur.execute("""
+        INSERT INTO couts_devis (devis_id, categorie_id, montant_ariary, montant_euro)
+        SELECT d.devis_id, s.categorie_id, s.montant_ariary, s.montant_euro
+        FROM import_couts s
+        JOIN import_devis d ON d.cle_devis = s.cle_devis
+    """)
+    durees['couts_devis'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    cur.execute("""
+        INSERT INTO jours_voyage (id, devis_id, numero_jour, date_jour, destination, ordre)
+        SELECT s.jour_id, d.devis_id, s.numero_jour, s.date_jour, s.destination, s.numero_jour
+        FROM import_jours s
+        JOIN import_devis d ON d.cle_devis = s.cle_devis
+    """)
+    durees['jours_voyage'] = time.perf_counter() - debut
+
+    for transit, cible, colonnes in LIGNES_JOUR_TRANSIT.values():
+        debut = time.perf_counter()
+        cur.execute(f"""
+            INSERT INTO {cible} (jour_voyage_id, {', '.join(colonnes)})
+            SELECT j.jour_id, {', '.join('s.' + col for col in colonnes)}
+            FROM {transit} s
+            JOIN import_jours j ON j.cle_jour = s.cle_jour
+        """)
+        durees[cible] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    cur.execute("""
+        INSERT INTO imprevus (devis_id, description, nombre, prix_ariary)
+        SELECT d.devis_id, s.description, s.nombre, s.prix_ariary
+        FROM import_imprevus s
+        JOIN import_devis d ON d.cle_devis = s.cle_devis
+    """)
+    durees['imprevus'] = time.perf_counter() - debut
+
+    # 5. Point de reprise : empreinte des feuilles du lot, dans la même transaction
+    debut = time.perf_counter()
+    cur.execute("""
+        INSERT INTO imports_feuilles (fichier, feuille, hash_contenu, devis_id,
+                                      total_ariary_excel, marge_excel, total_euro_excel)
+        SELECT classeur, nom_feuille, hash_contenu, devis_id, total_ariary, marge, total_euro
+        FROM import_devis
+        WHERE hash_contenu IS NOT NULL
+        ON CONFLICT (fichier, feuille) DO UPDATE SET
+            hash_contenu = EXCLUDED.hash_contenu,
+            devis_id = EXCLUDED.devis_id,
+            total_ariary_excel = EXCLUDED.total_ariary_excel,
+            marge_excel = EXCLUDED.marge_excel,
+            total_euro_excel = EXCLUDED.total_euro_excel,
+            importe_le = CURRENT_TIMESTAMP
+    """)
+    durees['imports_feuilles'] = time.perf_counter() - debut
+
+    cur.close()
+    return durees, ecartes
+
+def migrer_lot(lot, conn, categorie_ids):
+    """Charge un lot en une transaction ; en cas d'échec, isole les feuilles fautives une par une.
+    Retourne les (devis, message d'erreur) non migrés et les (devis, motif) écartés car protégés."""
+    debut = time.perf_counter()
+    try:
+        durees, ecartes = charger_lot(lot, conn, categorie_ids)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️  Échec du lot de {len(lot)} feuille(s) ({e}), reprise feuille par feuille")
+        echecs, ecartes = [], []
+        for devis in lot:
+            try:
+                ecrire_devis(devis, conn, categorie_ids)
+                conn.commit()
+            except DevisProtege as motif:
+                conn.rollback()
+                ecartes.append((devis, str(motif)))
+            except Exception as e_feuille:
+                print(f"ERREUR lors de la migration de {devis['nom_feuille']}: {e_feuille}")
+                conn.rollback()
+                echecs.append((devis, str(e_feuille)))
+        return echecs, ecartes
+
+    print(f"✓ Lot de {len(lot)} feuille(s) chargé en {time.perf_counter() - debut:.2f} s")
+    for table, duree in durees.items():
+        print(f"    {table:<22} {duree * 1000:8.1f} ms")
+    return [], ecartes
+
+# Import de plusieurs classeurs : lecture parallèle, écriture par un seul processus
+FICHIER_EXCEL_DEFAUT = "Bases de datos internos.xlsx"
+FEUILLES_PAR_TACHE = 50  # Feuilles lues par tâche (le classeur est ouvert une fois par tâche)
+
+def lister_classeurs(chemin):
+    """Retourne les classeurs à importer : le fichier donné ou les .xlsx d'un répertoire"""
+    chemin = Path(chemin)
+    if chemin.is_dir():
+        return sorted(p for p in chemin.glob('*.xlsx') if not p.name.startswith('~$'))
+    return [chemin]
+
+def empreinte_fichier(chemin):
+    """SHA-256 du contenu d'un classeur"""
+    h = hashlib.sha256()
+    with open(chemin, 'rb') as f:
+        for bloc in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloc)
+    return h.hexdigest()
+
+def empreinte_lignes(lignes):
+    """SHA-256 des valeurs d'une feuille (tampon de lignes)"""
+    return hashlib.sha256(repr(lignes).encode('utf-8')).hexdigest()
+
+def charger_registre(conn):
+    """Charge le registre des imports : empreintes des classeurs et {(classeur, feuille): (empreinte, devis_id)}"""
+    cur = conn.cursor()
+    cur.execute("SELECT fichier, hash_contenu FROM imports_classeurs")
+    classeurs = dict(cur.fetchall())
+    cur.execute("SELECT fichier, feuille, hash_contenu, devis_id FROM imports_feuilles")
+    feuilles = {(fichier, feuille): (hash_contenu, devis_id) for fichier, feuille, hash_contenu, devis_id in cur.fetchall()}
+    cur.close()
+    return classeurs, feuilles
+
+def decouper_classeurs(classeurs, feuilles_connues=None):
+    """Découpe chaque classeur en tâches (fichier, noms de feuilles, empreintes connues de ces feuilles).
+    Retourne les tâches et les classeurs illisibles {fichier: erreur}"""
+    feuilles_connues = feuilles_connues or {}
+    taches, illisibles = [], {}
+    for fichier in classeurs:
+        try:
+            wb = openpyxl.load_workbook(fichier, read_only=True)
+            noms = wb.sheetnames
+            wb.close()
+        except Exception as e:
+            illisibles[str(fichier)] = str(e)
+            continue
+        for i in range(0, len(noms), FEUILLES_PAR_TACHE):
+            groupe = noms[i:i + FEUILLES_PAR_TACHE]
+            empreintes = {nom: feuilles_connues[(Path(fichier).name, nom)][0]
+                          for nom in groupe if (Path(fichier).name, nom) in feuilles_connues}
+            taches.append((str(fichier), groupe, empreintes))
+    return taches, illisibles
+
+def lire_feuilles_classeur(fichier, noms_feuilles, empreintes_connues=None):
+    """Lit un groupe de feuilles d'un classeur (exécuté dans un processus de lecture).
+    Les feuilles dont l'empreinte est inchangée ne sont pas extraites.
+    Retourne (fichier, devis extraits, [(feuille, erreur)], feuilles inchangées)"""
+    empreintes_connues = empreintes_connues or {}
+    devis_lus, erreurs, inchangees = [], [], []
+    wb = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        for nom_feuille in noms_feuilles:
+            try:
+                lignes = lire_lignes_feuille(wb[nom_feuille])
+                empreinte = empreinte_lignes(lignes)
+                if empreintes_connues.get(nom_feuille) == empreinte:
+                    inchangees.append(nom_feuille)
+                    continue
+                devis = lire_feuille_excel(nom_feuille, lignes)
+                devis['fichier'] = fichier
+                devis['classeur'] = Path(fichier).name
+                devis['hash_contenu'] = empreinte
+                devis_lus.append(devis)
+            except Exception as e:
+                erreurs.append((nom_feuille, str(e)))
+    finally:
+        wb.close()
+    return fichier, devis_lus, erreurs, inchangees
+
+def resultats_lecture(taches, workers):
+    """Produit les résultats de lecture au fil de l'eau, en parallèle si workers > 1"""
+    if workers <= 1:
+        for fichier, noms_feuilles, empreintes in taches:
+            try:
+                yield lire_feuilles_classeur(fichier, noms_feuilles, empreintes)
+            except Exception as e:
+                yield fichier, [], [(nom, str(e)) for nom in noms_feuilles], []
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(lire_feuilles_classeur, fichier, noms_feuilles, empreintes): (fichier, noms_feuilles)
+                   for fichier, noms_feuilles, empreintes in taches}
+        for future in as_completed(futures):
+            fichier, noms_feuilles = futures[future]
+            try:
+                yield future.result()
+            except Exception as e:
+                yield fichier, [], [(nom, str(e)) for nom in noms_feuilles], []
+
+def afficher_rapport(rapport):
+    """Affiche le bilan par fichier (feuilles migrées, inchangées et erreurs)"""
+    print("\n" + "="*80)
+    print("BILAN PAR FICHIER")
+    print("="*80)
+    for fichier, bilan in rapport.items():
+        if bilan['inchange']:
+            print(f"= {Path(fichier).name}: classeur inchangé")
+            continue
+        statut = "✓" if not bilan['erreurs'] else "✗"
+        print(f"{statut} {Path(fichier).name}: {bilan['migrees']}/{bilan['feuilles']} feuille(s) migrée(s), "
+              f"{bilan['inchangees']} inchangée(s), {len(bilan['ecartees'])} écartée(s)")
+        for nom_feuille, erreur in bilan['erreurs']:
+            print(f"    - {nom_feuille}: {erreur}")
+        for nom_feuille, motif in bilan['ecartees']:
+            print(f"    ⊘ {nom_feuille}: modifiée mais non réimportée ({motif})")
+
+def importer(chemin, workers=1, taille_lot=TAILLE_LOT, complet=False):
+    """Importe un classeur ou un répertoire de classeurs et retourne le bilan par fichier.
+    Sauf import complet, seuls les classeurs et feuilles modifiés depuis le dernier import sont rechargés ;
+    une feuille déjà importée remplace son devis au lieu d'en créer un nouveau."""
+    classeurs = lister_classeurs(chemin)
+    rapport = {str(f): {'feuilles': 0, 'migrees': 0, 'inchangees': 0, 'inchange': False, 'erreurs': [],
+                        'ecartees': [], 'empreinte': None}
+               for f in classeurs}
+
+    conn = connect_db()
+    try:
+        categorie_ids = charger_categories(conn)
+        classeurs_connus, feuilles_connues = charger_registre(conn)
+
+        # Classeurs identiques au dernier import complet : rien à relire
+        a_lire = []
+        for fichier in classeurs:
+            bilan = rapport[str(fichier)]
+            try:
+                bilan['empreinte'] = empreinte_fichier(fichier)
+            except OSError as e:
+                bilan['erreurs'].append(('(classeur)', str(e)))
+                continue
+            if not complet and classeurs_connus.get(fichier.name) == bilan['empreinte']:
+                bilan['inchange'] = True
+            else:
+                a_lire.append(fichier)
+
+        taches, illisibles = decouper_classeurs(a_lire, {} if complet else feuilles_connues)
+        for fichier, erreur in illisibles.items():
+            rapport[fichier]['erreurs'].append(('(classeur)', erreur))
+        for fichier, noms_feuilles, _ in taches:
+            rapport[fichier]['feuilles'] += len(noms_feuilles)
+
+        print(f"{len(classeurs)} classeur(s) dont {len(a_lire)} à relire, "
+              f"{len(taches)} tâche(s) de lecture, {workers} processus")
+
+        def ecrire(lot):
+            echecs, ecartes = migrer_lot(lot, conn, categorie_ids)
+            for devis in lot:
+                rapport[devis['fichier']]['migrees'] += 1
+            for devis, erreur in echecs:
+                rapport[devis['fichier']]['migrees'] -= 1
+                rapport[devis['fichier']]['erreurs'].append((devis['nom_feuille'], erreur))
+            for devis, motif in ecartes:
+                rapport[devis['fichier']]['migrees'] -= 1
+                rapport[devis['fichier']]['ecartees'].append((devis['nom_feuille'], motif))
+
+        lot = []
+        for fichier, devis_lus, erreurs, inchangees in resultats_lecture(taches, workers):
+            rapport[fichier]['erreurs'].extend(erreurs)
+            rapport[fichier]['inchangees'] += len(inchangees)
+            for devis in devis_lus:
+                connu = feuilles_connues.get((devis['classeur'], devis['nom_feuille']))
+                # Feuille déjà importée dont le devis a été archivé ou purgé : ne pas la recréer
+                if connu and connu[1] is None:
+                    rapport[fichier]['ecartees'].append((devis['nom_feuille'], MOTIF_DEVIS_RETIRE))
+                    continue
+                devis['devis_id'] = connu[1] if connu else None
+                lot.append(devis)
+            while len(lot) >= taille_lot:
+                ecrire(lot[:taille_lot])
+                lot = lot[taille_lot:]
+        if lot:
+            ecrire(lot)
+
+        # Classeurs importés sans erreur ni feuille écartée : enregistrer leur empreinte
+        # (une feuille écartée sera de nouveau proposée au prochain import)
+        termines = [(Path(fichier).name, bilan['empreinte'], bilan['feuilles'])
+                    for fichier, bilan in rapport.items()
+                    if not bilan['inchange'] and not bilan['erreurs'] and not bilan['ecartees']
+                    and bilan['empreinte']]
+        if termines:
+            cur = conn.cursor()
+            execute_values(cur, """
+                INSERT INTO imports_classeurs (fichier, hash_contenu, nombre_feuilles) VALUES %s
+                ON CONFLICT (fichier) DO UPDATE SET
+                    hash_contenu = EXCLUDED.hash_contenu,
+                    nombre_feuilles = EXCLUDED.nombre_feuilles,
+                    termine_le = CURRENT_TIMESTAMP
+            """, termines)
+            conn.commit()
+            cur.close()
+    finally:
+        conn.close()
+
+    return rapport
+
 def main():
     """Fonction principale"""
-    fichier_excel = "Bases de datos internos.xlsx"
-    
-    if not Path(fichier_excel).exists():
-        print(f"ERREUR: Le fichier '{fichier_excel}' n'existe pas!")
+    parser = argparse.ArgumentParser(description="Migration des classeurs Excel de devis vers PostgreSQL")
+    parser.add_argument('chemin', nargs='?', default=FICHIER_EXCEL_DEFAUT,
+                        help="Classeur .xlsx ou répertoire de classeurs")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Nombre de processus de lecture (1 = lecture séquentielle)")
+    parser.add_argument('--lot', type=int, default=TAILLE_LOT, help="Nombre de feuilles par transaction")
+    parser.add_argument('--complet', action='store_true',
+                        help="Relire toutes les feuilles, même inchangées depuis le dernier import")
+    args = parser.parse_args()
+
+    if not Path(args.chemin).exists():
+        print(f"ERREUR: Le fichier '{args.chemin}' n'existe pas!")
         sys.exit(1)
-    
+
     print("="*80)
     print("MIGRATION DES DONNÉES EXCEL VERS POSTGRESQL")
     print("="*80)
-    
-    # Connexion à la base de données
+
+    # Le schéma est géré par appliquer_migrations.py : on vérifie seulement, en lecture seule, qu'il est à jour
     conn = connect_db()
-    
+    if not conn:
+        sys.exit(1)
     try:
-        # Créer les tables si elles n'existent pas
-        with open('database/schema.sql', 'r', encoding='utf-8') as f:
-            schema_sql = f.read()
-            cur = conn.cursor()
-            cur.execute(schema_sql)
-            conn.commit()
-            print("✓ Schéma de base de données créé/vérifié")
-        
-        # Lire le fichier Excel
-        xl_file = pd.ExcelFile(fichier_excel)
-        
-        # Migrer chaque feuille
-        for sheet_name in xl_file.sheet_names:
-            try:
-                migrer_feuille_excel(fichier_excel, sheet_name, conn)
-            except Exception as e:
-                print(f"ERREUR lors de la migration de {sheet_name}: {e}")
-                conn.rollback()
-        
-        print("\n" + "="*80)
-        print("MIGRATION TERMINÉE AVEC SUCCÈS")
-        print("="*80)
-        
-    except Exception as e:
-        print(f"ERREUR: {e}")
+        en_attente = versions_en_attente(conn)
         conn.rollback()
     finally:
         conn.close()
+    if en_attente:
+        print(f"ERREUR: {len(en_attente)} migration(s) en attente "
+              f"(v{', v'.join(str(v) for v in en_attente)}) : exécuter python database/appliquer_migrations.py")
+        sys.exit(1)
+    print("✓ Schéma de base de données à jour")
+
+    rapport = importer(args.chemin, workers=max(1, args.workers), taille_lot=max(1, args.lot),
+                       complet=args.complet)
+    afficher_rapport(rapport)
+
+    print("\n" + "="*80)
+    if any(bilan['erreurs'] for bilan in rapport.values()):
+        print("MIGRATION TERMINÉE AVEC DES ERREURS")
+    else:
+        print("MIGRATION TERMINÉE AVEC SUCCÈS")
+    print("="*80)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,21 @@
+-- Script de migration vers la version 10 : registre des imports Excel (import incrémental et reprise)
+
+-- Empreinte de chaque classeur importé entièrement
+CREATE TABLE IF NOT EXISTS imports_classeurs (
+    fichier VARCHAR(255) PRIMARY KEY, -- Nom du classeur
+    hash_contenu CHAR(64) NOT NULL, -- SHA-256 du fichier
+    nombre_feuilles INTEGER DEFAULT 0,
+    termine_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Empreinte de chaque feuille importée (point de reprise, écrit dans la transaction du lot)
+CREATE TABLE IF NOT EXISTS imports_feuilles (
+    fichier VARCHAR(255) NOT NULL,
+    feuille VARCHAR(255) NOT NULL,
+    hash_contenu CHAR(64) NOT NULL, -- SHA-256 de la zone A1:BA54
+    devis_id INTEGER REFERENCES devis(id) ON DELETE SET NULL,
+    importe_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (fichier, feuille)
+);
+
+CREATE INDEX IF NOT EXISTS idx_imports_feuilles_devis ON imports_feuilles(devis_id);
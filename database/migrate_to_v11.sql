@@ -0,0 +1,78 @@
+-- Script de migration vers la version 11 : rapprochement des totaux Excel importés et des totaux recalculés
+
+-- Valeurs d'origine du classeur (I3, I4, I6), que calculer_totaux_devis écrase ensuite dans devis
+ALTER TABLE imports_feuilles ADD COLUMN IF NOT EXISTS total_ariary_excel DECIMAL(15, 2);
+ALTER TABLE imports_feuilles ADD COLUMN IF NOT EXISTS marge_excel DECIMAL(15, 2);
+ALTER TABLE imports_feuilles ADD COLUMN IF NOT EXISTS total_euro_excel DECIMAL(10, 2);
+
+-- Imports antérieurs : meilleure estimation disponible (valeurs actuelles du devis)
+UPDATE imports_feuilles f
+SET total_ariary_excel = d.total_ariary, marge_excel = d.marge, total_euro_excel = d.total_euro
+FROM devis d
+WHERE d.id = f.devis_id AND f.total_ariary_excel IS NULL;
+
+-- Montants recalculés par catégorie de coûts (mêmes noms que categories_couts)
+CREATE OR REPLACE VIEW montants_recalcules_devis AS
+    SELECT devis_id, categorie, SUM(montant) AS montant
+    FROM (
+        SELECT jv.devis_id, t.type_transfert AS categorie, COALESCE(t.prix_ariary, 0) AS montant
+        FROM transferts t JOIN jours_voyage jv ON jv.id = t.jour_voyage_id
+        WHERE t.type_transfert IN ('Pirogue', 'Bateau')
+    UNION ALL
+        SELECT jv.devis_id, 'Location', COALESCE(l.prix_ariary, 0)
+        FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+    UNION ALL
+        SELECT jv.devis_id, 'Location', COALESCE(lj.prix_total, 0)
+        FROM locations_journalieres lj JOIN jours_voyage jv ON jv.id = lj.jour_voyage_id
+    UNION ALL
+        SELECT jv.devis_id, 'Carburant', COALESCE(l.prix_carburant_total, 0)
+        FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+    UNION ALL
+        SELECT jv.devis_id, 'Guidage', COALESCE(g.prix_ariary, 0)
+        FROM guidages g JOIN jours_voyage jv ON jv.id = g.jour_voyage_id
+    UNION ALL
+        SELECT jv.devis_id, CASE WHEN r.nom_parc IS NULL THEN 'Reserves' ELSE 'Parcs' END, COALESCE(r.prix_ariary, 0)
+        FROM reserves_parcs r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+    UNION ALL
+        SELECT jv.devis_id, 'hebergements', COALESCE(h.prix_ariary, 0) + COALESCE(h.transfert_htl, 0)
+        FROM hebergements h JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+    UNION ALL
+        SELECT jv.devis_id, 'Repas', COALESCE(r.prix_ariary, 0)
+        FROM repas r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+    ) m
+    GROUP BY devis_id, categorie;
+
+-- Totaux recalculés de tous les devis (mêmes règles que calculer_totaux_devis dans app.py)
+CREATE OR REPLACE VIEW totaux_recalcules_devis AS
+    WITH services AS (
+        SELECT devis_id, SUM(montant) AS somme_services
+        FROM (
+            SELECT jv.devis_id, COALESCE(h.prix_ariary, 0) + COALESCE(h.transfert_htl, 0) AS montant
+            FROM hebergements h JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+        UNION ALL
+            SELECT jv.devis_id, COALESCE(l.prix_ariary, 0) + COALESCE(l.prix_carburant_total, 0)
+            FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+        UNION ALL
+            SELECT jv.devis_id, COALESCE(vj.prix_total, 0)
+            FROM visites_jour vj JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+        UNION ALL
+            SELECT jv.devis_id, COALESCE(lj.prix_total, 0)
+            FROM locations_journalieres lj JOIN jours_voyage jv ON jv.id = lj.jour_voyage_id
+        UNION ALL
+            SELECT devis_id, COALESCE(prix_total, 0) FROM guides_accompagnateurs
+        UNION ALL
+            SELECT devis_id, COALESCE(prix_ariary, 0) FROM imprevus
+        ) s
+        GROUP BY devis_id
+    )
+    SELECT d.id AS devis_id, t.somme_services, t.total_ariary,
+           t.total_ariary - t.somme_services AS marge,
+           CASE WHEN d.taux_change <> 0 THEN t.total_ariary / d.taux_change ELSE 0 END AS total_euro
+    FROM devis d
+    LEFT JOIN services s ON s.devis_id = d.id
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(s.somme_services, 0) AS somme_services,
+               CASE WHEN COALESCE(d.marge_percent, 0) > 0
+                    THEN COALESCE(s.somme_services, 0) * (1 + d.marge_percent / 100)
+                    ELSE COALESCE(s.somme_services, 0) END AS total_ariary
+    ) t;
@@ -0,0 +1,22 @@
+-- Script de migration vers la version 12 : index des clés étrangères des tables enfants et index partiels du catalogue
+-- migration: sans transaction
+-- Créés avec CONCURRENTLY (pas de verrou bloquant les écritures) ; après un échec, supprimer l'index
+-- invalide signalé par database/conseiller_index.py avant de relancer
+
+-- Clés étrangères sans index : lecture d'un devis (voir_devis) et ON DELETE CASCADE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_locations_vehicules_jour ON locations_vehicules(jour_voyage_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_guidages_jour ON guidages(jour_voyage_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reserves_parcs_jour ON reserves_parcs(jour_voyage_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_repas_jour ON repas(jour_voyage_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_imprevus_devis ON imprevus(devis_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_couts_devis_categorie ON couts_devis(categorie_id);
+
+-- Liste des derniers devis (page d'accueil : ORDER BY created_at DESC LIMIT 50)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_devis_created_at ON devis(created_at DESC);
+
+-- Catalogue actif, dans l'ordre des endpoints /api/itineraires/<id>/hotels, /visites, /api/types_*
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_hotels_actif ON hotels(itineraire_id, nom) WHERE actif;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_visites_actif ON visites(itineraire_id, ordre, nom) WHERE actif;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_types_voitures_actif ON types_voitures(ordre, nom) WHERE actif;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_types_locations_journalieres_actif
+    ON types_locations_journalieres(nom) WHERE actif;
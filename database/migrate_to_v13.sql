@@ -0,0 +1,168 @@
+-- Script de migration vers la version 13 : table de faits lignes_devis (une ligne par coût de devis)
+-- Maintenue par déclencheurs à côté des tables de lignes ; totaux et analyses = un seul GROUP BY indexé
+
+-- Une ligne de coût par ligne source (deux pour une location de véhicule : location et carburant)
+CREATE TABLE IF NOT EXISTS lignes_devis (
+    id BIGSERIAL PRIMARY KEY,
+    devis_id INTEGER NOT NULL REFERENCES devis(id) ON DELETE CASCADE,
+    jour_voyage_id INTEGER REFERENCES jours_voyage(id) ON DELETE CASCADE, -- NULL pour les coûts du devis entier
+    numero_jour INTEGER,
+    categorie VARCHAR(100) NOT NULL,
+    table_source VARCHAR(50) NOT NULL,
+    source_id INTEGER NOT NULL,
+    quantite DECIMAL(15, 2) DEFAULT 0,
+    prix_unitaire DECIMAL(15, 2),
+    montant DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    dans_total BOOLEAN NOT NULL DEFAULT FALSE, -- Compté dans la somme des services (calculer_totaux_devis)
+    UNIQUE(table_source, source_id, categorie)
+);
+
+CREATE INDEX IF NOT EXISTS idx_lignes_devis_devis ON lignes_devis(devis_id, categorie) INCLUDE (montant, dans_total);
+CREATE INDEX IF NOT EXISTS idx_lignes_devis_jour ON lignes_devis(devis_id, numero_jour) INCLUDE (montant);
+CREATE INDEX IF NOT EXISTS idx_lignes_devis_jour_voyage ON lignes_devis(jour_voyage_id);
+
+-- Lignes de coût calculées depuis les tables sources (seule définition des catégories et des montants)
+CREATE OR REPLACE VIEW lignes_devis_sources AS
+    SELECT 'hebergements'::VARCHAR AS table_source, h.id AS source_id, jv.devis_id, jv.id AS jour_voyage_id,
+           jv.numero_jour, 'hebergements'::VARCHAR AS categorie, COALESCE(h.nombre_chambres, 0)::DECIMAL AS quantite,
+           COALESCE(h.prix_ariary, 0) + COALESCE(h.transfert_htl, 0) AS montant, TRUE AS dans_total
+    FROM hebergements h JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+UNION ALL
+    SELECT 'visites_jour', vj.id, jv.devis_id, jv.id, jv.numero_jour, 'Visites',
+           COALESCE(vj.nombre_personnes, 0), COALESCE(vj.prix_total, 0), TRUE
+    FROM visites_jour vj JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+UNION ALL
+    SELECT 'locations_vehicules', l.id, jv.devis_id, jv.id, jv.numero_jour, 'Location',
+           COALESCE(l.nombre_vehicules, 0), COALESCE(l.prix_ariary, 0), TRUE
+    FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+UNION ALL
+    SELECT 'locations_vehicules', l.id, jv.devis_id, jv.id, jv.numero_jour, 'Carburant',
+           COALESCE(l.consommation_carburant, 0), COALESCE(l.prix_carburant_total, 0), TRUE
+    FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+UNION ALL
+    SELECT 'locations_journalieres', lj.id, jv.devis_id, jv.id, jv.numero_jour, 'Location',
+           COALESCE(lj.nombre_vehicules, 1) * COALESCE(lj.nombre_jours, 1), COALESCE(lj.prix_total, 0), TRUE
+    FROM locations_journalieres lj JOIN jours_voyage jv ON jv.id = lj.jour_voyage_id
+UNION ALL
+    SELECT 'transferts', t.id, jv.devis_id, jv.id, jv.numero_jour, COALESCE(t.type_transfert, 'Transfert'),
+           COALESCE(t.nombre_voitures, 0), COALESCE(t.prix_ariary, 0), FALSE
+    FROM transferts t JOIN jours_voyage jv ON jv.id = t.jour_voyage_id
+UNION ALL
+    SELECT 'guidages', g.id, jv.devis_id, jv.id, jv.numero_jour, 'Guidage',
+           COALESCE(g.nombre_guides, 0), COALESCE(g.prix_ariary, 0), FALSE
+    FROM guidages g JOIN jours_voyage jv ON jv.id = g.jour_voyage_id
+UNION ALL
+    SELECT 'reserves_parcs', r.id, jv.devis_id, jv.id, jv.numero_jour,
+           CASE WHEN r.nom_parc IS NULL THEN 'Reserves' ELSE 'Parcs' END,
+           COALESCE(r.nombre_personnes, 0), COALESCE(r.prix_ariary, 0), FALSE
+    FROM reserves_parcs r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+UNION ALL
+    SELECT 'repas', r.id, jv.devis_id, jv.id, jv.numero_jour, 'Repas',
+           COALESCE(r.nombre_personnes, 0), COALESCE(r.prix_ariary, 0), FALSE
+    FROM repas r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+UNION ALL
+    SELECT 'imprevus', i.id, i.devis_id, NULL, NULL, 'Imprevus',
+           COALESCE(i.nombre, 0), COALESCE(i.prix_ariary, 0), TRUE
+    FROM imprevus i WHERE i.devis_id IS NOT NULL
+UNION ALL
+    SELECT 'transferts_aeroport', ta.id, ta.devis_id, NULL, NULL, 'Transferts aéroport',
+           COALESCE(ta.nombre_trajets, 1), COALESCE(ta.prix_total, 0), FALSE
+    FROM transferts_aeroport ta WHERE ta.devis_id IS NOT NULL
+UNION ALL
+    SELECT 'guides_accompagnateurs', ga.id, ga.devis_id, NULL, NULL, 'Guides accompagnateurs',
+           COALESCE(ga.nombre_guides, 1) * COALESCE(ga.nombre_jours, 1), COALESCE(ga.prix_total, 0), TRUE
+    FROM guides_accompagnateurs ga WHERE ga.devis_id IS NOT NULL
+UNION ALL
+    SELECT 'couts_devis', cd.id, cd.devis_id, NULL, NULL, cc.nom,
+           NULL, COALESCE(cd.montant_ariary, 0), FALSE
+    FROM couts_devis cd JOIN categories_couts cc ON cc.id = cd.categorie_id
+    WHERE cd.devis_id IS NOT NULL;
+
+-- Alimentation initiale
+INSERT INTO lignes_devis (devis_id, jour_voyage_id, numero_jour, categorie, table_source, source_id,
+                          quantite, prix_unitaire, montant, dans_total)
+SELECT devis_id, jour_voyage_id, numero_jour, categorie, table_source, source_id,
+       quantite, ROUND(montant / NULLIF(quantite, 0), 2), montant, dans_total
+FROM lignes_devis_sources
+ON CONFLICT (table_source, source_id, categorie) DO NOTHING;
+
+-- Synchronisation ensembliste (une fois par instruction, via les tables de transition)
+CREATE OR REPLACE FUNCTION synchroniser_lignes_devis() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM lignes_devis
+        WHERE table_source = TG_TABLE_NAME AND source_id IN (SELECT id FROM anciennes);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO lignes_devis (devis_id, jour_voyage_id, numero_jour, categorie, table_source, source_id,
+                                  quantite, prix_unitaire, montant, dans_total)
+        SELECT devis_id, jour_voyage_id, numero_jour, categorie, table_source, source_id,
+               quantite, ROUND(montant / NULLIF(quantite, 0), 2), montant, dans_total
+        FROM lignes_devis_sources
+        WHERE table_source = TG_TABLE_NAME AND source_id IN (SELECT id FROM nouvelles);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    source TEXT;
+BEGIN
+    FOREACH source IN ARRAY ARRAY['hebergements', 'visites_jour', 'locations_vehicules', 'locations_journalieres',
+                                  'transferts', 'guidages', 'reserves_parcs', 'repas', 'imprevus',
+                                  'transferts_aeroport', 'guides_accompagnateurs', 'couts_devis']
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_lignes_ins ON %I', source, source);
+        EXECUTE format('CREATE TRIGGER trg_%s_lignes_ins AFTER INSERT ON %I REFERENCING NEW TABLE AS nouvelles '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION synchroniser_lignes_devis()', source, source);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_lignes_upd ON %I', source, source);
+        EXECUTE format('CREATE TRIGGER trg_%s_lignes_upd AFTER UPDATE ON %I '
+                       'REFERENCING OLD TABLE AS anciennes NEW TABLE AS nouvelles '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION synchroniser_lignes_devis()', source, source);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_lignes_del ON %I', source, source);
+        EXECUTE format('CREATE TRIGGER trg_%s_lignes_del AFTER DELETE ON %I REFERENCING OLD TABLE AS anciennes '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION synchroniser_lignes_devis()', source, source);
+    END LOOP;
+END $$;
+
+-- Renumérotation d'un jour : le numéro est recopié dans ses lignes
+CREATE OR REPLACE FUNCTION synchroniser_numero_jour_lignes() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE lignes_devis SET numero_jour = NEW.numero_jour WHERE jour_voyage_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_jours_voyage_lignes ON jours_voyage;
+CREATE TRIGGER trg_jours_voyage_lignes AFTER UPDATE OF numero_jour ON jours_voyage FOR EACH ROW
+    WHEN (OLD.numero_jour IS DISTINCT FROM NEW.numero_jour)
+    EXECUTE FUNCTION synchroniser_numero_jour_lignes();
+
+-- Vues de rapprochement (v11) recalculées depuis la table de faits
+CREATE OR REPLACE VIEW montants_recalcules_devis AS
+    SELECT devis_id, categorie, SUM(montant) AS montant
+    FROM lignes_devis
+    WHERE table_source IN ('locations_vehicules', 'locations_journalieres', 'guidages', 'reserves_parcs',
+                           'hebergements', 'repas')
+       OR (table_source = 'transferts' AND categorie IN ('Pirogue', 'Bateau'))
+    GROUP BY devis_id, categorie;
+
+CREATE OR REPLACE VIEW totaux_recalcules_devis AS
+    WITH services AS (
+        SELECT devis_id, SUM(montant) AS somme_services
+        FROM lignes_devis
+        WHERE dans_total
+        GROUP BY devis_id
+    )
+    SELECT d.id AS devis_id, t.somme_services, t.total_ariary,
+           t.total_ariary - t.somme_services AS marge,
+           CASE WHEN d.taux_change <> 0 THEN t.total_ariary / d.taux_change ELSE 0 END AS total_euro
+    FROM devis d
+    LEFT JOIN services s ON s.devis_id = d.id
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(s.somme_services, 0) AS somme_services,
+               CASE WHEN COALESCE(d.marge_percent, 0) > 0
+                    THEN COALESCE(s.somme_services, 0) * (1 + d.marge_percent / 100)
+                    ELSE COALESCE(s.somme_services, 0) END AS total_ariary
+    ) t;
@@ -0,0 +1,163 @@
+-- Script de migration vers la version 14 : montants des devis en ariary entiers (BIGINT)
+-- Sommes et totaux restent en arithmétique entière, en SQL comme dans app.py (montants.py) ;
+-- les montants en euros restent en DECIMAL(10, 2) (centimes exacts), calculés une fois depuis l'ariary
+
+-- Les vues qui lisent ces colonnes empêchent le changement de type : elles sont recréées plus bas
+DROP VIEW IF EXISTS totaux_recalcules_devis;
+DROP VIEW IF EXISTS montants_recalcules_devis;
+DROP VIEW IF EXISTS lignes_devis_sources;
+
+ALTER TABLE devis
+    ALTER COLUMN total_ariary TYPE BIGINT USING ROUND(total_ariary),
+    ALTER COLUMN marge TYPE BIGINT USING ROUND(marge);
+
+ALTER TABLE couts_devis ALTER COLUMN montant_ariary TYPE BIGINT USING ROUND(montant_ariary);
+
+ALTER TABLE imports_feuilles
+    ALTER COLUMN total_ariary_excel TYPE BIGINT USING ROUND(total_ariary_excel),
+    ALTER COLUMN marge_excel TYPE BIGINT USING ROUND(marge_excel);
+
+ALTER TABLE transferts ALTER COLUMN prix_ariary TYPE BIGINT USING ROUND(prix_ariary);
+ALTER TABLE guidages ALTER COLUMN prix_ariary TYPE BIGINT USING ROUND(prix_ariary);
+ALTER TABLE reserves_parcs ALTER COLUMN prix_ariary TYPE BIGINT USING ROUND(prix_ariary);
+ALTER TABLE repas ALTER COLUMN prix_ariary TYPE BIGINT USING ROUND(prix_ariary);
+ALTER TABLE imprevus ALTER COLUMN prix_ariary TYPE BIGINT USING ROUND(prix_ariary);
+
+ALTER TABLE hebergements
+    ALTER COLUMN prix_ariary TYPE BIGINT USING ROUND(prix_ariary),
+    ALTER COLUMN transfert_htl TYPE BIGINT USING ROUND(transfert_htl);
+
+ALTER TABLE locations_vehicules
+    ALTER COLUMN prix_ariary TYPE BIGINT USING ROUND(prix_ariary),
+    ALTER COLUMN prix_carburant_total TYPE BIGINT USING ROUND(prix_carburant_total);
+
+ALTER TABLE visites_jour
+    ALTER COLUMN prix_entree TYPE BIGINT USING ROUND(prix_entree),
+    ALTER COLUMN prix_guidage TYPE BIGINT USING ROUND(prix_guidage),
+    ALTER COLUMN prix_taxe_communale TYPE BIGINT USING ROUND(prix_taxe_communale),
+    ALTER COLUMN prix_total TYPE BIGINT USING ROUND(prix_entree) + ROUND(prix_guidage) + ROUND(prix_taxe_communale);
+
+ALTER TABLE locations_journalieres ALTER COLUMN prix_total TYPE BIGINT USING ROUND(prix_total);
+
+ALTER TABLE transferts_aeroport
+    ALTER COLUMN prix_par_trajet TYPE BIGINT USING ROUND(prix_par_trajet),
+    ALTER COLUMN prix_total TYPE BIGINT USING ROUND(prix_total);
+
+ALTER TABLE guides_accompagnateurs
+    ALTER COLUMN prix_par_jour TYPE BIGINT USING ROUND(prix_par_jour),
+    ALTER COLUMN prix_total TYPE BIGINT USING ROUND(prix_total);
+
+ALTER TABLE lignes_devis
+    ALTER COLUMN prix_unitaire TYPE BIGINT USING ROUND(prix_unitaire),
+    ALTER COLUMN montant TYPE BIGINT USING ROUND(montant);
+
+-- Définition inchangée (v13), sur les colonnes entières
+CREATE VIEW lignes_devis_sources AS
+    SELECT 'hebergements'::VARCHAR AS table_source, h.id AS source_id, jv.devis_id, jv.id AS jour_voyage_id,
+           jv.numero_jour, 'hebergements'::VARCHAR AS categorie, COALESCE(h.nombre_chambres, 0)::DECIMAL AS quantite,
+           COALESCE(h.prix_ariary, 0) + COALESCE(h.transfert_htl, 0) AS montant, TRUE AS dans_total
+    FROM hebergements h JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+UNION ALL
+    SELECT 'visites_jour', vj.id, jv.devis_id, jv.id, jv.numero_jour, 'Visites',
+           COALESCE(vj.nombre_personnes, 0), COALESCE(vj.prix_total, 0), TRUE
+    FROM visites_jour vj JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+UNION ALL
+    SELECT 'locations_vehicules', l.id, jv.devis_id, jv.id, jv.numero_jour, 'Location',
+           COALESCE(l.nombre_vehicules, 0), COALESCE(l.prix_ariary, 0), TRUE
+    FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+UNION ALL
+    SELECT 'locations_vehicules', l.id, jv.devis_id, jv.id, jv.numero_jour, 'Carburant',
+           COALESCE(l.consommation_carburant, 0), COALESCE(l.prix_carburant_total, 0), TRUE
+    FROM locations_vehicules l JOIN jours_voyage jv ON jv.id = l.jour_voyage_id
+UNION ALL
+    SELECT 'locations_journalieres', lj.id, jv.devis_id, jv.id, jv.numero_jour, 'Location',
+           COALESCE(lj.nombre_vehicules, 1) * COALESCE(lj.nombre_jours, 1), COALESCE(lj.prix_total, 0), TRUE
+    FROM locations_journalieres lj JOIN jours_voyage jv ON jv.id = lj.jour_voyage_id
+UNION ALL
+    SELECT 'transferts', t.id, jv.devis_id, jv.id, jv.numero_jour, COALESCE(t.type_transfert, 'Transfert'),
+           COALESCE(t.nombre_voitures, 0), COALESCE(t.prix_ariary, 0), FALSE
+    FROM transferts t JOIN jours_voyage jv ON jv.id = t.jour_voyage_id
+UNION ALL
+    SELECT 'guidages', g.id, jv.devis_id, jv.id, jv.numero_jour, 'Guidage',
+           COALESCE(g.nombre_guides, 0), COALESCE(g.prix_ariary, 0), FALSE
+    FROM guidages g JOIN jours_voyage jv ON jv.id = g.jour_voyage_id
+UNION ALL
+    SELECT 'reserves_parcs', r.id, jv.devis_id, jv.id, jv.numero_jour,
+           CASE WHEN r.nom_parc IS NULL THEN 'Reserves' ELSE 'Parcs' END,
+           COALESCE(r.nombre_personnes, 0), COALESCE(r.prix_ariary, 0), FALSE
+    FROM reserves_parcs r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+UNION ALL
+    SELECT 'repas', r.id, jv.devis_id, jv.id, jv.numero_jour, 'Repas',
+           COALESCE(r.nombre_personnes, 0), COALESCE(r.prix_ariary, 0), FALSE
+    FROM repas r JOIN jours_voyage jv ON jv.id = r.jour_voyage_id
+UNION ALL
+    SELECT 'imprevus', i.id, i.devis_id, NULL, NULL, 'Imprevus',
+           COALESCE(i.nombre, 0), COALESCE(i.prix_ariary, 0), TRUE
+    FROM imprevus i WHERE i.devis_id IS NOT NULL
+UNION ALL
+    SELECT 'transferts_aeroport', ta.id, ta.devis_id, NULL, NULL, 'Transferts aéroport',
+           COALESCE(ta.nombre_trajets, 1), COALESCE(ta.prix_total, 0), FALSE
+    FROM transferts_aeroport ta WHERE ta.devis_id IS NOT NULL
+UNION ALL
+    SELECT 'guides_accompagnateurs', ga.id, ga.devis_id, NULL, NULL, 'Guides accompagnateurs',
+           COALESCE(ga.nombre_guides, 1) * COALESCE(ga.nombre_jours, 1), COALESCE(ga.prix_total, 0), TRUE
+    FROM guides_accompagnateurs ga WHERE ga.devis_id IS NOT NULL
+UNION ALL
+    SELECT 'couts_devis', cd.id, cd.devis_id, NULL, NULL, cc.nom,
+           NULL, COALESCE(cd.montant_ariary, 0), FALSE
+    FROM couts_devis cd JOIN categories_couts cc ON cc.id = cd.categorie_id
+    WHERE cd.devis_id IS NOT NULL;
+
+-- Une somme arrondie n'est pas toujours la somme des arrondis (hébergement + transfert) : on réaligne
+UPDATE lignes_devis l
+SET montant = s.montant, prix_unitaire = ROUND(s.montant / NULLIF(s.quantite, 0))
+FROM lignes_devis_sources s
+WHERE s.table_source = l.table_source AND s.source_id = l.source_id AND s.categorie = l.categorie
+  AND s.montant IS DISTINCT FROM l.montant;
+
+-- Prix unitaire arrondi à l'ariary
+CREATE OR REPLACE FUNCTION synchroniser_lignes_devis() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM lignes_devis
+        WHERE table_source = TG_TABLE_NAME AND source_id IN (SELECT id FROM anciennes);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO lignes_devis (devis_id, jour_voyage_id, numero_jour, categorie, table_source, source_id,
+                                  quantite, prix_unitaire, montant, dans_total)
+        SELECT devis_id, jour_voyage_id, numero_jour, categorie, table_source, source_id,
+               quantite, ROUND(montant / NULLIF(quantite, 0)), montant, dans_total
+        FROM lignes_devis_sources
+        WHERE table_source = TG_TABLE_NAME AND source_id IN (SELECT id FROM nouvelles);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE VIEW montants_recalcules_devis AS
+    SELECT devis_id, categorie, SUM(montant) AS montant
+    FROM lignes_devis
+    WHERE table_source IN ('locations_vehicules', 'locations_journalieres', 'guidages', 'reserves_parcs',
+                           'hebergements', 'repas')
+       OR (table_source = 'transferts' AND categorie IN ('Pirogue', 'Bateau'))
+    GROUP BY devis_id, categorie;
+
+-- Mêmes arrondis que calculer_totaux_devis : total à l'ariary, euros au centime
+CREATE VIEW totaux_recalcules_devis AS
+    WITH services AS (
+        SELECT devis_id, SUM(montant) AS somme_services
+        FROM lignes_devis
+        WHERE dans_total
+        GROUP BY devis_id
+    )
+    SELECT d.id AS devis_id, t.somme_services, t.total_ariary,
+           t.total_ariary - t.somme_services AS marge,
+           CASE WHEN d.taux_change <> 0 THEN ROUND(t.total_ariary / d.taux_change, 2) ELSE 0 END AS total_euro
+    FROM devis d
+    LEFT JOIN services s ON s.devis_id = d.id
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(s.somme_services, 0)::BIGINT AS somme_services,
+               CASE WHEN COALESCE(d.marge_percent, 0) > 0
+                    THEN ROUND(COALESCE(s.somme_services, 0) * (100 + d.marge_percent) / 100)::BIGINT
+                    ELSE COALESCE(s.somme_services, 0)::BIGINT END AS total_ariary
+    ) t;
@@ -0,0 +1,45 @@
+-- Script de migration vers la version 15 : archives des devis anciens ou fermés, partitionnées par date_cotation
+-- Les tables chaudes (public) ne gardent que les devis récents ; database/archiver_devis.py y déplace les
+-- devis fermés ou anciens par lots, crée les partitions annuelles et détache les plus anciennes
+
+-- Sélection des devis à archiver (date_cotation < seuil)
+CREATE INDEX IF NOT EXISTS idx_devis_date_cotation ON devis(date_cotation);
+
+CREATE SCHEMA IF NOT EXISTS archives;
+
+-- Devis archivés : mêmes colonnes que public.devis, sans clé étrangère, une partition par année
+CREATE TABLE IF NOT EXISTS archives.devis (
+    LIKE public.devis,
+    archive_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_cotation)
+) PARTITION BY RANGE (date_cotation);
+
+CREATE INDEX IF NOT EXISTS idx_archives_devis_id ON archives.devis(id);
+CREATE INDEX IF NOT EXISTS idx_archives_devis_client ON archives.devis(client_id);
+CREATE INDEX IF NOT EXISTS idx_archives_devis_reference ON archives.devis(reference);
+
+-- Lignes archivées : date_cotation du devis (clé de partition) recopiée dans chaque table,
+-- et devis_id ajouté aux lignes rattachées à un jour pour les retrouver sans jointure
+DO $$
+DECLARE
+    source TEXT;
+BEGIN
+    FOREACH source IN ARRAY ARRAY['couts_devis', 'jours_voyage', 'imprevus', 'transferts_aeroport',
+                                  'guides_accompagnateurs', 'lignes_devis']
+    LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS archives.%I (date_cotation DATE NOT NULL, LIKE public.%I, '
+                       'PRIMARY KEY (id, date_cotation)) PARTITION BY RANGE (date_cotation)', source, source);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON archives.%I(devis_id)',
+                       'idx_archives_' || source || '_devis', source);
+    END LOOP;
+
+    FOREACH source IN ARRAY ARRAY['transferts', 'locations_vehicules', 'guidages', 'reserves_parcs',
+                                  'hebergements', 'repas', 'visites_jour', 'locations_journalieres']
+    LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS archives.%I (date_cotation DATE NOT NULL, devis_id INTEGER NOT NULL, '
+                       'LIKE public.%I, PRIMARY KEY (id, date_cotation)) PARTITION BY RANGE (date_cotation)',
+                       source, source);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON archives.%I(devis_id)',
+                       'idx_archives_' || source || '_devis', source);
+    END LOOP;
+END $$;
@@ -0,0 +1,12 @@
+-- Script de migration vers la version 16 : suppression logique des devis
+-- migration: sans transaction
+-- supprimer_devis marque le devis (supprime_le) ; database/purger_devis.py supprime ensuite ses lignes par lots
+
+ALTER TABLE devis ADD COLUMN IF NOT EXISTS supprime_le TIMESTAMP;
+
+-- Devis en service (page d'accueil : ORDER BY created_at DESC LIMIT 50), remplace idx_devis_created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_devis_actifs_created_at ON devis(created_at DESC) WHERE supprime_le IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS idx_devis_created_at;
+
+-- File du purgeur
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_devis_supprimes ON devis(supprime_le) WHERE supprime_le IS NOT NULL;
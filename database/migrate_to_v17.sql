@@ -0,0 +1,32 @@
+-- Script de migration vers la version 17 : instantané JSONB des devis finalisés
+-- POST /api/devis/<id>/finaliser fige le devis complet (lignes, noms et prix, totaux) ; voir_devis le relit
+-- par clé primaire au lieu de rejoindre une douzaine de tables, et les changements du catalogue ne le touchent plus
+
+CREATE TABLE IF NOT EXISTS devis_figes (
+    devis_id INTEGER PRIMARY KEY REFERENCES devis(id) ON DELETE CASCADE,
+    contenu JSONB NOT NULL, -- Contexte complet de devis_detail.html au moment de la finalisation
+    total_ariary BIGINT NOT NULL,
+    total_euro DECIMAL(10, 2) NOT NULL,
+    fige_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Archives (v15) : l'instantané suit son devis, avec les partitions des années déjà archivées
+CREATE TABLE IF NOT EXISTS archives.devis_figes (
+    date_cotation DATE NOT NULL,
+    LIKE public.devis_figes,
+    PRIMARY KEY (devis_id, date_cotation)
+) PARTITION BY RANGE (date_cotation);
+
+DO $$
+DECLARE
+    annee INTEGER;
+BEGIN
+    FOR annee IN
+        SELECT split_part(c.relname, '_', 2)::INTEGER
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'archives.devis'::regclass
+    LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS archives.devis_figes_%s PARTITION OF archives.devis_figes '
+                       'FOR VALUES FROM (%L) TO (%L)', annee, make_date(annee, 1, 1), make_date(annee + 1, 1, 1));
+    END LOOP;
+END $$;
@@ -0,0 +1,40 @@
+-- Script de migration vers la version 18 : historique des versions des devis, stocké en deltas
+-- Chaque enregistrement de nouveau_devis (et chaque finalisation) ajoute une version : seules les lignes
+-- modifiées sont stockées, avec un état complet (point de reprise) toutes les 10 versions (versions.py)
+
+CREATE TABLE IF NOT EXISTS versions_devis (
+    id BIGSERIAL PRIMARY KEY,
+    devis_id INTEGER NOT NULL REFERENCES devis(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    complet BOOLEAN NOT NULL DEFAULT FALSE, -- TRUE : état complet ; FALSE : delta depuis la version précédente
+    contenu JSONB NOT NULL,
+    lignes_modifiees INTEGER NOT NULL DEFAULT 0,
+    cree_le TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(devis_id, version)
+);
+
+-- Reconstruction : dernier point de reprise puis deltas suivants
+CREATE INDEX IF NOT EXISTS idx_versions_devis_reprise ON versions_devis(devis_id, version) WHERE complet;
+
+-- Archives (v15) : l'historique suit son devis
+CREATE TABLE IF NOT EXISTS archives.versions_devis (
+    date_cotation DATE NOT NULL,
+    LIKE public.versions_devis,
+    PRIMARY KEY (id, date_cotation)
+) PARTITION BY RANGE (date_cotation);
+
+CREATE INDEX IF NOT EXISTS idx_archives_versions_devis_devis ON archives.versions_devis(devis_id);
+
+DO $$
+DECLARE
+    annee INTEGER;
+BEGIN
+    FOR annee IN
+        SELECT split_part(c.relname, '_', 2)::INTEGER
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'archives.devis'::regclass
+    LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS archives.versions_devis_%s PARTITION OF archives.versions_devis '
+                       'FOR VALUES FROM (%L) TO (%L)', annee, make_date(annee, 1, 1), make_date(annee + 1, 1, 1));
+    END LOOP;
+END $$;
@@ -0,0 +1,51 @@
+-- Script de migration vers la version 19 : prix négociés des guides accompagnateurs
+-- Origine du prix des guides accompagnateurs : config_prix (TRUE) ou prix négocié saisi dans le devis (FALSE).
+-- Seuls les premiers suivent les changements de config_prix ; les lignes existantes au prix de la
+-- configuration actuelle sont considérées comme tarifées par celle-ci.
+
+ALTER TABLE guides_accompagnateurs ADD COLUMN IF NOT EXISTS prix_catalogue BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE guides_accompagnateurs ga SET prix_catalogue = TRUE
+FROM config_prix c
+WHERE c.cle = 'guide_accompagnateur_par_jour' AND ga.prix_par_jour = c.valeur;
+
+-- Les lignes archivées (v15) gardent l'origine de leur prix
+ALTER TABLE archives.guides_accompagnateurs ADD COLUMN IF NOT EXISTS prix_catalogue BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Index de dépendances : quelle ligne de quel devis utilise quelle entité du catalogue
+CREATE OR REPLACE VIEW dependances_catalogue AS
+    SELECT 'hotels'::VARCHAR AS entite, h.hotel_id AS entite_id, NULL::VARCHAR AS cle,
+           'hebergements'::VARCHAR AS table_source, h.id AS ligne_id, jv.devis_id
+    FROM hebergements h
+    JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+    WHERE h.hotel_id IS NOT NULL
+UNION ALL
+    SELECT 'visites', vj.visite_id, NULL, 'visites_jour', vj.id, jv.devis_id
+    FROM visites_jour vj
+    JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+    WHERE vj.visite_id IS NOT NULL
+UNION ALL
+    SELECT 'types_voitures', lv.type_voiture_id, NULL, 'locations_vehicules', lv.id, jv.devis_id
+    FROM locations_vehicules lv
+    JOIN jours_voyage jv ON jv.id = lv.jour_voyage_id
+    WHERE lv.type_voiture_id IS NOT NULL
+UNION ALL
+    SELECT 'types_locations_journalieres', lj.type_location_id, NULL, 'locations_journalieres', lj.id, jv.devis_id
+    FROM locations_journalieres lj
+    JOIN jours_voyage jv ON jv.id = lj.jour_voyage_id
+    WHERE lj.type_location_id IS NOT NULL
+UNION ALL
+    SELECT 'config_prix', NULL, 'transfert_aeroport_par_trajet', 'transferts_aeroport', ta.id, ta.devis_id
+    FROM transferts_aeroport ta
+UNION ALL
+    SELECT 'config_prix', NULL, 'guide_accompagnateur_par_jour', 'guides_accompagnateurs', ga.id, ga.devis_id
+    FROM guides_accompagnateurs ga
+    WHERE ga.prix_catalogue;
+
+-- Les guides à prix négocié ne sont ni signalés ni re-tarifiés
+CREATE OR REPLACE VIEW prix_attendus_guides_accompagnateurs AS
+    SELECT ga.id, ga.devis_id, c.valeur AS prix_par_jour,
+           c.valeur * COALESCE(ga.nombre_guides, 1) * COALESCE(ga.nombre_jours, 1) AS prix_total
+    FROM guides_accompagnateurs ga
+    JOIN config_prix c ON c.cle = 'guide_accompagnateur_par_jour'
+    WHERE ga.prix_catalogue;
@@ -0,0 +1,29 @@
+-- Script de migration vers la version 20 : version des prix saisonniers tenue par la base
+-- Version des prix des hôtels et des visites : incrémentée à chaque instruction qui modifie un prix de base
+-- ou une période (application, charger_catalogue.py, importer_tarifs.py...) ; le cache des prix
+-- saisonniers de l'application est vidé dès qu'elle change
+
+CREATE SEQUENCE IF NOT EXISTS version_prix_saisonniers;
+
+CREATE OR REPLACE FUNCTION incrementer_version_prix_saisonniers() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM nextval('version_prix_saisonniers');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_hotels_version_prix ON hotels;
+CREATE TRIGGER trg_hotels_version_prix AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hotels
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_prix_saisonniers();
+
+DROP TRIGGER IF EXISTS trg_visites_version_prix ON visites;
+CREATE TRIGGER trg_visites_version_prix AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON visites
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_prix_saisonniers();
+
+DROP TRIGGER IF EXISTS trg_periodes_prix_hotels_version ON periodes_prix_hotels;
+CREATE TRIGGER trg_periodes_prix_hotels_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON periodes_prix_hotels
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_prix_saisonniers();
+
+DROP TRIGGER IF EXISTS trg_periodes_prix_visites_version ON periodes_prix_visites;
+CREATE TRIGGER trg_periodes_prix_visites_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON periodes_prix_visites
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementer_version_prix_saisonniers();
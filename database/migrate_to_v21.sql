@@ -0,0 +1,7 @@
+-- Script de migration vers la version 21 : plus de rafraîchissement des quantiles par déclencheur
+-- Le déclencheur de la v9 rafraîchissait quantiles_prix_hotels (verrou bloquant) à chaque instruction sur hotels :
+-- les scripts de chargement (charger_catalogue.py, importer_tarifs.py) rafraîchissent la vue une fois, après
+-- leur transaction, avec REFRESH MATERIALIZED VIEW CONCURRENTLY (lectures non bloquées)
+
+DROP TRIGGER IF EXISTS trg_hotels_quantiles ON hotels;
+DROP FUNCTION IF EXISTS rafraichir_quantiles_prix_hotels();
@@ -0,0 +1,6 @@
+-- Script de migration vers la version 22 : référence unique parmi les devis en service seulement
+-- migration: sans transaction
+-- Un devis supprimé, en attente de purge, ne bloque pas la création d'un nouveau devis sous la même référence
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_devis_reference_actifs ON devis(reference) WHERE supprime_le IS NULL;
+ALTER TABLE devis DROP CONSTRAINT IF EXISTS devis_reference_key;
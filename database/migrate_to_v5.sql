@@ -0,0 +1,177 @@
+-- Script de migration vers la version 5 : index de dépendances catalogue -> lignes de devis
+-- et file de re-tarification des devis brouillon impactés par un changement de prix
+
+-- Table des prix de configuration (lue par l'application via /api/config_prix)
+CREATE TABLE IF NOT EXISTS config_prix (
+    cle VARCHAR(100) PRIMARY KEY,
+    valeur DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    description TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO config_prix (cle, valeur, description) VALUES
+    ('transfert_aeroport_par_trajet', 250000, 'Prix d''un transfert aéroport par trajet'),
+    ('guide_accompagnateur_par_jour', 280000, 'Prix d''un guide accompagnateur par jour')
+ON CONFLICT (cle) DO NOTHING;
+
+-- Index manquants sur les références catalogue des lignes de devis
+CREATE INDEX IF NOT EXISTS idx_locations_journalieres_type ON locations_journalieres(type_location_id);
+CREATE INDEX IF NOT EXISTS idx_devis_brouillon ON devis(id) WHERE statut = 'brouillon';
+
+-- Index de dépendances : quelle ligne de quel devis utilise quelle entité du catalogue
+CREATE OR REPLACE VIEW dependances_catalogue AS
+    SELECT 'hotels'::VARCHAR AS entite, h.hotel_id AS entite_id, NULL::VARCHAR AS cle,
+           'hebergements'::VARCHAR AS table_source, h.id AS ligne_id, jv.devis_id
+    FROM hebergements h
+    JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+    WHERE h.hotel_id IS NOT NULL
+UNION ALL
+    SELECT 'visites', vj.visite_id, NULL, 'visites_jour', vj.id, jv.devis_id
+    FROM visites_jour vj
+    JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+    WHERE vj.visite_id IS NOT NULL
+UNION ALL
+    SELECT 'types_voitures', lv.type_voiture_id, NULL, 'locations_vehicules', lv.id, jv.devis_id
+    FROM locations_vehicules lv
+    JOIN jours_voyage jv ON jv.id = lv.jour_voyage_id
+    WHERE lv.type_voiture_id IS NOT NULL
+UNION ALL
+    SELECT 'types_locations_journalieres', lj.type_location_id, NULL, 'locations_journalieres', lj.id, jv.devis_id
+    FROM locations_journalieres lj
+    JOIN jours_voyage jv ON jv.id = lj.jour_voyage_id
+    WHERE lj.type_location_id IS NOT NULL
+UNION ALL
+    SELECT 'config_prix', NULL, 'transfert_aeroport_par_trajet', 'transferts_aeroport', ta.id, ta.devis_id
+    FROM transferts_aeroport ta
+UNION ALL
+    SELECT 'config_prix', NULL, 'guide_accompagnateur_par_jour', 'guides_accompagnateurs', ga.id, ga.devis_id
+    FROM guides_accompagnateurs ga;
+
+-- Prix attendus de chaque ligne selon le catalogue actuel (mêmes règles que app.py)
+CREATE OR REPLACE VIEW prix_attendus_hebergements AS
+    SELECT h.id, jv.devis_id, h.hotel_id AS entite_id,
+           (CASE WHEN h.type_chambre = 'Triple' AND COALESCE(ho.prix_triple, 0) <> 0
+                 THEN ho.prix_triple ELSE ho.prix_double END) * COALESCE(h.nombre_chambres, 0) AS prix_ariary
+    FROM hebergements h
+    JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+    JOIN hotels ho ON ho.id = h.hotel_id;
+
+CREATE OR REPLACE VIEW prix_attendus_visites_jour AS
+    SELECT vj.id, jv.devis_id, vj.visite_id AS entite_id,
+           p.prix_entree, p.prix_guidage, p.prix_taxe_communale,
+           p.prix_entree + p.prix_guidage + p.prix_taxe_communale AS prix_total
+    FROM visites_jour vj
+    JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+    JOIN visites v ON v.id = vj.visite_id
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(vj.nombre_personnes, 0) AS nb,
+               COALESCE(NULLIF(v.guidage_nb_personnes_base, 0), 4) AS nb_base
+    ) n
+    CROSS JOIN LATERAL (
+        SELECT
+            CASE WHEN v.type_prix = 'personne' THEN COALESCE(v.prix_par_personne, 0) * n.nb
+                 WHEN v.type_prix IN ('voiture', 'bateau') THEN COALESCE(v.prix_par_voiture, 0)
+                 ELSE 0
+            END AS prix_entree,
+            CASE WHEN NOT COALESCE(v.guidage_obligatoire, FALSE) OR COALESCE(v.guidage_prix_base, 0) = 0 THEN 0
+                 WHEN v.guidage_type_calcul = 'par_personne' THEN v.guidage_prix_base * n.nb
+                 WHEN v.guidage_type_calcul = 'par_voiture' THEN v.guidage_prix_base
+                 ELSE v.guidage_prix_base * ((n.nb + n.nb_base - 1) / n.nb_base)
+            END AS prix_guidage,
+            COALESCE(v.taxe_communale, 0) * n.nb AS prix_taxe_communale
+    ) p;
+
+CREATE OR REPLACE VIEW prix_attendus_locations_vehicules AS
+    SELECT lv.id, jv.devis_id, lv.type_voiture_id AS entite_id,
+           COALESCE(lv.kilometrage, 0) * tv.consommation_l_100km / 100 AS consommation_carburant,
+           COALESCE(lv.kilometrage, 0) * tv.consommation_l_100km / 100
+               * (COALESCE(lv.prix_carburant_pompe, 0) + 500) AS prix_carburant_total
+    FROM locations_vehicules lv
+    JOIN jours_voyage jv ON jv.id = lv.jour_voyage_id
+    JOIN types_voitures tv ON tv.id = lv.type_voiture_id;
+
+CREATE OR REPLACE VIEW prix_attendus_locations_journalieres AS
+    SELECT lj.id, jv.devis_id, lj.type_location_id AS entite_id,
+           (CASE WHEN lj.avec_carburant THEN t.prix_journalier_avec_carburant
+                 ELSE t.prix_journalier_sans_carburant END)
+               * COALESCE(lj.nombre_vehicules, 1) * COALESCE(lj.nombre_jours, 1) AS prix_total
+    FROM locations_journalieres lj
+    JOIN jours_voyage jv ON jv.id = lj.jour_voyage_id
+    JOIN types_locations_journalieres t ON t.id = lj.type_location_id;
+
+CREATE OR REPLACE VIEW prix_attendus_transferts_aeroport AS
+    SELECT ta.id, ta.devis_id, c.valeur AS prix_par_trajet,
+           c.valeur * COALESCE(ta.nombre_trajets, 1) AS prix_total
+    FROM transferts_aeroport ta
+    JOIN config_prix c ON c.cle = 'transfert_aeroport_par_trajet';
+
+CREATE OR REPLACE VIEW prix_attendus_guides_accompagnateurs AS
+    SELECT ga.id, ga.devis_id, c.valeur AS prix_par_jour,
+           c.valeur * COALESCE(ga.nombre_guides, 1) * COALESCE(ga.nombre_jours, 1) AS prix_total
+    FROM guides_accompagnateurs ga
+    JOIN config_prix c ON c.cle = 'guide_accompagnateur_par_jour';
+
+-- File des devis brouillon à re-tarifier
+CREATE TABLE IF NOT EXISTS devis_a_recalculer (
+    id SERIAL PRIMARY KEY,
+    devis_id INTEGER REFERENCES devis(id) ON DELETE CASCADE,
+    entite VARCHAR(50) NOT NULL, -- Table du catalogue modifiée
+    entite_id INTEGER, -- Identifiant de l'entité (NULL pour config_prix)
+    cle VARCHAR(100), -- Clé de config_prix (NULL sinon)
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_devis_a_recalculer_unique
+    ON devis_a_recalculer(devis_id, entite, COALESCE(entite_id, 0), COALESCE(cle, ''));
+
+-- Alimente la file à chaque changement de prix du catalogue
+CREATE OR REPLACE FUNCTION signaler_devis_impactes() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'config_prix' THEN
+        INSERT INTO devis_a_recalculer (devis_id, entite, cle)
+        SELECT DISTINCT dc.devis_id, 'config_prix', NEW.cle
+        FROM dependances_catalogue dc
+        JOIN devis d ON d.id = dc.devis_id
+        WHERE dc.entite = 'config_prix' AND dc.cle = NEW.cle AND d.statut = 'brouillon'
+        ON CONFLICT DO NOTHING;
+    ELSE
+        INSERT INTO devis_a_recalculer (devis_id, entite, entite_id)
+        SELECT DISTINCT dc.devis_id, TG_TABLE_NAME, NEW.id
+        FROM dependances_catalogue dc
+        JOIN devis d ON d.id = dc.devis_id
+        WHERE dc.entite = TG_TABLE_NAME AND dc.entite_id = NEW.id AND d.statut = 'brouillon'
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_hotels_impact ON hotels;
+CREATE TRIGGER trg_hotels_impact AFTER UPDATE ON hotels FOR EACH ROW
+    WHEN ((OLD.prix_double, OLD.prix_triple) IS DISTINCT FROM (NEW.prix_double, NEW.prix_triple))
+    EXECUTE FUNCTION signaler_devis_impactes();
+
+DROP TRIGGER IF EXISTS trg_visites_impact ON visites;
+CREATE TRIGGER trg_visites_impact AFTER UPDATE ON visites FOR EACH ROW
+    WHEN ((OLD.prix_par_personne, OLD.prix_par_voiture, OLD.type_prix, OLD.guidage_obligatoire,
+           OLD.guidage_prix_base, OLD.guidage_nb_personnes_base, OLD.guidage_type_calcul, OLD.taxe_communale)
+          IS DISTINCT FROM
+          (NEW.prix_par_personne, NEW.prix_par_voiture, NEW.type_prix, NEW.guidage_obligatoire,
+           NEW.guidage_prix_base, NEW.guidage_nb_personnes_base, NEW.guidage_type_calcul, NEW.taxe_communale))
+    EXECUTE FUNCTION signaler_devis_impactes();
+
+DROP TRIGGER IF EXISTS trg_types_voitures_impact ON types_voitures;
+CREATE TRIGGER trg_types_voitures_impact AFTER UPDATE ON types_voitures FOR EACH ROW
+    WHEN (OLD.consommation_l_100km IS DISTINCT FROM NEW.consommation_l_100km)
+    EXECUTE FUNCTION signaler_devis_impactes();
+
+DROP TRIGGER IF EXISTS trg_types_locations_journalieres_impact ON types_locations_journalieres;
+CREATE TRIGGER trg_types_locations_journalieres_impact AFTER UPDATE ON types_locations_journalieres FOR EACH ROW
+    WHEN ((OLD.prix_journalier_sans_carburant, OLD.prix_journalier_avec_carburant)
+          IS DISTINCT FROM (NEW.prix_journalier_sans_carburant, NEW.prix_journalier_avec_carburant))
+    EXECUTE FUNCTION signaler_devis_impactes();
+
+DROP TRIGGER IF EXISTS trg_config_prix_impact ON config_prix;
+CREATE TRIGGER trg_config_prix_impact AFTER UPDATE ON config_prix FOR EACH ROW
+    WHEN (OLD.valeur IS DISTINCT FROM NEW.valeur)
+    EXECUTE FUNCTION signaler_devis_impactes();
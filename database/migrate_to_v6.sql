@@ -0,0 +1,18 @@
+-- Script de migration vers la version 6 : historique des taux de change Ariary/Euro
+
+-- Table des taux de change avec date d'effet
+CREATE TABLE IF NOT EXISTS taux_change_historique (
+    id SERIAL PRIMARY KEY,
+    date_effet DATE UNIQUE NOT NULL, -- Le taux s'applique à partir de cette date
+    taux DECIMAL(10, 2) NOT NULL, -- Ariary pour 1 Euro
+    source VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Taux par défaut utilisé jusqu'ici sur tous les devis
+INSERT INTO taux_change_historique (date_effet, taux, source) VALUES
+    ('2000-01-01', 4420, 'Taux par défaut historique')
+ON CONFLICT (date_effet) DO NOTHING;
+
+-- Index pour la re-conversion en masse des devis ouverts
+CREATE INDEX IF NOT EXISTS idx_devis_statut ON devis(statut);
@@ -0,0 +1,122 @@
+-- Script de migration vers la version 7 : prix saisonniers des hôtels et des visites
+
+-- Nécessaire pour combiner égalité sur l'identifiant et chevauchement de périodes dans un index GiST
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Date réelle de départ du voyage (le jour N a lieu le date_depart + N - 1)
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'devis' AND column_name = 'date_depart'
+    ) THEN
+        ALTER TABLE devis ADD COLUMN date_depart DATE;
+    END IF;
+END $$;
+
+-- Périodes de prix des hôtels (remplacent prix_double/prix_triple sur la période)
+CREATE TABLE IF NOT EXISTS periodes_prix_hotels (
+    id SERIAL PRIMARY KEY,
+    hotel_id INTEGER NOT NULL REFERENCES hotels(id) ON DELETE CASCADE,
+    periode DATERANGE NOT NULL, -- Ex: '[2024-07-01,2024-09-01)' pour la haute saison
+    libelle VARCHAR(100), -- Ex: 'Haute saison'
+    prix_double DECIMAL(15, 2) NOT NULL,
+    prix_triple DECIMAL(15, 2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Une seule période applicable par hôtel et par date (sert aussi d'index GiST de recherche)
+    EXCLUDE USING gist (hotel_id WITH =, periode WITH &&)
+);
+
+-- Périodes de prix des visites (NULL = prix de base de la visite)
+CREATE TABLE IF NOT EXISTS periodes_prix_visites (
+    id SERIAL PRIMARY KEY,
+    visite_id INTEGER NOT NULL REFERENCES visites(id) ON DELETE CASCADE,
+    periode DATERANGE NOT NULL,
+    libelle VARCHAR(100),
+    prix_par_personne DECIMAL(15, 2),
+    prix_par_voiture DECIMAL(15, 2),
+    guidage_prix_base DECIMAL(15, 2),
+    taxe_communale DECIMAL(15, 2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    EXCLUDE USING gist (visite_id WITH =, periode WITH &&)
+);
+
+-- Les prix attendus tiennent compte de la période en vigueur à la date réelle du jour
+CREATE OR REPLACE VIEW prix_attendus_hebergements AS
+    SELECT h.id, jv.devis_id, h.hotel_id AS entite_id,
+           (CASE WHEN h.type_chambre = 'Triple' AND COALESCE(p.prix_triple, ho.prix_triple, 0) <> 0
+                 THEN COALESCE(p.prix_triple, ho.prix_triple)
+                 ELSE COALESCE(p.prix_double, ho.prix_double) END) * COALESCE(h.nombre_chambres, 0) AS prix_ariary
+    FROM hebergements h
+    JOIN jours_voyage jv ON jv.id = h.jour_voyage_id
+    JOIN devis d ON d.id = jv.devis_id
+    JOIN hotels ho ON ho.id = h.hotel_id
+    LEFT JOIN periodes_prix_hotels p
+        ON p.hotel_id = h.hotel_id AND p.periode @> (d.date_depart + (jv.numero_jour - 1));
+
+CREATE OR REPLACE VIEW prix_attendus_visites_jour AS
+    SELECT vj.id, jv.devis_id, vj.visite_id AS entite_id,
+           p.prix_entree, p.prix_guidage, p.prix_taxe_communale,
+           p.prix_entree + p.prix_guidage + p.prix_taxe_communale AS prix_total
+    FROM visites_jour vj
+    JOIN jours_voyage jv ON jv.id = vj.jour_voyage_id
+    JOIN devis d ON d.id = jv.devis_id
+    JOIN visites v ON v.id = vj.visite_id
+    LEFT JOIN periodes_prix_visites s
+        ON s.visite_id = vj.visite_id AND s.periode @> (d.date_depart + (jv.numero_jour - 1))
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(vj.nombre_personnes, 0) AS nb,
+               COALESCE(NULLIF(v.guidage_nb_personnes_base, 0), 4) AS nb_base,
+               COALESCE(s.guidage_prix_base, v.guidage_prix_base, 0) AS guidage_prix_base
+    ) n
+    CROSS JOIN LATERAL (
+        SELECT
+            CASE WHEN v.type_prix = 'personne' THEN COALESCE(s.prix_par_personne, v.prix_par_personne, 0) * n.nb
+                 WHEN v.type_prix IN ('voiture', 'bateau') THEN COALESCE(s.prix_par_voiture, v.prix_par_voiture, 0)
+                 ELSE 0
+            END AS prix_entree,
+            CASE WHEN NOT COALESCE(v.guidage_obligatoire, FALSE) OR n.guidage_prix_base = 0 THEN 0
+                 WHEN v.guidage_type_calcul = 'par_personne' THEN n.guidage_prix_base * n.nb
+                 WHEN v.guidage_type_calcul = 'par_voiture' THEN n.guidage_prix_base
+                 ELSE n.guidage_prix_base * ((n.nb + n.nb_base - 1) / n.nb_base)
+            END AS prix_guidage,
+            COALESCE(s.taxe_communale, v.taxe_communale, 0) * n.nb AS prix_taxe_communale
+    ) p;
+
+-- Un changement de période signale les devis brouillon qui utilisent l'hôtel ou la visite
+CREATE OR REPLACE FUNCTION signaler_periode_modifiee() RETURNS TRIGGER AS $$
+DECLARE
+    ligne RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        ligne := OLD;
+    ELSE
+        ligne := NEW;
+    END IF;
+
+    IF TG_TABLE_NAME = 'periodes_prix_hotels' THEN
+        INSERT INTO devis_a_recalculer (devis_id, entite, entite_id)
+        SELECT DISTINCT dc.devis_id, 'hotels', ligne.hotel_id
+        FROM dependances_catalogue dc
+        JOIN devis d ON d.id = dc.devis_id
+        WHERE dc.entite = 'hotels' AND dc.entite_id = ligne.hotel_id AND d.statut = 'brouillon'
+        ON CONFLICT DO NOTHING;
+    ELSE
+        INSERT INTO devis_a_recalculer (devis_id, entite, entite_id)
+        SELECT DISTINCT dc.devis_id, 'visites', ligne.visite_id
+        FROM dependances_catalogue dc
+        JOIN devis d ON d.id = dc.devis_id
+        WHERE dc.entite = 'visites' AND dc.entite_id = ligne.visite_id AND d.statut = 'brouillon'
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_periodes_prix_hotels_impact ON periodes_prix_hotels;
+CREATE TRIGGER trg_periodes_prix_hotels_impact AFTER INSERT OR UPDATE OR DELETE ON periodes_prix_hotels
+    FOR EACH ROW EXECUTE FUNCTION signaler_periode_modifiee();
+
+DROP TRIGGER IF EXISTS trg_periodes_prix_visites_impact ON periodes_prix_visites;
+CREATE TRIGGER trg_periodes_prix_visites_impact AFTER INSERT OR UPDATE OR DELETE ON periodes_prix_visites
+    FOR EACH ROW EXECUTE FUNCTION signaler_periode_modifiee();
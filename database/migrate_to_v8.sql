@@ -0,0 +1,11 @@
+-- Script de migration vers la version 8 : graphe des distances routières entre itinéraires
+
+-- Arêtes du graphe (non orienté : itineraire_a_id < itineraire_b_id)
+CREATE TABLE IF NOT EXISTS distances_itineraires (
+    itineraire_a_id INTEGER REFERENCES itineraires(id) ON DELETE CASCADE,
+    itineraire_b_id INTEGER REFERENCES itineraires(id) ON DELETE CASCADE,
+    distance_km INTEGER NOT NULL CHECK (distance_km >= 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (itineraire_a_id, itineraire_b_id),
+    CHECK (itineraire_a_id < itineraire_b_id)
+);
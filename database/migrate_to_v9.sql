@@ -0,0 +1,40 @@
+-- Script de migration vers la version 9 : catégories d'hôtels et quantiles de prix par itinéraire
+
+-- Catégorie de l'hôtel (nombre d'étoiles, 1 à 5)
+DO $$ 
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'hotels' AND column_name = 'categorie'
+    ) THEN
+        ALTER TABLE hotels ADD COLUMN categorie INTEGER CHECK (categorie BETWEEN 1 AND 5);
+    END IF;
+END $$;
+
+-- Quantiles des prix (chambre double) des hôtels actifs de chaque itinéraire,
+-- utilisés pour définir les gammes de budget de l'optimiseur d'hébergement
+CREATE MATERIALIZED VIEW IF NOT EXISTS quantiles_prix_hotels AS
+    SELECT itineraire_id,
+           COUNT(*) AS nombre_hotels,
+           MIN(prix_double) AS prix_min,
+           percentile_cont(0.25) WITHIN GROUP (ORDER BY prix_double) AS p25,
+           percentile_cont(0.50) WITHIN GROUP (ORDER BY prix_double) AS p50,
+           percentile_cont(0.75) WITHIN GROUP (ORDER BY prix_double) AS p75,
+           MAX(prix_double) AS prix_max
+    FROM hotels
+    WHERE actif = TRUE
+    GROUP BY itineraire_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_quantiles_prix_hotels_itineraire ON quantiles_prix_hotels(itineraire_id);
+
+-- Rafraîchir les quantiles à chaque modification du catalogue d'hôtels (une fois par instruction)
+CREATE OR REPLACE FUNCTION rafraichir_quantiles_prix_hotels() RETURNS TRIGGER AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW quantiles_prix_hotels;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_hotels_quantiles ON hotels;
+CREATE TRIGGER trg_hotels_quantiles AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON hotels
+    FOR EACH STATEMENT EXECUTE FUNCTION rafraichir_quantiles_prix_hotels();
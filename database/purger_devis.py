@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Purge des devis supprimés (migration v16) : supprimer_devis ne fait que marquer le devis (supprime_le),
+ce script efface ensuite ses lignes table par table, par petits lots (une transaction par lot, pause entre
+deux lots), puis le devis lui-même. Interrompu, il reprend là où il s'était arrêté au passage suivant.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+# Verrou consultatif : un seul purgeur à la fois
+CLE_VERROU = 7_201_048
+
+# Tables vidées avant le devis, enfants d'abord : (table, rattachement) avec 'jour' (jour_voyage_id)
+# ou 'devis' (devis_id). lignes_devis en premier : ses déclencheurs n'ont alors plus rien à supprimer.
+TABLES_PURGEES = [
+    ('lignes_devis', 'devis'),
+    ('transferts', 'jour'),
+    ('locations_vehicules', 'jour'),
+    ('guidages', 'jour'),
+    ('reserves_parcs', 'jour'),
+    ('hebergements', 'jour'),
+    ('repas', 'jour'),
+    ('visites_jour', 'jour'),
+    ('locations_journalieres', 'jour'),
+    ('couts_devis', 'devis'),
+    ('imprevus', 'devis'),
+    ('transferts_aeroport', 'devis'),
+    ('guides_accompagnateurs', 'devis'),
+    ('devis_a_recalculer', 'devis'),
+    ('versions_devis', 'devis'),
+    ('jours_voyage', 'devis'),
+]
+
+DEVIS_SUPPRIMES = """
+    SELECT id FROM devis
+    WHERE supprime_le IS NOT NULL AND supprime_le < CURRENT_TIMESTAMP - make_interval(mins => %s)
+    ORDER BY supprime_le
+    LIMIT %s
+"""
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def requete_purge(table, rattachement):
+    """DELETE d'au plus %(lignes)s lignes de la table appartenant aux devis %(devis)s"""
+    if rattachement == 'jour':
+        selection = f"""
+            SELECT t.id FROM {table} t JOIN jours_voyage jv ON jv.id = t.jour_voyage_id
+            WHERE jv.devis_id = ANY(%(devis)s) LIMIT %(lignes)s
+        """
+    else:
+        selection = f"SELECT id FROM {table} WHERE devis_id = ANY(%(devis)s) LIMIT %(lignes)s"
+    return f"DELETE FROM {table} WHERE id IN ({selection})"
+
+def purger_lot(conn, devis_ids, lignes_par_lot, pause):
+    """Vide les tables de lignes des devis par lots puis supprime les devis ; retourne {table: lignes}"""
+    supprimees = {}
+    cur = conn.cursor()
+    try:
+        for table, rattachement in TABLES_PURGEES:
+            requete = requete_purge(table, rattachement)
+            while True:
+                cur.execute(requete, {'devis': devis_ids, 'lignes': lignes_par_lot})
+                conn.commit()
+                supprimees[table] = supprimees.get(table, 0) + cur.rowcount
+                if cur.rowcount < lignes_par_lot:
+                    break
+                time.sleep(pause)
+        # Garde-fou : un devis remis en service entre-temps n'est pas supprimé
+        cur.execute("DELETE FROM devis WHERE id = ANY(%s) AND supprime_le IS NOT NULL", (devis_ids,))
+        supprimees['devis'] = cur.rowcount
+        conn.commit()
+        return supprimees
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def purger(conn, devis_par_lot, lignes_par_lot, pause, delai):
+    """Purge tous les devis supprimés depuis plus de `delai` minutes ; retourne {table: lignes}"""
+    total = {}
+    while True:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(DEVIS_SUPPRIMES, (delai, devis_par_lot))
+        devis_ids = [ligne['id'] for ligne in cur.fetchall()]
+        cur.close()
+        conn.commit()
+        if not devis_ids:
+            return total
+
+        debut = time.perf_counter()
+        for table, lignes in purger_lot(conn, devis_ids, lignes_par_lot, pause).items():
+            total[table] = total.get(table, 0) + lignes
+        print(f"  → {total.get('devis', 0)} devis purgé(s) ({time.perf_counter() - debut:.2f} s pour ce lot)")
+        time.sleep(pause)
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Purge par lots des devis supprimés")
+    parser.add_argument('--devis', type=int, default=20, help="Nombre de devis purgés ensemble")
+    parser.add_argument('--lignes', type=int, default=1000, help="Lignes supprimées au plus par transaction")
+    parser.add_argument('--pause', type=float, default=0.1, help="Pause entre deux transactions (secondes)")
+    parser.add_argument('--delai', type=int, default=0,
+                        help="Ne purger que les devis supprimés depuis plus de N minutes")
+    parser.add_argument('--continu', action='store_true', help="Tourner en tâche de fond")
+    parser.add_argument('--intervalle', type=int, default=60,
+                        help="Avec --continu, attente entre deux passages (secondes)")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("PURGE DES DEVIS SUPPRIMÉS")
+        print("=" * 80)
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (CLE_VERROU,))
+            verrou = cur.fetchone()[0]
+        conn.commit()
+        if not verrou:
+            print("⚠️  Un autre purgeur est déjà en cours")
+            return
+
+        while True:
+            debut = time.perf_counter()
+            total = purger(conn, args.devis, args.lignes, args.pause, args.delai)
+            if total:
+                for table, lignes in total.items():
+                    if lignes:
+                        print(f"  • {table:<25} {lignes:>10} ligne(s)")
+                print(f"✅ {total.get('devis', 0)} devis purgé(s) en {time.perf_counter() - debut:.2f} s")
+            elif not args.continu:
+                print("✅ Aucun devis à purger")
+            if not args.continu:
+                break
+            time.sleep(args.intervalle)
+    except KeyboardInterrupt:
+        print("\nArrêt du purgeur")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script de rapprochement des devis importés depuis Excel : compare les valeurs du classeur
+(I3, I4, I6 et coûts par catégorie E2-E10) avec les totaux recalculés par la base,
+et produit un rapport des écarts en CSV et en HTML, regroupé par catégorie
+"""
+
+import argparse
+import csv
+import html
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+COLONNES_RAPPORT = ['groupe', 'devis_id', 'reference', 'client', 'fichier', 'feuille',
+                    'valeur_excel', 'valeur_recalculee', 'ecart', 'ecart_pct']
+
+# Devis à rapprocher : ceux du registre d'import (valeurs d'origine du classeur)
+DEVIS_IMPORTES = """
+    SELECT f.devis_id, f.fichier, f.feuille,
+           f.total_ariary_excel, f.marge_excel, f.total_euro_excel
+    FROM imports_feuilles f
+    WHERE f.devis_id IS NOT NULL
+"""
+
+# ... ou tous les devis (valeurs actuellement enregistrées dans devis)
+TOUS_LES_DEVIS = """
+    SELECT d.id AS devis_id, NULL::VARCHAR AS fichier, NULL::VARCHAR AS feuille,
+           d.total_ariary AS total_ariary_excel, d.marge AS marge_excel, d.total_euro AS total_euro_excel
+    FROM devis d
+"""
+
+# Un seul passage ensembliste sur tout l'historique, trié par groupe pour l'écriture en flux
+REQUETE_ECARTS = """
+    WITH importes AS ({devis}),
+    couts_excel AS (
+        SELECT cd.devis_id, cc.nom AS categorie, SUM(cd.montant_ariary) AS montant
+        FROM couts_devis cd
+        JOIN categories_couts cc ON cc.id = cd.categorie_id
+        WHERE cd.devis_id IN (SELECT devis_id FROM importes)
+        GROUP BY cd.devis_id, cc.nom
+    ),
+    couts_recalcules AS (
+        SELECT devis_id, categorie, montant
+        FROM montants_recalcules_devis
+        WHERE devis_id IN (SELECT devis_id FROM importes)
+    ),
+    ecarts AS (
+        SELECT i.devis_id, 1 AS ordre, 'Total Ariary (I3)' AS groupe,
+               i.total_ariary_excel AS valeur_excel, t.total_ariary AS valeur_recalculee
+        FROM importes i JOIN totaux_recalcules_devis t ON t.devis_id = i.devis_id
+    UNION ALL
+        SELECT i.devis_id, 2, 'Marge (I4)', i.marge_excel, t.marge
+        FROM importes i JOIN totaux_recalcules_devis t ON t.devis_id = i.devis_id
+    UNION ALL
+        SELECT i.devis_id, 3, 'Total Euro (I6)', i.total_euro_excel, t.total_euro
+        FROM importes i JOIN totaux_recalcules_devis t ON t.devis_id = i.devis_id
+    UNION ALL
+        SELECT COALESCE(e.devis_id, r.devis_id), 4, COALESCE(e.categorie, r.categorie), e.montant, r.montant
+        FROM couts_excel e
+        FULL JOIN couts_recalcules r ON r.devis_id = e.devis_id AND r.categorie = e.categorie
+    )
+    SELECT e.groupe, e.devis_id, d.reference, c.nom AS client, i.fichier, i.feuille,
+           COALESCE(e.valeur_excel, 0) AS valeur_excel,
+           COALESCE(e.valeur_recalculee, 0) AS valeur_recalculee,
+           COALESCE(e.valeur_recalculee, 0) - COALESCE(e.valeur_excel, 0) AS ecart,
+           CASE WHEN COALESCE(e.valeur_excel, 0) <> 0
+                THEN ROUND(100 * (COALESCE(e.valeur_recalculee, 0) - e.valeur_excel) / ABS(e.valeur_excel), 2)
+           END AS ecart_pct
+    FROM ecarts e
+    JOIN importes i ON i.devis_id = e.devis_id
+    JOIN devis d ON d.id = e.devis_id
+    LEFT JOIN clients c ON c.id = d.client_id
+    WHERE d.supprime_le IS NULL
+      AND ABS(COALESCE(e.valeur_recalculee, 0) - COALESCE(e.valeur_excel, 0))
+          > CASE WHEN e.ordre = 3 THEN %(tolerance_euro)s ELSE %(tolerance)s END
+    ORDER BY e.ordre, e.groupe, ABS(COALESCE(e.valeur_recalculee, 0) - COALESCE(e.valeur_excel, 0)) DESC
+"""
+
+ENTETE_HTML = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>Rapprochement des devis importés</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; }}
+th {{ background: #1f4e78; color: #fff; }}
+td.nombre {{ text-align: right; }}
+.positif {{ color: #b00020; }}
+.negatif {{ color: #1b5e20; }}
+</style>
+</head>
+<body>
+<h1>Rapprochement des devis importés</h1>
+<p>Généré le {date} &mdash; tolérance {tolerance} Ar / {tolerance_euro} &euro;</p>
+"""
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def nombre_html(valeur):
+    """Formate un montant pour le rapport HTML"""
+    if valeur is None:
+        return ''
+    return f"{valeur:,.2f}".replace(',', ' ')
+
+def ecrire_rapports(lignes, fichier_csv, fichier_html, tolerance, tolerance_euro):
+    """Écrit en flux les écarts (triés par groupe) en CSV et en HTML ; retourne la synthèse par groupe"""
+    synthese = {}
+    groupe_courant = None
+
+    with open(fichier_csv, 'w', encoding='utf-8', newline='') as f_csv, \
+         open(fichier_html, 'w', encoding='utf-8') as f_html:
+        writer = csv.DictWriter(f_csv, fieldnames=COLONNES_RAPPORT, delimiter=';')
+        writer.writeheader()
+        f_html.write(ENTETE_HTML.format(date=time.strftime('%Y-%m-%d %H:%M'),
+                                        tolerance=tolerance, tolerance_euro=tolerance_euro))
+
+        for ligne in lignes:
+            writer.writerow({col: ligne[col] for col in COLONNES_RAPPORT})
+
+            groupe = ligne['groupe']
+            if groupe != groupe_courant:
+                if groupe_courant is not None:
+                    f_html.write("</table>\n")
+                f_html.write(f"<h2>{html.escape(groupe)}</h2>\n<table>\n<tr><th>Devis</th><th>Client</th>"
+                             "<th>Classeur / feuille</th><th>Excel</th><th>Recalculé</th><th>Écart</th>"
+                             "<th>%</th></tr>\n")
+                groupe_courant = groupe
+                synthese[groupe] = {'devis': 0, 'ecart_total': 0, 'ecart_absolu': 0}
+
+            synthese[groupe]['devis'] += 1
+            synthese[groupe]['ecart_total'] += ligne['ecart']
+            synthese[groupe]['ecart_absolu'] += abs(ligne['ecart'])
+
+            source = f"{ligne['fichier']} / {ligne['feuille']}" if ligne['fichier'] else ''
+            classe = 'positif' if ligne['ecart'] > 0 else 'negatif'
+            f_html.write(
+                f"<tr><td>{html.escape(ligne['reference'] or '')}</td>"
+                f"<td>{html.escape(ligne['client'] or '')}</td>"
+                f"<td>{html.escape(source)}</td>"
+                f"<td class=\"nombre\">{nombre_html(ligne['valeur_excel'])}</td>"
+                f"<td class=\"nombre\">{nombre_html(ligne['valeur_recalculee'])}</td>"
+                f"<td class=\"nombre {classe}\">{nombre_html(ligne['ecart'])}</td>"
+                f"<td class=\"nombre\">{'' if ligne['ecart_pct'] is None else ligne['ecart_pct']}</td></tr>\n")
+
+        if groupe_courant is not None:
+            f_html.write("</table>\n")
+
+        f_html.write("<h2>Synthèse par catégorie</h2>\n<table>\n<tr><th>Catégorie</th><th>Devis en écart</th>"
+                     "<th>Écart cumulé</th><th>Écart absolu cumulé</th></tr>\n")
+        for groupe, stats in synthese.items():
+            f_html.write(f"<tr><td>{html.escape(groupe)}</td><td class=\"nombre\">{stats['devis']}</td>"
+                         f"<td class=\"nombre\">{nombre_html(stats['ecart_total'])}</td>"
+                         f"<td class=\"nombre\">{nombre_html(stats['ecart_absolu'])}</td></tr>\n")
+        if not synthese:
+            f_html.write("<tr><td colspan=\"4\">Aucun écart au-delà de la tolérance</td></tr>\n")
+        f_html.write("</table>\n</body>\n</html>\n")
+
+    return synthese
+
+def reconcilier(conn, prefixe_sortie, tolerance=1, tolerance_euro=0.01, tous=False):
+    """Calcule les écarts de tout l'historique en une requête et écrit les rapports"""
+    requete = REQUETE_ECARTS.format(devis=TOUS_LES_DEVIS if tous else DEVIS_IMPORTES)
+
+    # Curseur côté serveur : les écarts sont lus et écrits par paquets
+    cur = conn.cursor(name='rapprochement_devis', cursor_factory=RealDictCursor)
+    cur.itersize = 2000
+    cur.execute(requete, {'tolerance': tolerance, 'tolerance_euro': tolerance_euro})
+    try:
+        return ecrire_rapports(cur, f"{prefixe_sortie}.csv", f"{prefixe_sortie}.html", tolerance, tolerance_euro)
+    finally:
+        cur.close()
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Rapprochement des totaux Excel importés et des totaux recalculés")
+    parser.add_argument('-o', '--sortie', default='rapprochement_devis',
+                        help="Préfixe des rapports (.csv et .html)")
+    parser.add_argument('--tolerance', type=float, default=1, help="Écart toléré en Ariary")
+    parser.add_argument('--tolerance-euro', type=float, default=0.01, help="Écart toléré en Euro")
+    parser.add_argument('--tous', action='store_true',
+                        help="Rapprocher tous les devis (valeurs enregistrées) et pas seulement les devis importés")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("RAPPROCHEMENT DES DEVIS IMPORTÉS")
+        print("=" * 80)
+
+        debut = time.perf_counter()
+        synthese = reconcilier(conn, args.sortie, args.tolerance, args.tolerance_euro, args.tous)
+
+        print(f"\n{'Catégorie':<22} {'Devis':>8} {'Écart absolu':>18}")
+        for groupe, stats in synthese.items():
+            print(f"{groupe:<22} {stats['devis']:>8} {stats['ecart_absolu']:>18,.2f}")
+        if not synthese:
+            print("✅ Aucun écart au-delà de la tolérance")
+
+        print(f"\n✅ Rapports écrits: {args.sortie}.csv, {args.sortie}.html "
+              f"({time.perf_counter() - debut:.2f} s)")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
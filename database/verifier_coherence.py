@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contrôle de cohérence des prix enregistrés dans les lignes de devis : recalcule en SQL, avec le
+catalogue actuel (vues prix_attendus_*), les prix attendus de chaque ligne (visites, hébergements,
+carburant, locations journalières, transferts aéroport, guides) et signale les écarts.
+Avec --fix, les lignes des devis brouillon (tous statuts avec --tous-statuts) sont corrigées par lots et
+les devis brouillon mis en file de recalcul des totaux ; les devis finalisés gardent les totaux de leur
+instantané (devis_figes), leurs lignes corrigées sont seulement comptées.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'cotisation_madagascar'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', '2475'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+# Contrôles : (libellé, table des lignes, vue des prix attendus, colonnes contrôlées,
+#              entité signalée dans devis_a_recalculer, clé config_prix).
+# Les guides à prix négocié (prix_catalogue faux) sont absents de la vue : ni contrôlés ni corrigés.
+CONTROLES = [
+    ('Visites', 'visites_jour', 'prix_attendus_visites_jour',
+     ('prix_entree', 'prix_guidage', 'prix_taxe_communale', 'prix_total'), 'visites', None),
+    ('Hébergements', 'hebergements', 'prix_attendus_hebergements', ('prix_ariary',), 'hotels', None),
+    ('Carburant', 'locations_vehicules', 'prix_attendus_locations_vehicules',
+     ('consommation_carburant', 'prix_carburant_total'), 'types_voitures', None),
+    ('Locations journalières', 'locations_journalieres', 'prix_attendus_locations_journalieres',
+     ('prix_total',), 'types_locations_journalieres', None),
+    ('Transferts aéroport', 'transferts_aeroport', 'prix_attendus_transferts_aeroport',
+     ('prix_par_trajet', 'prix_total'), 'config_prix', 'transfert_aeroport_par_trajet'),
+    ('Guides accompagnateurs (tarif config_prix)', 'guides_accompagnateurs', 'prix_attendus_guides_accompagnateurs',
+     ('prix_par_jour', 'prix_total'), 'config_prix', 'guide_accompagnateur_par_jour'),
+]
+
+TAILLE_LOT = 10000
+
+def connect_db():
+    """Établit la connexion à la base de données"""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        return conn
+    except Exception as e:
+        print(f"Erreur de connexion à la base de données: {e}")
+        return None
+
+def ecart(colonne):
+    """Expression SQL de l'écart absolu entre la valeur enregistrée et la valeur attendue"""
+    return f"ABS(COALESCE(t.{colonne}, 0) - COALESCE(a.{colonne}, 0))"
+
+def condition_derive(colonnes):
+    """Vrai si au moins une colonne de la ligne s'écarte de la valeur attendue"""
+    return "(" + " OR ".join(f"{ecart(col)} > %(tolerance)s" for col in colonnes) + ")"
+
+def controler(cur, table, vue, colonnes, tolerance):
+    """Un seul passage sur la table : lignes contrôlées, lignes en écart et écart cumulé par colonne"""
+    agregats = ",\n".join(
+        f"COUNT(*) FILTER (WHERE {ecart(col)} > %(tolerance)s) AS ecarts_{col},\n"
+        f"COALESCE(SUM({ecart(col)}) FILTER (WHERE {ecart(col)} > %(tolerance)s), 0) AS cumul_{col}"
+        for col in colonnes)
+    cur.execute(f"""
+        SELECT COUNT(*) AS lignes,
+               COUNT(a.id) AS controlees,
+               COUNT(*) FILTER (WHERE a.id IS NOT NULL AND {condition_derive(colonnes)}) AS en_ecart,
+               {agregats}
+        FROM {table} t
+        LEFT JOIN {vue} a ON a.id = t.id
+    """, {'tolerance': tolerance})
+    return cur.fetchone()
+
+def exemples_ecarts(cur, table, vue, colonnes, tolerance, limite):
+    """Quelques lignes en écart (valeur enregistrée / valeur attendue)"""
+    valeurs = ", ".join(f"t.{col} AS {col}, a.{col} AS {col}_attendu" for col in colonnes)
+    cur.execute(f"""
+        SELECT t.id, a.devis_id, d.reference, d.statut, {valeurs}
+        FROM {table} t
+        JOIN {vue} a ON a.id = t.id
+        JOIN devis d ON d.id = a.devis_id
+        WHERE {condition_derive(colonnes)}
+        LIMIT %(limite)s
+    """, {'tolerance': tolerance, 'limite': limite})
+    return cur.fetchall()
+
+def corriger(conn, table, vue, colonnes, entite, cle, tolerance, taille_lot, tous_statuts=False):
+    """
+    Remplace les prix en écart par les prix attendus, par tranches d'id (une transaction par lot),
+    et met les devis brouillon corrigés en file de recalcul des totaux (devis_a_recalculer)
+    """
+    affectations = ", ".join(f"{col} = a.{col}" for col in colonnes)
+    entite_id = "a.entite_id" if cle is None else "NULL::INTEGER"
+    filtre_statut = "" if tous_statuts else "AND COALESCE(d.statut, 'brouillon') = 'brouillon'"
+    requete = f"""
+        WITH corriges AS (
+            UPDATE {table} t SET {affectations}
+            FROM {vue} a
+            JOIN devis d ON d.id = a.devis_id
+            WHERE a.id = t.id
+              AND t.id >= %(debut)s AND t.id < %(fin)s
+              {filtre_statut}
+              AND {condition_derive(colonnes)}
+            RETURNING a.devis_id, {entite_id} AS entite_id, COALESCE(d.statut, 'brouillon') = 'brouillon' AS brouillon
+        ),
+        file AS (
+            INSERT INTO devis_a_recalculer (devis_id, entite, entite_id, cle)
+            SELECT DISTINCT devis_id, %(entite)s, entite_id, %(cle)s FROM corriges WHERE brouillon
+            ON CONFLICT DO NOTHING
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM corriges) AS lignes, (SELECT COUNT(*) FROM file) AS signalements,
+               (SELECT COUNT(*) FROM corriges WHERE NOT brouillon) AS lignes_finalisees
+    """
+
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute(f"SELECT MIN(id) AS debut, MAX(id) AS fin FROM {table}")
+        bornes = cur.fetchone()
+        total = {'lignes': 0, 'signalements': 0, 'lignes_finalisees': 0}
+        if bornes['debut'] is None:
+            return total
+
+        for debut in range(bornes['debut'], bornes['fin'] + 1, taille_lot):
+            cur.execute(requete, {'debut': debut, 'fin': debut + taille_lot, 'tolerance': tolerance,
+                                  'entite': entite, 'cle': cle})
+            lot = cur.fetchone()
+            conn.commit()
+            total['lignes'] += lot['lignes']
+            total['signalements'] += lot['signalements']
+            total['lignes_finalisees'] += lot['lignes_finalisees']
+        return total
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Contrôle de cohérence des prix des lignes de devis avec le catalogue")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Écart toléré par colonne (montants enregistrés en ariary entiers)")
+    parser.add_argument('--exemples', type=int, default=5, help="Nombre de lignes en écart affichées par contrôle")
+    parser.add_argument('--fix', action='store_true', help="Corriger les lignes en écart (devis brouillon)")
+    parser.add_argument('--tous-statuts', action='store_true',
+                        help="Avec --fix, corriger aussi les devis envoyés, acceptés ou refusés")
+    parser.add_argument('--lot', type=int, default=TAILLE_LOT, help="Tranche d'id corrigée par transaction")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        sys.exit(1)
+
+    try:
+        print("=" * 80)
+        print("CONTRÔLE DE COHÉRENCE DES PRIX")
+        print("=" * 80)
+
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        total_ecarts = 0
+        for libelle, table, vue, colonnes, entite, cle in CONTROLES:
+            debut = time.perf_counter()
+            resultat = controler(cur, table, vue, colonnes, args.tolerance)
+            total_ecarts += resultat['en_ecart']
+
+            print(f"\n📌 {libelle} ({table}) : {resultat['controlees']} / {resultat['lignes']} ligne(s) contrôlée(s), "
+                  f"{resultat['en_ecart']} en écart ({time.perf_counter() - debut:.2f} s)")
+            if resultat['lignes'] > resultat['controlees']:
+                print(f"   ⚠️  {resultat['lignes'] - resultat['controlees']} ligne(s) sans référence au catalogue")
+            for col in colonnes:
+                if resultat[f'ecarts_{col}']:
+                    print(f"   • {col:<25} {resultat[f'ecarts_{col}']:>8} écart(s), "
+                          f"cumul {resultat[f'cumul_{col}']:,.2f}")
+
+            if resultat['en_ecart'] and args.exemples:
+                for ligne in exemples_ecarts(cur, table, vue, colonnes, args.tolerance, args.exemples):
+                    valeurs = ", ".join(f"{col} {ligne[col]} → {ligne[col + '_attendu']}" for col in colonnes
+                                        if abs(float(ligne[col] or 0) - float(ligne[col + '_attendu'] or 0)) > args.tolerance)
+                    print(f"     - #{ligne['id']} devis {ligne['reference']} ({ligne['statut']}) : {valeurs}")
+            conn.commit()
+
+            if args.fix and resultat['en_ecart']:
+                debut = time.perf_counter()
+                corrige = corriger(conn, table, vue, colonnes, entite, cle, args.tolerance,
+                                   args.lot, args.tous_statuts)
+                print(f"   ✅ {corrige['lignes']} ligne(s) corrigée(s), {corrige['signalements']} devis mis en file "
+                      f"de recalcul ({time.perf_counter() - debut:.2f} s)")
+                if corrige['lignes_finalisees']:
+                    print(f"   ⚠️  dont {corrige['lignes_finalisees']} ligne(s) de devis finalisés : "
+                          f"non mis en file, totaux figés inchangés")
+        cur.close()
+
+        print("\n" + "=" * 80)
+        if not total_ecarts:
+            print("✅ Aucun écart au-delà de la tolérance")
+        elif args.fix:
+            print("Totaux des devis corrigés : POST /api/catalogue/recalculer")
+        else:
+            print(f"{total_ecarts} ligne(s) en écart ; relancer avec --fix pour corriger les devis brouillon")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Interrogation de la base produite par analyser_excel_detaille.py
+(<classeur>_analyse_detaille.sqlite) sans recharger le classeur ni l'analyse complète
+
+Exemples :
+    python interroger_analyse.py valeur "Hôtel" --contient
+    python interroger_analyse.py colonne AH --feuille "Devis 1"
+    python interroger_analyse.py cellule I3
+    python interroger_analyse.py feuilles
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+BASE_DEFAUT = "Bases de datos internos_analyse_detaille.sqlite"
+
+def connecter(chemin):
+    """Ouvre la base d'analyse en lecture seule"""
+    if not Path(chemin).exists():
+        print(f"ERREUR: La base '{chemin}' n'existe pas (lancer analyser_excel_detaille.py)")
+        sys.exit(1)
+    return sqlite3.connect(f"file:{chemin}?mode=ro", uri=True)
+
+def filtre_feuille(feuille):
+    """Clause et paramètres optionnels de filtre sur la feuille"""
+    return (" AND feuille = ?", [feuille]) if feuille else ("", [])
+
+def chercher_valeur(conn, valeur, contient=False, feuille=None):
+    """Cellules contenant une valeur (égalité exacte, numérique ou texte, ou sous-chaîne)"""
+    clause, params = filtre_feuille(feuille)
+    if contient:
+        condition, valeurs = "COALESCE(valeur_texte, valeur_num) LIKE ? ESCAPE '\\'", [
+            "%" + valeur.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"]
+    else:
+        try:
+            condition, valeurs = "(valeur_texte = ? OR valeur_num = ?)", [valeur, float(valeur)]
+        except ValueError:
+            condition, valeurs = "valeur_texte = ?", [valeur]
+    return conn.execute(
+        f"SELECT feuille, colonne, ligne, type, COALESCE(valeur_texte, valeur_num) FROM cellules WHERE {condition}{clause} "
+        "ORDER BY feuille, ligne, colonne", valeurs + params)
+
+def cellules_colonne(conn, colonne, feuille=None):
+    """Cellules non vides d'une colonne"""
+    clause, params = filtre_feuille(feuille)
+    return conn.execute(
+        f"SELECT feuille, colonne, ligne, type, COALESCE(valeur_texte, valeur_num) FROM cellules WHERE colonne = ?{clause} "
+        "ORDER BY feuille, ligne", [colonne.upper()] + params)
+
+def lire_cellule(conn, reference, feuille=None):
+    """Valeur d'une cellule (ex. I3) dans une ou toutes les feuilles"""
+    colonne = reference.rstrip('0123456789').upper()
+    ligne = reference[len(colonne):]
+    if not colonne or not ligne.isdigit():
+        print(f"ERREUR: Référence de cellule invalide: {reference}")
+        sys.exit(1)
+    clause, params = filtre_feuille(feuille)
+    return conn.execute(
+        f"SELECT feuille, colonne, ligne, type, COALESCE(valeur_texte, valeur_num) FROM cellules WHERE colonne = ? AND ligne = ?{clause} "
+        "ORDER BY feuille", [colonne, int(ligne)] + params)
+
+def afficher_cellules(lignes, limite):
+    """Affiche les cellules trouvées (feuille, référence, type, valeur)"""
+    total = 0
+    for feuille, colonne, ligne, type_valeur, valeur in lignes:
+        total += 1
+        if limite and total > limite:
+            continue
+        print(f"{feuille:<25} {colonne + str(ligne):<8} {type_valeur:<10} {valeur}")
+    if limite and total > limite:
+        print(f"... {total - limite} autre(s) cellule(s) non affichée(s)")
+    print(f"\n{total} cellule(s)")
+
+def afficher_feuilles(conn):
+    """Résumé des feuilles analysées"""
+    for feuille, non_vides, pourcentage, colonnes in conn.execute(
+            "SELECT f.feuille, f.cellules_non_vides, f.pourcentage_rempli, "
+            "(SELECT COUNT(*) FROM colonnes c WHERE c.feuille = f.feuille) FROM feuilles f ORDER BY f.feuille"):
+        print(f"{feuille:<25} {non_vides:>6} cellules non vides ({pourcentage:.1f}%), {colonnes} colonne(s) avec données")
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Interrogation de l'analyse détaillée d'un classeur")
+    parser.add_argument('-b', '--base', default=BASE_DEFAUT, help="Base SQLite produite par analyser_excel_detaille.py")
+    parser.add_argument('-f', '--feuille', help="Limiter la recherche à une feuille")
+    parser.add_argument('-n', '--limite', type=int, default=200, help="Nombre maximum de cellules affichées (0 = toutes)")
+    commandes = parser.add_subparsers(dest='commande', required=True)
+
+    p_valeur = commandes.add_parser('valeur', help="Où se trouve une valeur")
+    p_valeur.add_argument('valeur')
+    p_valeur.add_argument('--contient', action='store_true', help="Recherche de sous-chaîne plutôt qu'égalité")
+
+    p_colonne = commandes.add_parser('colonne', help="Cellules non vides d'une colonne (ex. AH)")
+    p_colonne.add_argument('colonne')
+
+    p_cellule = commandes.add_parser('cellule', help="Valeur d'une cellule (ex. I3) dans chaque feuille")
+    p_cellule.add_argument('reference')
+
+    commandes.add_parser('feuilles', help="Résumé des feuilles analysées")
+
+    args = parser.parse_args()
+    conn = connecter(args.base)
+    try:
+        if args.commande == 'valeur':
+            afficher_cellules(chercher_valeur(conn, args.valeur, args.contient, args.feuille), args.limite)
+        elif args.commande == 'colonne':
+            afficher_cellules(cellules_colonne(conn, args.colonne, args.feuille), args.limite)
+        elif args.commande == 'cellule':
+            afficher_cellules(lire_cellule(conn, args.reference, args.feuille), args.limite)
+        else:
+            afficher_feuilles(conn)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Montants en unités entières : ariary (sans subdivision en usage) et centimes d'euro.
+Les sommes et la marge sont calculées en entiers ; la conversion en euros (Decimal ou float)
+n'a lieu qu'une fois, à l'écriture des colonnes DECIMAL(10, 2) ou à l'affichage.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+UN = Decimal(1)
+CENTIEME = Decimal('0.01')
+
+def ariary(valeur):
+    """Montant en ariary entiers (int, Decimal, float, chaîne ; None ou '' -> 0), arrondi au plus proche"""
+    if valeur is None or valeur == '':
+        return 0
+    if isinstance(valeur, int):
+        return valeur
+    return int(Decimal(str(valeur)).quantize(UN, rounding=ROUND_HALF_UP))
+
+def decimal(valeur):
+    """Valeur exacte d'un prix ou d'une quantité (int, Decimal, float, chaîne ; None ou '' -> 0)"""
+    if valeur is None or valeur == '':
+        return Decimal(0)
+    return valeur if isinstance(valeur, Decimal) else Decimal(str(valeur))
+
+def montant(prix_unitaire, *quantites):
+    """Prix unitaire × quantités en ariary entiers (produit exact en Decimal, arrondi une seule fois)"""
+    produit = decimal(prix_unitaire)
+    for quantite in quantites:
+        produit *= decimal(quantite)
+    return ariary(produit)
+
+def somme_ariary(valeurs):
+    """Somme entière d'une suite de montants (valeurs None ignorées)"""
+    return sum(ariary(v) for v in valeurs)
+
+def appliquer_marge(somme, marge_percent):
+    """Total avec marge (pourcentage, ex: 18 ou Decimal('18.00')) en ariary entiers"""
+    marge = Decimal(str(marge_percent or 0))
+    if marge <= 0:
+        return somme
+    return ariary(Decimal(somme) * (100 + marge) / 100)
+
+def centimes_euro(montant_ariary, taux_change):
+    """Conversion d'un montant en ariary en centimes d'euro entiers (taux : ariary pour 1 euro)"""
+    taux = Decimal(str(taux_change or 0))
+    if taux <= 0:
+        return 0
+    return ariary(Decimal(montant_ariary) * 100 / taux)
+
+def en_centimes(montant_euro):
+    """Valeur d'une colonne DECIMAL(10, 2) en euros -> centimes entiers"""
+    return ariary(Decimal(str(montant_euro or 0)) * 100)
+
+def euros(centimes):
+    """Centimes -> Decimal à deux décimales (colonnes DECIMAL(10, 2))"""
+    return (Decimal(centimes) / 100).quantize(CENTIEME)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Versions des devis stockées en deltas (table versions_devis, migration v18).
+L'état d'un devis est un dictionnaire {clé de ligne: {colonne: valeur}} dont les clés ne dépendent pas des
+identifiants techniques (recréés à chaque modification par nouveau_devis) mais de l'identité métier de la
+ligne : 'devis', 'jours_voyage/3', 'hebergements/3/12|Double/0' (table, jour, hôtel et type de chambre, rang
+parmi les lignes identiques), 'transferts_aeroport/Aller-Retour/0'. Supprimer une ligne ne touche donc pas
+la clé des autres.
+Une version est soit complète (point de reprise), soit un delta par rapport à la précédente.
+"""
+
+# Un point de reprise complet toutes les N versions : au plus N - 1 deltas à rejouer
+INTERVALLE_POINTS_REPRISE = 10
+
+def difference(ancien, nouveau):
+    """Delta de `ancien` vers `nouveau` : lignes ajoutées, colonnes modifiées, colonnes retirées, clés supprimées"""
+    ajoute, modifie, retire = {}, {}, {}
+    for cle, ligne in nouveau.items():
+        precedente = ancien.get(cle)
+        if precedente is None:
+            ajoute[cle] = ligne
+            continue
+        colonnes = {col: val for col, val in ligne.items() if col not in precedente or precedente[col] != val}
+        if colonnes:
+            modifie[cle] = colonnes
+        # Colonne disparue de la ligne (colonne supprimée du schéma) : retirée, pas mise à None
+        absentes = sorted(col for col in precedente if col not in ligne)
+        if absentes:
+            retire[cle] = absentes
+    supprime = sorted(cle for cle in ancien if cle not in nouveau)
+    return {'ajoute': ajoute, 'modifie': modifie, 'retire': retire, 'supprime': supprime}
+
+def est_vide(delta):
+    """Vrai si le delta ne change rien"""
+    return not (delta['ajoute'] or delta['modifie'] or delta['retire'] or delta['supprime'])
+
+def taille(delta):
+    """Nombre de lignes touchées par un delta"""
+    return len(delta['ajoute']) + len(set(delta['modifie']) | set(delta['retire'])) + len(delta['supprime'])
+
+def appliquer(etat, delta):
+    """Nouvel état obtenu en appliquant un delta (l'état d'origine n'est pas modifié)"""
+    supprime = set(delta['supprime'])
+    resultat = {cle: ligne for cle, ligne in etat.items() if cle not in supprime}
+    for cle, colonnes in delta['modifie'].items():
+        resultat[cle] = {**resultat.get(cle, {}), **colonnes}
+    for cle, colonnes in delta['retire'].items():
+        resultat[cle] = {col: val for col, val in resultat.get(cle, {}).items() if col not in colonnes}
+    resultat.update(delta['ajoute'])
+    return resultat
+
+def reconstruire(versions):
+    """État final d'une suite [(complet, contenu)] triée, commençant par un point de reprise complet"""
+    etat = None
+    for complet, contenu in versions:
+        etat = dict(contenu) if complet or etat is None else appliquer(etat, contenu)
+    return etat
+
+def est_point_de_reprise(version):
+    """Vrai si la version doit être stockée complète"""
+    return version == 1 or version % INTERVALLE_POINTS_REPRISE == 1